@@ -6,68 +6,424 @@ import plotly.graph_objects as go
 import time
 import random
 import string
+import re
 import json
+import io
+import shutil
+import os
+import hashlib
+import sqlite3
+import uuid
+import threading
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from scipy import sparse
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, r2_score
+import joblib
 import warnings
-import base64
 from fpdf import FPDF
 import gspread
+from requests.adapters import HTTPAdapter
 from oauth2client.service_account import ServiceAccountCredentials
 import google.generativeai as genai
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+TX_COLUMNS = ['Date', 'ItemID', 'ItemName', 'Category', 'Price', 'Qty', 'Total', 'Hour', 'CustomerType', 'Payment', 'CustomerID', 'BasePrice']
+TX_RENAME_MAP = {'date':'Date', 'item_id':'ItemID', 'item_name':'ItemName', 'category':'Category', 'price':'Price', 'qty':'Qty', 'total':'Total', 'hour':'Hour', 'customer_type':'CustomerType', 'payment_method':'Payment', 'customer_id':'CustomerID', 'base_price':'BasePrice'}
+TX_SHEET_HEADERS = list(TX_RENAME_MAP.keys())
+TX_EXPORT_ID_COL = len(TX_SHEET_HEADERS) + 1 # Kolom ekstra (M) di sheet mirror: id baris SQLite asalnya
+TX_CACHE_TTL = 30 # detik, setelah ini cache ngecek baris baru ke sheet
+
+# Skema kanonik ledger: dtype eksplisit, dipasang sekali waktu load (bukan dikonversi ulang tiap render)
+TX_SCHEMA = {'Date': 'datetime64[ns]', 'ItemID': 'category', 'ItemName': 'category', 'Category': 'category',
+             'Price': 'int64', 'Qty': 'int32', 'Total': 'int64', 'Hour': 'int32',
+             'CustomerType': 'category', 'Payment': 'category', 'CustomerID': 'str',
+             'BasePrice': 'int64'} # BasePrice = harga menu saat itu (Price bisa harga surge); 0 = baris lama, belum dicatat
+TX_REQUIRED = ['Date', 'Total']
+
+def parse_datetimes(series):
+    """ISO timestamps (with or without microseconds) in one pass; other formats only for the leftovers"""
+    if pd.api.types.is_datetime64_any_dtype(series): return series.astype('datetime64[ns]')
+    values = pd.to_datetime(series, format='ISO8601', errors='coerce')
+    bad = values.isna() & series.notna()
+    if bad.any(): values[bad] = pd.to_datetime(series[bad], format='mixed', errors='coerce')
+    return values.astype('datetime64[ns]')
+
+def parse_amounts(series, dtype):
+    """Numbers to a numeric dtype; text like '22,000' / 'Rp 28.000' is digit-stripped, other bad cells -> 0"""
+    if pd.api.types.is_numeric_dtype(series): return series.fillna(0).astype(dtype)
+    values = pd.to_numeric(series, errors='coerce')
+    # Regex cuma buat sel yang gagal di-parse, bukan semua sel
+    bad = values.isna() & series.notna()
+    if bad.any(): values[bad] = pd.to_numeric(series[bad].astype(str).str.replace(r'[^\d]', '', regex=True), errors='coerce')
+    return values.fillna(0).astype(dtype)
+
+def apply_schema(df, schema, required=()):
+    """Validated converter: checks required columns, adds missing ones and casts everything to `schema`"""
+    missing = [col for col in required if col not in df.columns]
+    if missing: raise ValueError(f"Kolom wajib tidak ada: {missing}")
+    out = {}
+    for col, dtype in schema.items():
+        series = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if dtype.startswith('datetime'): out[col] = parse_datetimes(series)
+        elif dtype.startswith(('int', 'float')): out[col] = parse_amounts(series, dtype)
+        elif dtype == 'category': out[col] = series.fillna('').astype(str).astype('category')
+        else: out[col] = series.fillna('').astype(dtype)
+    return pd.DataFrame(out, index=df.index)
+
+def concat_typed(frames):
+    """pd.concat that keeps categorical columns categorical (plain concat falls back to object)"""
+    frames = [f for f in frames if not f.empty]
+    if len(frames) < 2: return frames[0] if frames else None
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([f[col] for f in frames]).categories
+            frames = [f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+def normalize_transactions(df):
+    """Renames sheet columns and applies TX_SCHEMA to a raw transaction frame"""
+    return apply_schema(df.rename(columns=TX_RENAME_MAP), TX_SCHEMA, TX_REQUIRED)
+
+def empty_transactions():
+    return apply_schema(pd.DataFrame(columns=TX_COLUMNS), TX_SCHEMA)
+
+# --- CACHE TRANSAKSI (DIPAKAI BARENG SEMUA SESSION) ---
+class TransactionCache:
+    """In-memory ledger shared by every session, refreshed by fetching only the new tail rows"""
+    def __init__(self, ttl=TX_CACHE_TTL):
+        self.ttl = ttl
+        self.df = empty_transactions()
+        self.buffer = {col: [] for col in TX_COLUMNS} # Baris baru per kolom, belum digabung ke df
+        self.cursor = 0 # Jumlah baris data yang sudah dibaca (di luar header)
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        return time.time() - self.loaded_at > self.ttl
+
+    def get(self, fetch_tail, force=False):
+        """Returns the cached frame, pulling new rows via `fetch_tail(cursor)` when stale.
+
+        The frame is shared across sessions, so callers must not mutate it in place.
+        """
+        with self.lock:
+            self._compact() # Baris buffer posisinya sebelum ekor yang mau di-fetch
+            if force or self.is_stale():
+                new_df, self.cursor = fetch_tail(self.cursor)
+                self._extend(new_df)
+                self.loaded_at = time.time()
+            return self.df
+
+    def append(self, rows, start):
+        """Buffers rows this process just wrote (sheet column order), O(1) per row.
+
+        `start` is the cursor the backend reports the rows were written at. If another
+        writer got in first (or the backend can't tell), the cache just re-fetches instead.
+        """
+        with self.lock:
+            if start is None or start != self.cursor:
+                self.loaded_at = 0.0
+                return False
+            for row in rows:
+                row = list(row) + [''] * (len(TX_COLUMNS) - len(row)) # Baris journal lama bisa kurang kolom
+                for col, value in zip(TX_COLUMNS, row):
+                    self.buffer[col].append(value)
+            self.cursor += len(rows)
+            return True
+
+    def _compact(self):
+        # Buffer kolom -> satu DataFrame -> satu concat (bukan concat per item)
+        if not self.buffer['Date']: return
+        new_df = normalize_transactions(pd.DataFrame(self.buffer, columns=TX_COLUMNS))
+        self.buffer = {col: [] for col in TX_COLUMNS}
+        self._extend(new_df)
+
+    def _extend(self, new_df):
+        if not new_df.empty:
+            self.df = concat_typed([self.df, new_df])
+
+    def invalidate(self, full=False):
+        """Forces the next `get` to hit the source; `full=True` also drops the cached rows"""
+        with self.lock:
+            self.loaded_at = 0.0
+            if full:
+                self.df = empty_transactions()
+                self.buffer = {col: [] for col in TX_COLUMNS}
+                self.cursor = 0
+
+@st.cache_resource
+def get_transaction_cache(backend_name):
+    return TransactionCache()
+
+def ledger_row_keys(frame):
+    """Identity of each ledger row (the ledger has no tx id): timestamp, item, qty, total and customer"""
+    key = frame['Date'].astype('int64').astype(str)
+    for col in ['ItemID', 'Qty', 'Total', 'CustomerID']:
+        if col in frame.columns: key = key + '|' + frame[col].astype(str)
+    return key
+
+class LedgerCursor:
+    """Where a consumer stopped reading the ledger: a row position plus the key of the last row read.
+
+    A row count alone can't tell a ledger that grew from one that was replaced (import, cache reload,
+    backend swap); the last row read can.
+    """
+    def __init__(self, position=0, last_key=None):
+        self.position = position
+        self.last_key = last_key
+
+    def tail(self, ledger, relocate=False):
+        """Rows after the cursor, or None when the ledger no longer holds the rows already read.
+
+        `relocate=True` looks the last row up by key when it moved instead of giving up.
+        """
+        if self.position == 0: return ledger
+        if len(ledger) >= self.position and ledger_row_keys(ledger.iloc[[self.position - 1]]).iloc[0] == self.last_key:
+            return ledger.iloc[self.position:]
+        if relocate and self.last_key is not None:
+            hits = np.flatnonzero(ledger_row_keys(ledger).to_numpy() == self.last_key)
+            if len(hits):
+                # Kunci dobel (jarang) -> ambil yang paling dekat posisi lama
+                self.position = int(hits[np.abs(hits - (self.position - 1)).argmin()]) + 1
+                return ledger.iloc[self.position:]
+        return None
+
+    def advance(self, ledger):
+        self.position = len(ledger)
+        self.last_key = ledger_row_keys(ledger.iloc[[-1]]).iloc[0] if len(ledger) else None
+
+def tx_to_row(tx_data):
+    """Flattens a transaction dict into the sheet's column order (JSON-safe)"""
+    return [str(tx_data['Date']), str(tx_data['ItemID']), str(tx_data['ItemName']), str(tx_data['Category']),
+            int(tx_data['Price']), int(tx_data['Qty']), int(tx_data['Total']), int(tx_data['Hour']),
+            str(tx_data['CustomerType']), str(tx_data['Payment']), str(tx_data.get('CustomerID') or ''),
+            int(tx_data.get('BasePrice', tx_data['Price']))]
+
+# --- WRITE-AHEAD BUFFER (ORDER DISIMPAN LOKAL DULU SEBELUM DIKIRIM) ---
+PENDING_WRITES_FILE = 'pending_writes.jsonl'
+
+class WriteAheadBuffer:
+    """Append-only local journal of orders that the remote store has not confirmed yet"""
+    def __init__(self, path=PENDING_WRITES_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending(self):
+        if not os.path.exists(self.path): return []
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def replace(self, entries):
+        # Tulis ke file sementara lalu rename, biar journal gak pernah setengah jadi
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for e in entries: f.write(json.dumps(e) + "\n")
+        os.replace(tmp, self.path)
+
+@st.cache_resource
+def get_write_buffer():
+    return WriteAheadBuffer()
+
+MENU_COLUMNS = ['ID', 'Menu', 'Harga', 'Kategori', 'Icon', 'Stok']
+# Kategori menu sengaja teks biasa: data editor inventory harus bisa nambah kategori baru
+MENU_SCHEMA = {'ID': 'str', 'Menu': 'str', 'Harga': 'int64', 'Kategori': 'str', 'Icon': 'str', 'Stok': 'int32'}
+MENU_SHEET_HEADERS = ['id', 'menu_name', 'price', 'category', 'icon', 'stock']
+# Resep (bill of materials): 1 porsi menu -> qty bahan, dalam satuan dasar bahannya (g / ml / pcs)
+RECIPE_COLUMNS = ['MenuID', 'Ingredient', 'Qty']
+RECIPE_SCHEMA = {'MenuID': 'str', 'Ingredient': 'str', 'Qty': 'float64'}
+RECIPE_SHEET_HEADERS = ['menu_id', 'ingredient', 'qty']
+INGREDIENT_COLUMNS = ['Ingredient', 'Unit', 'OnHand', 'ReorderPoint']
+INGREDIENT_SCHEMA = {'Ingredient': 'str', 'Unit': 'str', 'OnHand': 'float64', 'ReorderPoint': 'float64'}
+INGREDIENT_SHEET_HEADERS = ['ingredient', 'unit', 'on_hand', 'reorder_point']
+SQLITE_DB_FILE = 'titan.db'
+TABLE_COUNT = 12
+KITCHEN_SHEET_HEADERS = ['id', 'table_no', 'items', 'time', 'status', 'created_at', 'started_at', 'completed_at', 'stations']
+TABLE_SHEET_HEADERS = ['id', 'status', 'occupied_at', 'orders']
+TABLE_SESSION_SHEET_HEADERS = ['table_id', 'occupied_at', 'cleared_at', 'orders']
+
+def load_gcp_credentials():
+    """Returns the service-account dict from secrets with a cleaned-up private key"""
+    # Kita copy dulu biar gak merusak data asli
+    creds_dict = dict(st.secrets["gcp_service_account"]).copy()
+    
+    # --- SUPER CLEANER: MEMBERSIHKAN PRIVATE KEY ---
+    raw_key = creds_dict["private_key"]
+    
+    # Kasus A: Jika key punya tulisan literal "\n" (biasa terjadi saat copy-paste JSON)
+    if "\\n" in raw_key:
+        raw_key = raw_key.replace("\\n", "\n")
+    
+    # Kasus B: Jika key diawali dan diakhiri tanda kutip ganda yg tidak sengaja ikut
+    if raw_key.startswith('"') and raw_key.endswith('"'):
+        raw_key = raw_key[1:-1]
 
-class DatabaseManager:
-    def __init__(self):
-        try:
-            # 1. Setup Scope
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            
-            # 2. Ambil Credentials dari Secrets
-            # Kita copy dulu biar gak merusak data asli
-            creds_dict = dict(st.secrets["gcp_service_account"]).copy()
-            
-            # --- SUPER CLEANER: MEMBERSIHKAN PRIVATE KEY ---
-            raw_key = creds_dict["private_key"]
-            
-            # Kasus A: Jika key punya tulisan literal "\n" (biasa terjadi saat copy-paste JSON)
-            if "\\n" in raw_key:
-                raw_key = raw_key.replace("\\n", "\n")
-            
-            # Kasus B: Jika key diawali dan diakhiri tanda kutip ganda yg tidak sengaja ikut
-            if raw_key.startswith('"') and raw_key.endswith('"'):
-                raw_key = raw_key[1:-1]
+    # Masukkan kunci yang sudah bersih
+    creds_dict["private_key"] = raw_key
+    return creds_dict
 
-            # Masukkan kunci yang sudah bersih
-            creds_dict["private_key"] = raw_key
-            # -----------------------------------------------
+# ==========================================
+# RESOURCE REGISTRY (KONEKSI DIPAKAI BARENG SEMUA SESSION)
+# ==========================================
+SHEETS_MAX_AGE = 45 * 60 # detik; token service account umurnya 1 jam -> login ulang sebelum basi
+SHEETS_POOL_SIZE = 16 # koneksi HTTP keep-alive ke Google API (banyak tablet kasir sekaligus)
+GEMINI_MAX_AGE = 6 * 3600 # deteksi ulang model Gemini yang aktif
+HEALTH_CHECK_SECONDS = 60 # probe koneksi bersama paling sering sekali per menit
 
-            # 3. Login
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            self.client = gspread.authorize(creds)
-            
-            # 4. Buka Spreadsheet
-            self.sheet = self.client.open("Farikhi Titan DB")
-            self.ws_menu = self.sheet.worksheet("menu")
-            self.ws_tx = self.sheet.worksheet("transactions")
+class ResourceRegistry:
+    """Process-wide handles (API clients, backends) built once and shared by every session.
 
-        except Exception as e:
-            st.error(f"⚠️ Gagal Konek Google Sheets: {e}")
-            st.info("Coba cek format 'private_key' di Secrets. Pastikan tidak ada spasi aneh di awal/akhir.")
-            st.stop()
+    A handle is rebuilt when it is older than `max_age`, fails its `check` (probed at most
+    every `check_every` seconds), or was `invalidate`-d by a caller that just saw it error out.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.reconnects = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+
+    def _key_lock(self, name):
+        with self.lock:
+            return self.key_locks.setdefault(name, threading.Lock())
+
+    def _usable(self, entry, max_age, check, check_every):
+        if max_age is not None and time.time() - entry['created_at'] > max_age: return False
+        if check is None or time.time() - entry['checked_at'] < check_every: return True
+        try: ok = bool(check(entry['resource']))
+        except Exception: ok = False
+        entry['checked_at'] = time.time()
+        return ok
+
+    def get(self, name, factory, max_age=None, check=None, check_every=HEALTH_CHECK_SECONDS):
+        # Lock per resource: login Sheets yang lambat gak ngeblok lookup resource lain,
+        # tapi 10 session yang nunggu resource yang sama tetap cukup 1 login
+        with self._key_lock(name):
+            with self.lock: entry = self.entries.get(name)
+            if entry is not None and self._usable(entry, max_age, check, check_every):
+                return entry['resource']
+            resource = factory()
+            with self.lock:
+                if entry is not None: self.reconnects[name] = self.reconnects.get(name, 0) + 1
+                self.entries[name] = {'resource': resource, 'created_at': time.time(), 'checked_at': time.time()}
+            return resource
+
+    def invalidate(self, name):
+        """Drops a handle so the next `get` reconnects (call after an API/auth error)"""
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self.reconnects[name] = self.reconnects.get(name, 0) + 1
+
+    def status(self):
+        with self.lock:
+            now = time.time()
+            return [{'Resource': name, 'Age (s)': int(now - e['created_at']), 'Reconnects': self.reconnects.get(name, 0)}
+                    for name, e in self.entries.items()]
+
+@st.cache_resource
+def get_resource_registry():
+    return ResourceRegistry()
+
+def pool_http_session(client, size=SHEETS_POOL_SIZE):
+    """Widens the keep-alive pool of a gspread client's HTTP session (gspread v5 & v6)"""
+    session = getattr(getattr(client, 'http_client', client), 'session', None)
+    if session is not None and hasattr(session, 'mount'):
+        session.mount('https://', HTTPAdapter(pool_connections=size, pool_maxsize=size))
+
+# ==========================================
+# STORAGE BACKENDS (GOOGLE SHEETS / SQLITE)
+# ==========================================
+class StorageBackend(ABC):
+    """Interface shared by every storage engine behind DatabaseManager (incomplete backends fail at construction)"""
+    @abstractmethod
+    def load_menu(self): ...
+    @abstractmethod
+    def save_menu(self, df): ...
+    @abstractmethod
+    def fetch_tx_tail(self, cursor): ...
+    @abstractmethod
+    def append_transactions(self, rows):
+        """Appends rows, returns the tail cursor they start at (None if unknown)"""
+    @abstractmethod
+    def update_stocks(self, stock): ...
+    def get_kitchen_queue(self): return []
+    def get_kitchen_history(self, limit): return []
+    def add_kitchen_order(self, order): pass
+    def update_kitchen_status(self, oid, stat, at=None): pass
+    def get_tables(self): return [{'id': i, 'status': 'Empty', 'occupied_at': None, 'orders': []} for i in range(1, TABLE_COUNT + 1)]
+    def get_table_sessions(self, limit): return []
+    def update_table_status(self, tid, stat, occupied_at=None, orders=None): pass
+    def add_table_session(self, session): pass
+    def load_recipes(self): return pd.DataFrame(columns=RECIPE_COLUMNS)
+    def save_recipes(self, df): pass
+    def load_ingredients(self): return pd.DataFrame(columns=INGREDIENT_COLUMNS)
+    def save_ingredients(self, df): pass
+    def update_ingredients(self, levels): pass
+    def get_connection(self): return None
+
+# --- INDEX ID MENU -> NOMOR BARIS SHEET (DIPAKAI BARENG SEMUA SESSION) ---
+class MenuRowIndex:
+    """Maps item id to its sheet row so stock writes never need a `find()` scan"""
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def rebuild(self, item_ids, first_row=2):
+        with self.lock:
+            self.rows = {str(item_id): first_row + i for i, item_id in enumerate(item_ids)}
+
+    def lookup(self, item_ids):
+        with self.lock:
+            return {k: self.rows[k] for k in item_ids if k in self.rows}
+
+@st.cache_resource
+def get_menu_row_index():
+    return MenuRowIndex()
+
+class GoogleSheetsBackend(StorageBackend):
+    def __init__(self, creds_dict):
+        # 1. Setup Scope
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+        # 2. Login
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        self.client = gspread.authorize(creds)
+        pool_http_session(self.client)
+        
+        # 3. Buka Spreadsheet
+        self.sheet = self.client.open("Farikhi Titan DB")
+        self.ws_menu = self.sheet.worksheet("menu")
+        self.ws_tx = self.sheet.worksheet("transactions")
+        self.aux_ws = {}
+        self.ingredient_rows = {} # nama bahan -> nomor baris di sheet 'ingredients'
+        self.kitchen_rows = {} # id order -> nomor baris di sheet 'kitchen'
+        self.table_rows = {} # id meja -> nomor baris di sheet 'tables'
+
+    def ping(self):
+        # Request paling ringan: cuma minta ID spreadsheet (gagal kalau token / koneksi mati)
+        return self.sheet.fetch_sheet_metadata(params={'fields': 'spreadsheetId'})
 
     # --- FUNGSI BACA MENU (ANTI ERROR) ---
     def load_menu(self):
         try:
             all_rows = self.ws_menu.get_all_values()
             if not all_rows or len(all_rows) < 2:
-                return pd.DataFrame(columns=['ID', 'Menu', 'Harga', 'Kategori', 'Icon', 'Stok'])
+                return pd.DataFrame(columns=MENU_COLUMNS)
             
             headers = [h.strip().lower() for h in all_rows[0]] 
             data = all_rows[1:]
+            get_menu_row_index().rebuild([r[0] if r else '' for r in data]) # Baris data mulai dari row 2
             df = pd.DataFrame(data, columns=headers)
             df = df.loc[:, df.columns != ''] # Hapus kolom kosong
 
@@ -76,49 +432,1040 @@ class DatabaseManager:
 
             if 'Kategori' not in df.columns: df['Kategori'] = 'Uncategorized'
             if 'Menu' not in df.columns: df['Menu'] = 'Unknown Item'
-
-            for col in ['Harga', 'Stok']:
-                if col in df.columns:
-                    df[col] = df[col].astype(str).str.replace(r'[^\d]', '', regex=True)
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            return df
-        except: return pd.DataFrame(columns=['ID', 'Menu', 'Harga', 'Kategori', 'Icon', 'Stok'])
-
-    # --- FUNGSI BACA TRANSAKSI ---
-    def load_transactions(self):
+            return df # Harga/Stok diparse di apply_schema (DatabaseManager.load_menu)
+        except: return pd.DataFrame(columns=MENU_COLUMNS)
+
+    def save_menu(self, df):
+        rows = [[str(r['ID']), str(r['Menu']), int(r['Harga']), str(r['Kategori']), str(r['Icon']), int(r['Stok'])]
+                for _, r in df[MENU_COLUMNS].fillna(0).iterrows()]
+        self.ws_menu.clear()
+        self.ws_menu.update(range_name='A1', values=[MENU_SHEET_HEADERS] + rows)
+        get_menu_row_index().rebuild([r[0] for r in rows])
+
+    def fetch_tx_tail(self, cursor):
+        # Header + baris baru diambil dalam satu request (baris data mulai dari row 2)
+        header_rows, rows = self.ws_tx.batch_get(['A1:Z1', f'A{cursor + 2}:Z'])
+        if not header_rows or not rows: return empty_transactions(), cursor
+
+        headers = header_rows[0]
+        if len(headers) < len(TX_SHEET_HEADERS) and headers == TX_SHEET_HEADERS[:len(headers)]:
+            # Sheet lama belum punya kolom baru (mis. customer_id) -> lengkapi header sekali saja
+            headers = TX_SHEET_HEADERS
+            self.ws_tx.update(range_name='A1', values=[headers])
+        rows = [r + [''] * (len(headers) - len(r)) for r in rows] # Sheets motong sel kosong di ujung
         try:
-            data = self.ws_tx.get_all_records()
-            wajib = ['Date', 'ItemID', 'ItemName', 'Category', 'Price', 'Qty', 'Total', 'Hour', 'CustomerType', 'Payment']
-            if not data: return pd.DataFrame(columns=wajib)
+            df = normalize_transactions(pd.DataFrame([r[:len(headers)] for r in rows], columns=headers))
+        except ValueError: # Sheet tanpa kolom date/total -> bukan ledger
+            return empty_transactions(), cursor
+        return df, cursor + len(rows)
+
+    def append_transactions(self, rows):
+        row = self._appended_row(self.ws_tx.append_rows(rows))
+        return row - 2 if row else None # Baris data ke-0 ada di row 2 (row 1 = header)
+
+    def append_exported(self, rows):
+        """append_transactions for SheetExporter rows, which carry their SQLite id in one extra column"""
+        if self.ws_tx.col_count < TX_EXPORT_ID_COL: self.ws_tx.add_cols(TX_EXPORT_ID_COL - self.ws_tx.col_count)
+        return self.append_transactions(rows)
+
+    def exported_ids(self):
+        """SQLite row ids already mirrored to this sheet (column TX_EXPORT_ID_COL, written by SheetExporter)"""
+        return {int(v) for v in self.ws_tx.col_values(TX_EXPORT_ID_COL)[1:] if v.strip().isdigit()}
+
+    @staticmethod
+    def _appended_row(result):
+        """Sheet row of the first appended row, from the append response (None if unknown)"""
+        # updatedRange mis. "'transactions'!A102:K104" -> row 102
+        match = re.search(r'![A-Z]+(\d+)', str((result or {}).get('updates', {}).get('updatedRange', '')))
+        return int(match.group(1)) if match else None
+
+    def update_stocks(self, stock):
+        index = get_menu_row_index()
+        id_rows = index.lookup(stock)
+        if len(id_rows) < len(stock):
+            # ID belum ada di index (menu ditambah dari luar app) -> baca ulang kolom ID sekali
+            index.rebuild(self.ws_menu.col_values(1)[1:])
+            id_rows = index.lookup(stock)
+        updates = [{'range': f'F{row}', 'values': [[stock[k]]]} for k, row in id_rows.items()]
+        if updates: self.ws_menu.batch_update(updates)
+
+    # --- RESEP & BAHAN BAKU (WORKSHEET OPSIONAL, DIBUAT SENDIRI KALAU BELUM ADA) ---
+    def _aux_worksheet(self, title, headers):
+        if title not in self.aux_ws:
+            try:
+                self.aux_ws[title] = self.sheet.worksheet(title)
+            except gspread.exceptions.WorksheetNotFound:
+                ws = self.sheet.add_worksheet(title=title, rows=200, cols=len(headers))
+                ws.update(range_name='A1', values=[headers])
+                self.aux_ws[title] = ws
+        return self.aux_ws[title]
+
+    def _read_aux(self, title, headers, columns):
+        rows = self._aux_worksheet(title, headers).get_all_values()[1:]
+        return pd.DataFrame([(r + [''] * len(columns))[:len(columns)] for r in rows], columns=columns)
+
+    def _write_aux(self, title, headers, rows):
+        ws = self._aux_worksheet(title, headers)
+        # Sheet dibuat 200 baris; update di luar grid ditolak API -> tambah baris dulu
+        if len(rows) + 1 > ws.row_count: ws.add_rows(len(rows) + 1 - ws.row_count)
+        ws.clear()
+        ws.update(range_name='A1', values=[headers] + rows)
+
+    def load_recipes(self):
+        return self._read_aux('recipes', RECIPE_SHEET_HEADERS, RECIPE_COLUMNS)
+
+    def save_recipes(self, df):
+        self._write_aux('recipes', RECIPE_SHEET_HEADERS,
+                        [[str(r['MenuID']), str(r['Ingredient']), float(r['Qty'])] for _, r in df[RECIPE_COLUMNS].fillna(0).iterrows()])
+
+    def load_ingredients(self):
+        df = self._read_aux('ingredients', INGREDIENT_SHEET_HEADERS, INGREDIENT_COLUMNS)
+        self.ingredient_rows = {name: i + 2 for i, name in enumerate(df['Ingredient'])}
+        return df
+
+    def save_ingredients(self, df):
+        rows = [[str(r['Ingredient']), str(r['Unit']), float(r['OnHand']), float(r['ReorderPoint'])]
+                for _, r in df[INGREDIENT_COLUMNS].fillna(0).iterrows()]
+        self._write_aux('ingredients', INGREDIENT_SHEET_HEADERS, rows)
+        self.ingredient_rows = {r[0]: i + 2 for i, r in enumerate(rows)}
+
+    def update_ingredients(self, levels):
+        if any(k not in self.ingredient_rows for k in levels): self.load_ingredients() # Bahan baru ditambah dari luar app
+        updates = [{'range': f'C{self.ingredient_rows[k]}', 'values': [[v]]} for k, v in levels.items() if k in self.ingredient_rows]
+        if updates: self._aux_worksheet('ingredients', INGREDIENT_SHEET_HEADERS).batch_update(updates)
+
+    # --- ANTRIAN DAPUR & MEJA (WORKSHEET 'kitchen' / 'tables' / 'table_sessions') ---
+    def _best_effort(self, write):
+        # State dapur & meja hidup di memori; kalau Sheets lagi error tulisannya dilewati, login ulang di rerun berikut
+        try: write()
+        except Exception: get_resource_registry().invalidate('gsheets')
+
+    def _kitchen_orders(self):
+        rows = self._aux_worksheet('kitchen', KITCHEN_SHEET_HEADERS).get_all_values()[1:]
+        self.kitchen_rows = {r[0]: i + 2 for i, r in enumerate(rows) if r and r[0]}
+        orders = []
+        for r in rows:
+            if not r or not r[0]: continue
+            r = r + [''] * (len(KITCHEN_SHEET_HEADERS) - len(r))
+            orders.append({'id': r[0], 'table': r[1], 'items': json.loads(r[2] or '[]'), 'time': r[3], 'status': r[4],
+                           'created_at': r[5] or None, 'started_at': r[6] or None, 'completed_at': r[7] or None,
+                           'stations': json.loads(r[8] or '[]')})
+        return orders
+
+    def get_kitchen_queue(self):
+        return [o for o in self._kitchen_orders() if o['status'] != 'Completed']
+
+    def get_kitchen_history(self, limit):
+        done = [o for o in self._kitchen_orders() if o['status'] == 'Completed' and o['completed_at']]
+        return sorted(done, key=lambda o: o['completed_at'])[-limit:]
+
+    def add_kitchen_order(self, order):
+        def write():
+            result = self._aux_worksheet('kitchen', KITCHEN_SHEET_HEADERS).append_row(
+                [order['id'], str(order['table']), json.dumps(order['items'], default=int), order['time'], order['status'],
+                 order.get('created_at') or '', order.get('started_at') or '', order.get('completed_at') or '',
+                 json.dumps(order.get('stations', []))])
+            row = self._appended_row(result)
+            if row: self.kitchen_rows[order['id']] = row
+        self._best_effort(write)
+
+    def update_kitchen_status(self, oid, stat, at=None):
+        def write():
+            if oid not in self.kitchen_rows: self._kitchen_orders() # Baris belum ke-index (append tanpa updatedRange)
+            row = self.kitchen_rows.get(oid)
+            if row is None: return
+            updates = [{'range': f'E{row}', 'values': [[stat]]}]
+            # Timestamp ke kolom sesuai status barunya (Cooking -> started_at, Completed -> completed_at)
+            column = {'Cooking': 'G', 'Completed': 'H'}.get(stat)
+            if column and at: updates.append({'range': f'{column}{row}', 'values': [[at]]})
+            self._aux_worksheet('kitchen', KITCHEN_SHEET_HEADERS).batch_update(updates)
+        self._best_effort(write)
+
+    def get_tables(self):
+        rows = self._aux_worksheet('tables', TABLE_SHEET_HEADERS).get_all_values()[1:]
+        tables, positions = {}, {}
+        for i, r in enumerate(rows):
+            r = r + [''] * (len(TABLE_SHEET_HEADERS) - len(r))
+            if not r[0].isdigit(): continue
+            tables[int(r[0])] = {'id': int(r[0]), 'status': r[1] or 'Empty', 'occupied_at': r[2] or None, 'orders': json.loads(r[3] or '[]')}
+            positions[int(r[0])] = i + 2
+        if any(t not in tables for t in range(1, TABLE_COUNT + 1)):
+            # Sheet baru / meja kurang -> tulis ulang lengkap, urut id (row = id + 1)
+            for t in range(1, TABLE_COUNT + 1): tables.setdefault(t, {'id': t, 'status': 'Empty', 'occupied_at': None, 'orders': []})
+            state = [tables[t] for t in sorted(tables)]
+            self._write_aux('tables', TABLE_SHEET_HEADERS, [[t['id'], t['status'], t['occupied_at'] or '', json.dumps(t['orders'])] for t in state])
+            positions = {t['id']: i + 2 for i, t in enumerate(state)}
+        self.table_rows = positions
+        return [tables[t] for t in sorted(tables)]
+
+    def update_table_status(self, tid, stat, occupied_at=None, orders=None):
+        def write():
+            if tid not in self.table_rows: self.get_tables()
+            row = self.table_rows.get(tid)
+            if row is None: return
+            self._aux_worksheet('tables', TABLE_SHEET_HEADERS).update(range_name=f'B{row}:D{row}', values=[[stat, occupied_at or '', json.dumps(orders or [])]])
+        self._best_effort(write)
+
+    def get_table_sessions(self, limit):
+        rows = self._aux_worksheet('table_sessions', TABLE_SESSION_SHEET_HEADERS).get_all_values()[1:]
+        sessions = []
+        for r in rows[-limit:]:
+            r = r + [''] * (len(TABLE_SESSION_SHEET_HEADERS) - len(r))
+            if r[0].isdigit(): sessions.append({'table': int(r[0]), 'occupied_at': r[1], 'cleared_at': r[2], 'orders': json.loads(r[3] or '[]')})
+        return sessions
+
+    def add_table_session(self, session):
+        self._best_effort(lambda: self._aux_worksheet('table_sessions', TABLE_SESSION_SHEET_HEADERS).append_row(
+            [session['table'], session['occupied_at'], session['cleared_at'], json.dumps(session['orders'])]))
+
+class SQLiteBackend(StorageBackend):
+    """Embedded local database: WAL journal, indexed on date and item id"""
+    def __init__(self, path=SQLITE_DB_FILE):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS menu (
+                    id TEXT PRIMARY KEY, menu_name TEXT, price INTEGER, category TEXT, icon TEXT, stock INTEGER);
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, item_id TEXT, item_name TEXT, category TEXT,
+                    price INTEGER, qty INTEGER, total INTEGER, hour INTEGER, customer_type TEXT, payment_method TEXT,
+                    customer_id TEXT, base_price INTEGER);
+                CREATE INDEX IF NOT EXISTS idx_tx_date ON transactions(date);
+                CREATE INDEX IF NOT EXISTS idx_tx_item ON transactions(item_id);
+                CREATE TABLE IF NOT EXISTS kitchen_orders (
+                    id TEXT PRIMARY KEY, table_no TEXT, items TEXT, time TEXT, status TEXT);
+                CREATE TABLE IF NOT EXISTS tables (id INTEGER PRIMARY KEY, status TEXT);
+                CREATE TABLE IF NOT EXISTS table_sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, table_id INTEGER, occupied_at TEXT, cleared_at TEXT, orders TEXT);
+                CREATE INDEX IF NOT EXISTS idx_table_sessions_cleared ON table_sessions(cleared_at);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS ingredients (name TEXT PRIMARY KEY, unit TEXT, on_hand REAL, reorder_point REAL);
+                CREATE TABLE IF NOT EXISTS recipes (
+                    menu_id TEXT, ingredient TEXT, qty REAL, PRIMARY KEY (menu_id, ingredient));
+            """)
+            conn.executemany("INSERT OR IGNORE INTO tables (id, status) VALUES (?, 'Empty')", [(i,) for i in range(1, TABLE_COUNT + 1)])
+            
+            # Migrasi: database lama belum punya kolom customer_id
+            tx_cols = [r[1] for r in conn.execute("PRAGMA table_info(transactions)")]
+            if 'customer_id' not in tx_cols:
+                conn.execute("ALTER TABLE transactions ADD COLUMN customer_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tx_customer ON transactions(customer_id)")
+            # Migrasi: harga menu (sebelum surge) per baris
+            if 'base_price' not in tx_cols:
+                conn.execute("ALTER TABLE transactions ADD COLUMN base_price INTEGER")
             
-            df = pd.DataFrame(data)
-            df = df.rename(columns={'date':'Date', 'item_id':'ItemID', 'item_name':'ItemName', 'category':'Category', 'price':'Price', 'qty':'Qty', 'total':'Total', 'hour':'Hour', 'customer_type':'CustomerType', 'payment_method':'Payment'})
+            # Migrasi: antrian dapur lama belum punya timestamp per status & station
+            kds_cols = [r[1] for r in conn.execute("PRAGMA table_info(kitchen_orders)")]
+            for col in ['created_at', 'started_at', 'completed_at', 'stations']:
+                if col not in kds_cols:
+                    conn.execute(f"ALTER TABLE kitchen_orders ADD COLUMN {col} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_kds_status ON kitchen_orders(status)")
             
-            if 'Date' in df.columns: df['Date'] = pd.to_datetime(df['Date'])
-            if 'Total' not in df.columns: return pd.DataFrame(columns=wajib)
-            return df
-        except: return pd.DataFrame(columns=['Date', 'ItemID', 'ItemName', 'Category', 'Price', 'Qty', 'Total', 'Hour', 'CustomerType', 'Payment'])
+            # Migrasi: meja lama belum nyimpen jam mulai duduk & order yang nempel
+            table_cols = [r[1] for r in conn.execute("PRAGMA table_info(tables)")]
+            for col in ['occupied_at', 'orders']:
+                if col not in table_cols:
+                    conn.execute(f"ALTER TABLE tables ADD COLUMN {col} TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_connection(self):
+        return self._connect()
+
+    def load_menu(self):
+        with self._connect() as conn:
+            df = pd.read_sql("SELECT id, menu_name, price, category, icon, stock FROM menu", conn)
+        df.columns = MENU_COLUMNS
+        return df
+
+    def save_menu(self, df):
+        rows = [(str(r['ID']), str(r['Menu']), int(r['Harga']), str(r['Kategori']), str(r['Icon']), int(r['Stok']))
+                for _, r in df[MENU_COLUMNS].fillna(0).iterrows()]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM menu")
+            conn.executemany("INSERT INTO menu VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def fetch_tx_tail(self, cursor):
+        with self._connect() as conn:
+            df = pd.read_sql("SELECT * FROM transactions WHERE id > ? ORDER BY id", conn, params=(cursor,))
+        if df.empty: return empty_transactions(), cursor
+        new_cursor = int(df['id'].iloc[-1])
+        return normalize_transactions(df.drop(columns='id')), new_cursor
+
+    def tx_rows_after(self, cursor):
+        """Returns raw rows (sheet column order, local id appended last) with id > cursor, plus the last id seen"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM transactions WHERE id > ? ORDER BY id", (cursor,)).fetchall()
+        if not rows: return [], cursor
+        return [list(r[1:]) + [r[0]] for r in rows], rows[-1][0]
+
+    def append_transactions(self, rows):
+        with self._connect() as conn:
+            # Baris lama di write-ahead buffer bisa belum punya customer_id / base_price
+            rows = [list(r) + [''] * (len(TX_SHEET_HEADERS) - len(r)) for r in rows]
+            conn.executemany("""INSERT INTO transactions (date, item_id, item_name, category, price, qty, total, hour, customer_type, payment_method, customer_id, base_price)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            # Masih di transaksi yang sama (write lock dipegang) -> id baris ini pasti berurutan
+            last_id = conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+        return last_id - len(rows)
+
+    def update_stocks(self, stock):
+        with self._connect() as conn:
+            conn.executemany("UPDATE menu SET stock = ? WHERE id = ?", [(v, k) for k, v in stock.items()])
+
+    _KDS_SELECT = "SELECT id, table_no, items, time, status, created_at, started_at, completed_at, stations FROM kitchen_orders"
+
+    @staticmethod
+    def _kitchen_order(r):
+        return {'id': r[0], 'table': r[1], 'items': json.loads(r[2]), 'time': r[3], 'status': r[4],
+                'created_at': r[5], 'started_at': r[6], 'completed_at': r[7], 'stations': json.loads(r[8] or '[]')}
+
+    def get_kitchen_queue(self):
+        with self._connect() as conn:
+            rows = conn.execute(self._KDS_SELECT + " WHERE status != 'Completed' ORDER BY rowid").fetchall()
+        return [self._kitchen_order(r) for r in rows]
+
+    def get_kitchen_history(self, limit):
+        with self._connect() as conn:
+            rows = conn.execute(self._KDS_SELECT + " WHERE status = 'Completed' AND completed_at IS NOT NULL ORDER BY completed_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._kitchen_order(r) for r in reversed(rows)]
+
+    def add_kitchen_order(self, order):
+        with self._connect() as conn:
+            conn.execute("""INSERT INTO kitchen_orders (id, table_no, items, time, status, created_at, started_at, completed_at, stations)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (order['id'], order['table'], json.dumps(order['items'], default=int), order['time'], order['status'],
+                          order.get('created_at'), order.get('started_at'), order.get('completed_at'), json.dumps(order.get('stations', []))))
+
+    def update_kitchen_status(self, oid, stat, at=None):
+        # Timestamp disimpan di kolom sesuai status barunya (Cooking -> started_at, Completed -> completed_at)
+        column = {'Cooking': 'started_at', 'Completed': 'completed_at'}.get(stat)
+        with self._connect() as conn:
+            if column and at:
+                conn.execute(f"UPDATE kitchen_orders SET status = ?, {column} = ? WHERE id = ?", (stat, at, oid))
+            else:
+                conn.execute("UPDATE kitchen_orders SET status = ? WHERE id = ?", (stat, oid))
+
+    def get_tables(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, status, occupied_at, orders FROM tables ORDER BY id").fetchall()
+        return [{'id': r[0], 'status': r[1], 'occupied_at': r[2], 'orders': json.loads(r[3] or '[]')} for r in rows]
+
+    def get_table_sessions(self, limit):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT table_id, occupied_at, cleared_at, orders FROM table_sessions ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [{'table': r[0], 'occupied_at': r[1], 'cleared_at': r[2], 'orders': json.loads(r[3] or '[]')} for r in reversed(rows)]
+
+    def update_table_status(self, tid, stat, occupied_at=None, orders=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE tables SET status = ?, occupied_at = ?, orders = ? WHERE id = ?",
+                         (stat, occupied_at, json.dumps(orders or []), tid))
+
+    def add_table_session(self, session):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO table_sessions (table_id, occupied_at, cleared_at, orders) VALUES (?, ?, ?, ?)",
+                         (session['table'], session['occupied_at'], session['cleared_at'], json.dumps(session['orders'])))
+
+    def load_recipes(self):
+        with self._connect() as conn:
+            df = pd.read_sql("SELECT menu_id, ingredient, qty FROM recipes", conn)
+        df.columns = RECIPE_COLUMNS
+        return df
+
+    def save_recipes(self, df):
+        rows = [(str(r['MenuID']), str(r['Ingredient']), float(r['Qty'])) for _, r in df[RECIPE_COLUMNS].fillna(0).iterrows()]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM recipes")
+            conn.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?)", rows)
+
+    def load_ingredients(self):
+        with self._connect() as conn:
+            df = pd.read_sql("SELECT name, unit, on_hand, reorder_point FROM ingredients", conn)
+        df.columns = INGREDIENT_COLUMNS
+        return df
+
+    def save_ingredients(self, df):
+        rows = [(str(r['Ingredient']), str(r['Unit']), float(r['OnHand']), float(r['ReorderPoint']))
+                for _, r in df[INGREDIENT_COLUMNS].fillna(0).iterrows()]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ingredients")
+            conn.executemany("INSERT OR REPLACE INTO ingredients VALUES (?, ?, ?, ?)", rows)
+
+    def update_ingredients(self, levels):
+        with self._connect() as conn:
+            conn.executemany("UPDATE ingredients SET on_hand = ? WHERE name = ?", [(v, k) for k, v in levels.items()])
+
+    def get_meta(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+# --- EXPORT ASYNC: SQLITE -> GOOGLE SHEETS (JALAN DI BACKGROUND) ---
+class SheetExporter:
+    """Background thread that mirrors new local transactions and stock levels to Google Sheets"""
+    def __init__(self, local, creds_dict, interval=60):
+        self.local = local
+        self.creds_dict = creds_dict
+        self.interval = interval
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sheet-exporter", daemon=True)
+        self.thread.start()
+
+    def notify(self):
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.export_once(get_sheets_backend(self.creds_dict))
+            except Exception:
+                get_resource_registry().invalidate('gsheets') # Login ulang di putaran berikutnya
+
+    def export_once(self, sheets):
+        cursor = int(self.local.get_meta('sheet_export_cursor', 0))
+        rows, last_id = self.local.tx_rows_after(cursor)
+        if rows:
+            # Append sebelumnya gak sempat dikonfirmasi (error / proses mati di tengah) -> bisa jadi sebagian
+            # sudah masuk. Baris yang id SQLite-nya sudah ada di sheet dilewati, bukan di-append dobel.
+            if int(self.local.get_meta('sheet_export_pending', 0)) > cursor:
+                exported = sheets.exported_ids()
+                rows = [r for r in rows if int(r[-1]) not in exported]
+            self.local.set_meta('sheet_export_pending', last_id)
+            if rows: sheets.append_exported(rows)
+            # Cursor baru maju setelah append terkonfirmasi
+            self.local.set_meta('sheet_export_cursor', last_id)
+        menu = self.local.load_menu()
+        sheets.update_stocks({str(r['ID']): int(r['Stok']) for _, r in menu.iterrows()})
+
+def get_sheets_backend(creds_dict=None):
+    """Shared, pre-authorized Google Sheets backend (login ulang tiap SHEETS_MAX_AGE / setelah error)"""
+    return get_resource_registry().get('gsheets', lambda: GoogleSheetsBackend(creds_dict or load_gcp_credentials()),
+                                       max_age=SHEETS_MAX_AGE, check=lambda backend: backend.ping())
+
+def get_sqlite_backend(path=SQLITE_DB_FILE):
+    # Skema & migrasi cukup dicek sekali per proses
+    return get_resource_registry().get(f'sqlite:{path}', lambda: SQLiteBackend(path))
+
+@st.cache_resource
+def get_sheet_exporter(path, creds_dict):
+    exporter = SheetExporter(SQLiteBackend(path), creds_dict)
+    # Bangunin thread export tiap ada transaksi / stok baru
+    for topic in ('transactions', 'menu'):
+        get_event_bus().subscribe(topic, lambda event: exporter.notify())
+    return exporter
+
+# ==========================================
+# EVENT BUS (CHECKOUT / DAPUR / MEJA -> LAYAR LAIN)
+# ==========================================
+EVENT_DIR = '.events' # Satu file penanda per topic, buat server yang jalan lebih dari 1 proses
+LIVE_REFRESH_SECONDS = 3 # Fragment live ngecek versi topic (baca memori, bukan reload data)
+
+class EventBus:
+    """In-process pub/sub keyed by topic, with a touch-file per topic as cross-process fallback.
+
+    Every publish bumps the topic's version; screens compare versions and only reload
+    the data behind the fragment that subscribed to it.
+    """
+    def __init__(self, path=EVENT_DIR):
+        self.path = path
+        self.seq = {}
+        self.stamps = {} # topic -> mtime file penanda yang terakhir sudah dihitung
+        self.external = {} # topic -> jumlah publish dari proses lain yang kelihatan
+        self.recent = deque(maxlen=200)
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def subscribe(self, topic, callback):
+        with self.lock:
+            self.subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, payload=None):
+        with self.lock:
+            self.seq[topic] = self.seq.get(topic, 0) + 1
+            event = {'topic': topic, 'seq': self.seq[topic], 'at': time.time(), 'payload': payload or {}}
+            self.recent.append(event)
+            callbacks = list(self.subscribers.get(topic, []))
+            self._observe(topic) # Publish proses lain yang belum kehitung jangan ketimpa sentuhan kita
+            try:
+                path = os.path.join(self.path, topic)
+                with open(path, 'a'): pass
+                os.utime(path)
+                self.stamps[topic] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass # Folder gak bisa ditulis: cukup event in-process
+        for callback in callbacks:
+            try: callback(event)
+            except Exception: pass
+        return event
+
+    def version(self, topic):
+        """Changes whenever `topic` is published, from this process or another one"""
+        try: mtime = os.stat(os.path.join(self.path, topic)).st_mtime_ns
+        except OSError: mtime = 0
+        with self.lock:
+            return (self.seq.get(topic, 0), mtime)
+
+    def external_version(self, topic):
+        """Counts publishes of `topic` made by other processes (seen through the touch-file)"""
+        with self.lock:
+            self._observe(topic)
+            return self.external.get(topic, 0)
+
+    def _observe(self, topic):
+        # Mtime berubah tapi bukan hasil publish proses ini -> proses lain yang nulis
+        try: mtime = os.stat(os.path.join(self.path, topic)).st_mtime_ns
+        except OSError: return
+        if mtime != self.stamps.get(topic):
+            self.stamps[topic] = mtime
+            self.external[topic] = self.external.get(topic, 0) + 1
+
+@st.cache_resource
+def get_event_bus():
+    return EventBus()
+
+def refresh_on_event(topic, state_key, loader):
+    """Reloads `st.session_state[state_key]` only if `topic` was published since this session last looked"""
+    version = get_event_bus().version(topic)
+    seen_key = f'_seen_{topic}_{state_key}'
+    if state_key not in st.session_state or st.session_state.get(seen_key) != version:
+        st.session_state[state_key] = loader()
+        st.session_state[seen_key] = version
+    return st.session_state[state_key]
+
+# ==========================================
+# KITCHEN ORDER QUEUE (DIPAKAI BARENG POS & LAYAR DAPUR)
+# ==========================================
+KITCHEN_FLOW = {'Pending': 'Cooking', 'Cooking': 'Completed'} # Status cuma boleh maju satu langkah
+KITCHEN_STATIONS = {'Coffee': 'Bar', 'Non-Coffee': 'Bar', 'Mainframe Meals': 'Hot Kitchen', 'GPU Snacks': 'Fryer'}
+KITCHEN_DEFAULT_STATION = 'Hot Kitchen'
+KITCHEN_HISTORY = 500 # Tiket selesai terakhir yang dipakai buat hitung persentil
+
+def kitchen_station(category):
+    return KITCHEN_STATIONS.get(category, KITCHEN_DEFAULT_STATION)
+
+def order_stations(order):
+    # Tiket lama (sebelum ada station) dianggap masuk station default
+    return order.get('stations') or sorted({x.get('Station', KITCHEN_DEFAULT_STATION) for x in order['items']})
+
+class KitchenQueue:
+    """Open kitchen tickets keyed by order id plus recent completions, shared by every session.
+
+    The backend is the source of truth on startup and whenever another server process changed
+    the queue (`version`); in between the queue is kept in memory and every transition is written through.
+    """
+    def __init__(self):
+        self.orders = {} # id -> order, urutan masuk = urutan FIFO dapur
+        self.completed = deque(maxlen=KITCHEN_HISTORY)
+        self.loaded = False
+        self.version = None
+        self.lock = threading.Lock()
+
+    def load(self, backend, version=0):
+        with self.lock:
+            if self.loaded and self.version == version: return
+            self.orders = {o['id']: {**o, 'stations': order_stations(o)} for o in backend.get_kitchen_queue()}
+            self.completed.clear()
+            self.completed.extend({**o, 'stations': order_stations(o)} for o in backend.get_kitchen_history(KITCHEN_HISTORY))
+            self.version = version
+            self.loaded = True
+
+    def new_id(self):
+        while True:
+            order_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+            if order_id not in self.orders: return order_id
+
+    def add(self, order, backend):
+        now = datetime.now()
+        order.setdefault('created_at', now.isoformat(timespec='seconds'))
+        order['stations'] = order_stations(order)
+        with self.lock:
+            self.orders[order['id']] = order
+        backend.add_kitchen_order(order)
+        return order
+
+    def advance(self, order_id, backend):
+        """Moves a ticket to its next status; returns the new status or None if it can't move"""
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['status'] not in KITCHEN_FLOW: return None
+            status = KITCHEN_FLOW[order['status']]
+            at = datetime.now().isoformat(timespec='seconds')
+            order['status'] = status
+            order['started_at' if status == 'Cooking' else 'completed_at'] = at
+            if status == 'Completed':
+                self.completed.append(self.orders.pop(order_id))
+        backend.update_kitchen_status(order_id, status, at)
+        return status
+
+    def open_orders(self):
+        with self.lock:
+            return list(self.orders.values())
+
+    def completion_times(self):
+        """order id -> completed_at for the tickets still in the history window"""
+        with self.lock:
+            return {o['id']: o['completed_at'] for o in self.completed if o.get('completed_at')}
+
+    def metrics(self):
+        """Backlog depth and ticket-time percentiles (minutes) per station"""
+        with self.lock:
+            open_orders = list(self.orders.values())
+            done = list(self.completed)
+        stats = {}
+        def station(name):
+            return stats.setdefault(name, {'Pending': 0, 'Cooking': 0, 'Items': 0, 'tickets': []})
+        for order in open_orders:
+            for name in order.get('stations', []): station(name)[order['status']] += 1
+            for item in order['items']: station(item.get('Station', KITCHEN_DEFAULT_STATION))['Items'] += int(item['Qty'])
+        for order in done:
+            if not order.get('created_at') or not order.get('completed_at'): continue
+            minutes = (datetime.fromisoformat(order['completed_at']) - datetime.fromisoformat(order['created_at'])).total_seconds() / 60
+            for name in order.get('stations', []): station(name)['tickets'].append(minutes)
+        
+        rows = []
+        for name, row in sorted(stats.items()):
+            tickets = np.array(row.pop('tickets'))
+            p50, p90, p95 = np.percentile(tickets, [50, 90, 95]) if len(tickets) else (np.nan,) * 3
+            rows.append({'Station': name, 'Backlog': row['Pending'] + row['Cooking'], **row,
+                         'Done': len(tickets), 'P50 (min)': p50, 'P90 (min)': p90, 'P95 (min)': p95})
+        return pd.DataFrame(rows)
+
+@st.cache_resource
+def get_kitchen_store(backend_name):
+    return KitchenQueue()
+
+# ==========================================
+# TABLE OCCUPANCY (STATUS MEJA + RIWAYAT DUDUK)
+# ==========================================
+TABLE_HISTORY = 1000 # Sesi meja terakhir yang dipakai buat analitik turnover
+
+class TableStore:
+    """Live table state (occupied-at, linked orders) plus finished seatings, shared by every session.
+
+    Reloaded from the backend when another server process changed the tables (`version`).
+    """
+    def __init__(self):
+        self.tables = {}
+        self.sessions = deque(maxlen=TABLE_HISTORY)
+        self.loaded = False
+        self.version = None
+        self.lock = threading.Lock()
+
+    def load(self, backend, version=0):
+        with self.lock:
+            if self.loaded and self.version == version: return
+            self.tables = {t['id']: t for t in backend.get_tables()}
+            self.sessions.clear()
+            self.sessions.extend(backend.get_table_sessions(TABLE_HISTORY))
+            self.version = version
+            self.loaded = True
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(t) for t in sorted(self.tables.values(), key=lambda t: t['id'])]
+
+    def seat(self, table_id, order_id, backend):
+        """Marks a table occupied (first order starts the clock) and links the order to it"""
+        with self.lock:
+            table = self.tables.get(table_id)
+            if table is None: return None
+            if table['status'] != 'Occupied':
+                table.update(status='Occupied', occupied_at=datetime.now().isoformat(timespec='seconds'), orders=[])
+            if order_id: table['orders'] = table['orders'] + [order_id]
+            state = dict(table)
+        backend.update_table_status(table_id, 'Occupied', state['occupied_at'], state['orders'])
+        return state
+
+    def clear(self, table_id, backend):
+        """Frees a table and records the finished seating; returns it (None if the table wasn't occupied)"""
+        with self.lock:
+            table = self.tables.get(table_id)
+            if table is None or table['status'] != 'Occupied': return None
+            session = {'table': table_id, 'occupied_at': table['occupied_at'],
+                       'cleared_at': datetime.now().isoformat(timespec='seconds'), 'orders': table['orders']}
+            table.update(status='Empty', occupied_at=None, orders=[])
+            if session['occupied_at']: self.sessions.append(session)
+        if session['occupied_at']: backend.add_table_session(session)
+        backend.update_table_status(table_id, 'Empty')
+        return session
+
+    def turnover(self, served_at=None):
+        """Per-seating frame with turn time split into waiting-for-food and dining minutes"""
+        served_at = served_at or {}
+        with self.lock:
+            sessions = list(self.sessions)
+        rows = []
+        for s in sessions:
+            start, end = datetime.fromisoformat(s['occupied_at']), datetime.fromisoformat(s['cleared_at'])
+            served = [datetime.fromisoformat(served_at[o]) for o in s['orders'] if o in served_at]
+            food = min(max(served), end) if served else None
+            rows.append({'Table': s['table'], 'Start': start, 'End': end, 'Orders': len(s['orders']),
+                         'Turn (min)': (end - start).total_seconds() / 60,
+                         'Wait Food (min)': (food - start).total_seconds() / 60 if food else np.nan,
+                         'Dining (min)': (end - food).total_seconds() / 60 if food else np.nan})
+        return pd.DataFrame(rows, columns=['Table', 'Start', 'End', 'Orders', 'Turn (min)', 'Wait Food (min)', 'Dining (min)'])
+
+    def utilization_by_hour(self):
+        """Share of table-minutes occupied for each hour of day, over the days in the history window"""
+        with self.lock:
+            spans = [(s['occupied_at'], s['cleared_at']) for s in self.sessions]
+            spans += [(t['occupied_at'], None) for t in self.tables.values() if t['status'] == 'Occupied' and t.get('occupied_at')]
+            n_tables = max(len(self.tables), 1)
+        occupied = np.zeros(24)
+        days = set()
+        now = datetime.now()
+        for start, end in spans:
+            start = datetime.fromisoformat(start)
+            end = datetime.fromisoformat(end) if end else now
+            cursor = start
+            while cursor < end:
+                # Potong per jam: menit yang jatuh di jam `cursor.hour`
+                next_hour = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+                chunk_end = min(next_hour, end)
+                occupied[cursor.hour] += (chunk_end - cursor).total_seconds() / 60
+                days.add(cursor.date())
+                cursor = chunk_end
+        capacity = n_tables * 60 * max(len(days), 1)
+        return pd.DataFrame({'Hour': range(24), 'Utilization': occupied / capacity})
+
+@st.cache_resource
+def get_table_store(backend_name):
+    return TableStore()
+
+# ==========================================
+# INGREDIENT INVENTORY (RESEP / BILL OF MATERIALS)
+# ==========================================
+class IngredientStore:
+    """On-hand ingredient levels plus a sparse (menu x ingredient) recipe matrix, shared by every session"""
+    def __init__(self):
+        self.menu_ids = pd.Index([], dtype=str)
+        self.ingredients = pd.Index([], dtype=str)
+        self.units = np.array([], dtype=object)
+        self.on_hand = np.zeros(0)
+        self.reorder = np.zeros(0)
+        self.recipe = sparse.csr_matrix((0, 0))
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self, backend):
+        with self.lock:
+            if self.loaded: return
+            recipes = apply_schema(backend.load_recipes(), RECIPE_SCHEMA)
+            ingredients = apply_schema(backend.load_ingredients(), INGREDIENT_SCHEMA)
+            if recipes.empty and ingredients.empty:
+                # Backend belum punya resep sama sekali -> seed resep menu bawaan
+                recipes = apply_schema(pd.DataFrame(get_initial_recipes(), columns=RECIPE_COLUMNS), RECIPE_SCHEMA)
+                ingredients = apply_schema(pd.DataFrame(get_initial_ingredients(), columns=INGREDIENT_COLUMNS), INGREDIENT_SCHEMA)
+                backend.save_recipes(recipes)
+                backend.save_ingredients(ingredients)
+            self._build(recipes, ingredients)
+            self.loaded = True
+
+    def _build(self, recipes, ingredients):
+        recipes = recipes[(recipes['MenuID'] != '') & (recipes['Ingredient'] != '') & (recipes['Qty'] > 0)]
+        ingredients = ingredients[ingredients['Ingredient'] != ''].drop_duplicates('Ingredient')
+        # Bahan yang cuma ada di resep tetap dapat kolom (stok 0) biar ikut kena alert reorder
+        extra = recipes.loc[~recipes['Ingredient'].isin(ingredients['Ingredient']), 'Ingredient'].unique()
+        if len(extra):
+            ingredients = pd.concat([ingredients, pd.DataFrame({'Ingredient': extra, 'Unit': '', 'OnHand': 0.0, 'ReorderPoint': 0.0})], ignore_index=True)
+        self.menu_ids = pd.Index(recipes['MenuID'].unique())
+        self.ingredients = pd.Index(ingredients['Ingredient'])
+        self.units = ingredients['Unit'].to_numpy(dtype=object)
+        self.on_hand = ingredients['OnHand'].to_numpy(dtype=float).copy()
+        self.reorder = ingredients['ReorderPoint'].to_numpy(dtype=float).copy()
+        # Baris = menu, kolom = bahan; pasangan (menu, bahan) dobel otomatis dijumlah sama CSR
+        rows = self.menu_ids.get_indexer(recipes['MenuID'])
+        cols = self.ingredients.get_indexer(recipes['Ingredient'])
+        self.recipe = sparse.csr_matrix((recipes['Qty'].to_numpy(dtype=float), (rows, cols)), shape=(len(self.menu_ids), len(self.ingredients)))
+
+    def replace(self, recipes, ingredients, backend, base=None):
+        """Saves edited recipe / ingredient tables and rebuilds the matrix from them.
+
+        `base` is the snapshot the editor was rendered from: OnHand cells left as they were keep
+        the live level, so checkouts made while the editor was open aren't rolled back.
+        """
+        recipes = apply_schema(recipes, RECIPE_SCHEMA)
+        ingredients = apply_schema(ingredients, INGREDIENT_SCHEMA)
+        # Lock dipegang sampai tersimpan, biar checkout yang nyelip gak ketimpa level lama
+        with self.lock:
+            if base is not None:
+                names = ingredients['Ingredient']
+                before = base.drop_duplicates('Ingredient').set_index('Ingredient')['OnHand'].reindex(names).to_numpy(dtype=float)
+                live = pd.Series(self.on_hand, index=self.ingredients).reindex(names).to_numpy()
+                untouched = np.isclose(ingredients['OnHand'].to_numpy(dtype=float), before) & ~np.isnan(live)
+                ingredients.loc[untouched, 'OnHand'] = live[untouched]
+            backend.save_recipes(recipes)
+            backend.save_ingredients(ingredients)
+            self._build(recipes, ingredients)
+            self.loaded = True
+
+    def _align(self, item_ids, demand):
+        # Kolom demand (urutan item_ids) -> urutan baris matrix resep; menu tanpa resep dibuang
+        codes = self.menu_ids.get_indexer(pd.Index(item_ids).astype(str))
+        known = codes >= 0
+        aligned = np.zeros(demand.shape[:-1] + (len(self.menu_ids),))
+        np.add.at(aligned, (..., codes[known]), demand[..., known])
+        return aligned
+
+    def consume(self, item_ids, qtys):
+        """Deducts one order from on-hand levels with one sparse product; returns the levels that changed"""
+        with self.lock:
+            used = self.recipe.T @ self._align(item_ids, np.asarray(qtys, dtype=float))
+            changed = np.flatnonzero(used)
+            self.on_hand[changed] -= used[changed]
+            return {self.ingredients[i]: round(float(self.on_hand[i]), 3) for i in changed}
+
+    def snapshot(self):
+        with self.lock:
+            df = pd.DataFrame({'Ingredient': self.ingredients, 'Unit': self.units,
+                               'OnHand': self.on_hand.round(2), 'ReorderPoint': self.reorder})
+        df['Status'] = np.where(df['OnHand'] <= 0, 'HABIS', np.where(df['OnHand'] <= df['ReorderPoint'], 'REORDER', 'OK'))
+        return df
+
+    def recipes(self):
+        with self.lock:
+            coo = self.recipe.tocoo()
+            return pd.DataFrame({'MenuID': self.menu_ids[coo.row], 'Ingredient': self.ingredients[coo.col], 'Qty': coo.data})
+
+    def project(self, item_ids, demand, dates):
+        """Burns a (days x items) demand forecast through the recipe matrix with one product.
+
+        Returns one row per ingredient: projected use, level at the end of the horizon and the first
+        day it crosses the reorder point / runs out (NaT when that doesn't happen inside the horizon).
+        """
+        with self.lock:
+            burn = np.asarray(self.recipe.T @ self._align(item_ids, np.asarray(demand, dtype=float)).T).T
+            on_hand, reorder = self.on_hand.copy(), self.reorder.copy()
+            ingredients, units = self.ingredients, self.units
+        level = on_hand - burn.cumsum(axis=0) # (hari x bahan)
+        dates = pd.DatetimeIndex(dates)
+
+        def first_day(hit):
+            return pd.DatetimeIndex(np.where(hit.any(axis=0), dates[hit.argmax(axis=0)], pd.NaT))
+
+        return pd.DataFrame({'Unit': units, 'OnHand': on_hand.round(1), 'Use': burn.sum(axis=0).round(1),
+                             'EndLevel': level[-1].round(1), 'ReorderOn': first_day(level <= reorder),
+                             'StockoutOn': first_day(level <= 0)}, index=ingredients)
+
+@st.cache_resource
+def get_ingredient_store(backend_name):
+    return IngredientStore()
+
+# ==========================================
+# DATABASE MANAGER (PINTU MASUK SEMUA BACKEND)
+# ==========================================
+class DatabaseManager:
+    def __init__(self):
+        # Pilih backend dari secrets: [storage] backend = "gsheets" | "sqlite"
+        cfg = dict(st.secrets.get("storage", {}))
+        self.backend_name = cfg.get("backend", "gsheets")
+        self.archive_enabled = cfg.get("archive", True) # Arsip partisi harian di disk lokal
+        self.exporter = None
+        try:
+            if self.backend_name == "sqlite":
+                path = cfg.get("path", SQLITE_DB_FILE)
+                self.backend = get_sqlite_backend(path)
+                if cfg.get("export_to_sheets", False):
+                    self.exporter = get_sheet_exporter(path, load_gcp_credentials())
+            else:
+                # Client sudah login & dipakai bareng semua session (bukan OAuth tiap rerun)
+                self.backend = get_sheets_backend()
+
+        except Exception as e:
+            st.error(f"⚠️ Gagal Konek Database ({self.backend_name}): {e}")
+            st.info("Coba cek format 'private_key' di Secrets. Pastikan tidak ada spasi aneh di awal/akhir.")
+            st.stop()
+
+    def publish(self, topic, **payload):
+        get_event_bus().publish(topic, payload)
+
+    def reconnect(self):
+        """Drops the shared backend handle after an error so the next rerun logs in again"""
+        if self.backend_name != "sqlite": get_resource_registry().invalidate('gsheets')
+
+    # --- FUNGSI BACA MENU (DI-INDEX PAKAI ID) ---
+    def load_menu(self):
+        df = apply_schema(self.backend.load_menu(), MENU_SCHEMA, ['ID'])
+        df.index = df['ID']
+        df.index.name = None
+        return df[~df.index.duplicated()] # ID dobel: pakai yang pertama
+
+    def save_menu(self, df):
+        self.backend.save_menu(df)
+        self.publish('menu')
+
+    # --- FUNGSI BACA TRANSAKSI (LEWAT CACHE) ---
+    def load_transactions(self, force=False):
+        try:
+            return get_transaction_cache(self.backend_name).get(self.backend.fetch_tx_tail, force=force)
+        except:
+            self.reconnect()
+            return empty_transactions()
+
+    def invalidate_transactions(self, full=False):
+        get_transaction_cache(self.backend_name).invalidate(full=full)
 
     # --- FUNGSI SAVE ---
     def save_transaction(self, tx_data):
         try:
-            row = [str(tx_data['Date']), tx_data['ItemID'], tx_data['ItemName'], tx_data['Category'], tx_data['Price'], tx_data['Qty'], tx_data['Total'], tx_data['Hour'], tx_data['CustomerType'], tx_data['Payment']]
-            self.ws_tx.append_row(row)
+            row = tx_to_row(tx_data)
+            start = self.backend.append_transactions([row])
+            get_transaction_cache(self.backend_name).append([row], start)
+            self.publish('transactions', rows=1)
         except: pass
 
     # --- FUNGSI UPDATE STOK ---
     def update_stock(self, item_id, new_stock):
         try:
-            cell = self.ws_menu.find(item_id)
-            self.ws_menu.update_cell(cell.row, 6, new_stock)
+            self.backend.update_stocks({str(item_id): int(new_stock)})
+            self.publish('menu', items=[str(item_id)])
         except: pass
 
-    # --- FUNGSI DUMMY (BIAR GAK CRASH) ---
-    def get_kitchen_queue(self): return []
-    def add_kitchen_order(self, order): pass
-    def update_kitchen_status(self, oid, stat): pass
-    def get_tables(self): return [{'id': i, 'status': 'Empty'} for i in range(1, 13)]
-    def update_table_status(self, tid, stat): pass
+    # --- FUNGSI CHECKOUT (1 ORDER = 1 APPEND + 1 BATCH UPDATE STOK) ---
+    def checkout(self, tx_list, stock_updates):
+        """Journals an order locally, then pushes every pending order to the backend.
+
+        Returns True when nothing is left in the buffer, False if the push failed
+        (the order stays in `pending_writes.jsonl` and is retried on the next call).
+        """
+        # Bahan baku dipotong lewat matrix resep (satu perkalian per order), level barunya ikut dijurnal
+        levels = self._ingredients().consume([tx['ItemID'] for tx in tx_list], [tx['Qty'] for tx in tx_list])
+        buf = get_write_buffer()
+        with buf.lock:
+            buf.append({
+                'id': uuid.uuid4().hex,
+                'rows': [tx_to_row(tx) for tx in tx_list],
+                'stock': {str(k): int(v) for k, v in stock_updates.items()},
+                'ingredients': levels,
+                'rows_done': False
+            })
+        return self.flush_pending()
+
+    def flush_pending(self):
+        buf = get_write_buffer()
+        with buf.lock:
+            entries = buf.pending()
+            if not entries: return True
+            try:
+                # 1. Semua baris transaksi yang belum masuk -> satu append_rows
+                new_rows = [r for e in entries if not e['rows_done'] for r in e['rows']]
+                if new_rows:
+                    start = self.backend.append_transactions(new_rows)
+                    for e in entries: e['rows_done'] = True
+                    buf.replace(entries) # Catat biar retry gak dobel append
+                    # Baris baru langsung masuk buffer cache (tanpa baca ulang ke backend)
+                    get_transaction_cache(self.backend_name).append(new_rows, start)
+
+                # 2. Semua sel stok yang berubah -> satu batch update (order terbaru menang)
+                stock = {}
+                for e in entries: stock.update(e['stock'])
+                if stock: self.backend.update_stocks(stock)
+
+                # 3. Level bahan baku juga, satu batch (entry journal lama belum punya key ini)
+                ingredients = {}
+                for e in entries: ingredients.update(e.get('ingredients', {}))
+                if ingredients: self.backend.update_ingredients(ingredients)
+            except Exception:
+                self.reconnect()
+                return False
+            buf.replace([])
+        # Satu event per flush; layar lain cuma re-render bagian yang kena
+        if new_rows: self.publish('transactions', rows=len(new_rows))
+        if stock: self.publish('menu', items=list(stock))
+        if ingredients: self.publish('inventory', items=list(ingredients))
+        return True
+
+    def pending_count(self):
+        return len(get_write_buffer().pending())
+
+    # --- FUNGSI IMPORT MASSAL (FILE PARQUET / CSV / XLSX) ---
+    def import_transactions(self, chunks):
+        """Appends ledger-schema chunks to the backend, one append per chunk. Returns rows written"""
+        written = 0
+        cache = get_transaction_cache(self.backend_name)
+        try:
+            for chunk in chunks:
+                if chunk.empty: continue
+                rows = [tx_to_row(tx) for tx in chunk.to_dict('records')]
+                start = self.backend.append_transactions(rows)
+                cache.append(rows, start)
+                written += len(rows)
+        except Exception:
+            self.reconnect()
+            raise
+        finally:
+            if written: self.publish('transactions', rows=written)
+        return written
+
+    def archive_ledger(self, ledger):
+        """Mirrors new ledger rows into the append-only daily partition files"""
+        if not self.archive_enabled: return 0
+        return get_ledger_archive(self.backend_name).sync(ledger)
+
+    # --- KITCHEN & MEJA (STATE BERSAMA DI MEMORI, DISIMPAN KE BACKEND KALAU BISA) ---
+    def _kitchen(self):
+        queue = get_kitchen_store(self.backend_name)
+        # Proses server lain nambah / majuin tiket -> antrian di memori dibaca ulang dari backend
+        queue.load(self.backend, get_event_bus().external_version('kitchen'))
+        return queue
+    def get_kitchen_queue(self): return self._kitchen().open_orders()
+    def add_kitchen_order(self, order):
+        order = self._kitchen().add(order, self.backend)
+        self.publish('kitchen', id=order['id'], status=order['status'])
+        return order
+    def advance_kitchen_order(self, oid):
+        status = self._kitchen().advance(oid, self.backend)
+        if status: self.publish('kitchen', id=oid, status=status)
+        return status
+    def kitchen_metrics(self): return self._kitchen().metrics()
+    def new_kitchen_order_id(self): return self._kitchen().new_id()
+    def _tables(self):
+        store = get_table_store(self.backend_name)
+        store.load(self.backend, get_event_bus().external_version('tables'))
+        return store
+    def get_tables(self): return self._tables().snapshot()
+    def seat_table(self, tid, order_id=None):
+        state = self._tables().seat(tid, order_id, self.backend)
+        if state: self.publish('tables', id=tid, status='Occupied')
+        return state
+    def clear_table(self, tid):
+        session = self._tables().clear(tid, self.backend)
+        if session: self.publish('tables', id=tid, status='Empty')
+        return session
+    def update_table_status(self, tid, stat):
+        return self.seat_table(tid) if stat == 'Occupied' else self.clear_table(tid)
+    def table_turnover(self):
+        # Jam order terakhir selesai di dapur = batas "nunggu makanan" vs "makan"
+        return self._tables().turnover(self._kitchen().completion_times())
+    def table_utilization(self): return self._tables().utilization_by_hour()
+    def _ingredients(self):
+        store = get_ingredient_store(self.backend_name)
+        store.load(self.backend)
+        return store
+    def ingredient_levels(self): return self._ingredients().snapshot()
+    def recipes(self): return self._ingredients().recipes()
+    def save_ingredients(self, ingredients, recipes, base=None):
+        self._ingredients().replace(recipes, ingredients, self.backend, base)
+        self.publish('inventory')
+    def project_ingredients(self, grid, menu):
+        """Ingredient outlook for a demand grid (keyed by menu name) over its horizon"""
+        ids = menu.drop_duplicates('Menu').set_index('Menu')['ID'].reindex(grid['items']).fillna('')
+        return self._ingredients().project(ids.values, grid['qty'].sum(axis=1), grid['dates'])
+
+    # --- KONEKSI SQL MENTAH (CUMA ADA DI BACKEND SQLITE) ---
+    def get_connection(self):
+        return self.backend.get_connection()
 
 # Inisialisasi Database
 db_manager = DatabaseManager()
@@ -126,7 +1473,6 @@ db_manager = DatabaseManager()
 # ==========================================
 # 1. KONFIGURASI (TAMBAHKAN INI)
 # ==========================================
-CURRENT_DATE = datetime(2026, 1, 28)  #
 warnings.filterwarnings('ignore')
 st.set_page_config(
     page_title="FARIKHI OS: TITAN BUILD",
@@ -296,6 +1642,39 @@ inject_matrix_css()
 # ==========================================
 # 3. DATA SCIENCE ENGINE (ML & SYNTHETIC DATA)
 # ==========================================
+FORECAST_FEATURES = ['DayOfWeek', 'DayOfMonth', 'Month', 'IsWeekend', 'Lag_1', 'Rolling_Mean']
+FORECAST_SCHEMA = 2 # Naikkan kalau fitur/cara training forecaster berubah
+DEMAND_SCHEMA = 1 # Sama, buat model demand jam x hari x menu
+DEMAND_FEATURES = ['DayOfWeek', 'Hour', 'IsWeekend', 'MenuCode']
+DEMAND_GRID_DAYS = 7
+DEMAND_CACHE_SIZE = 8 # Grid (versi model x tanggal mulai) yang disimpan
+# Monte Carlo cashflow: path disimulasikan per chunk biar 1 juta path gak makan RAM sekaligus
+MC_DAYS = 30
+MC_PATH_OPTIONS = [1_000, 10_000, 100_000, 1_000_000]
+MC_CHUNK_PATHS = 50_000
+MC_FIXED_COST = 15_000_000 # Gaji, sewa ruko, listrik per BULAN (asumsi notebook)
+MC_VARIABLE_COST = 0.40 # HPP rata-rata dari omset
+MC_PAYDAY_DAYS = (25, 2) # Tanggal gajian: tgl 25 s/d tgl 2 bulan berikutnya
+MC_HIST_BINS = 60
+MC_CACHE_SIZE = 8
+# Price optimizer: elastisitas per menu dari histori (harga, qty) di ledger
+PRICE_PRIOR_ELASTICITY = 1.5 # "sensitivity" notebook, dipakai kalau harga item belum pernah berubah
+PRICE_ELASTICITY_BOUNDS = (0.2, 5.0)
+PRICE_MIN_OBS = 5 # Minimal (hari x harga) per item buat estimasi regresi
+PRICE_RANGE = (0.5, 2.0) # Kandidat harga: setengah s/d 2x harga sekarang
+PRICE_STEP = 1000
+PRICE_BASE_DAYS = 28 # Rata-rata qty harian dari 4 minggu terakhir = demand di harga sekarang
+PRICE_COST_FILE = 'menu_database.csv' # Kolom Menu, Harga, HPP
+# Surge pricing: jadwal harga (menu x jam x level antrian dapur) dihitung di muka
+SURGE_PEAK_UPLIFT = 0.20 # Kenaikan maksimum di jam paling ramai menu itu (dulu flat +20%)
+SURGE_BACKLOG_FREE = 3 # Order terbuka di dapur yang masih dianggap normal
+SURGE_BACKLOG_STEP = 3 # Tiap 3 order antri berikutnya -> naik satu level
+SURGE_BACKLOG_UPLIFT = 0.05 # Per level antrian
+SURGE_BACKLOG_LEVELS = 4 # Level 0..3
+SURGE_CAP = 1.5
+SURGE_ROUND = 500 # Harga surge dibulatkan ke atas kelipatan Rp 500
+SYNTH_PAYDAYS = [25, 26, 27, 28, 1, 2]
+
 class DataScienceCore:
     def __init__(self):
         self.scaler = StandardScaler()
@@ -308,8 +1687,8 @@ class DataScienceCore:
             'N01': 'S02 (Nachos)'
         }
         return rules.get(last_item_id, None)
-    def generate_historical_data(self, days=180):
-        """Generates realistic sales data for ML training"""
+    def generate_historical_data_legacy(self, days=180):
+        """Generates realistic sales data for ML training (row-by-row reference, used by the benchmark)"""
         dates = [datetime.now() - timedelta(days=x) for x in range(days)]
         data = []
         
@@ -350,65 +1729,981 @@ class DataScienceCore:
         
         return pd.DataFrame(data)
 
-    def train_sales_forecast_model(self, df):
-        """Trains a Random Forest Regressor to predict future sales"""
-        # Preprocessing
-        daily_sales = df.groupby('Date')['Total'].sum().reset_index()
-        daily_sales['DayOfWeek'] = daily_sales['Date'].dt.dayofweek
-        daily_sales['DayOfMonth'] = daily_sales['Date'].dt.day
-        daily_sales['Month'] = daily_sales['Date'].dt.month
-        daily_sales['IsWeekend'] = daily_sales['DayOfWeek'].apply(lambda x: 1 if x >= 5 else 0)
-        daily_sales['Lag_1'] = daily_sales['Total'].shift(1).fillna(0) # Simple lag feature
-        daily_sales['Rolling_Mean'] = daily_sales['Total'].rolling(window=7).mean().fillna(0)
+    def generate_historical_data(self, days=180, outlets=1, menu=None, seed=None, end_date=None,
+                                 weekend_boost=1.4, payday_boost=1.3, hour_weights=None, rng=None):
+        """Generates realistic sales data for ML training, fully vectorized with a seeded NumPy Generator.
+
+        Same model as the legacy loop (20-40 base orders/day, weekend & payday boosts, Poisson qty),
+        drawn for every outlet x day at once. `hour_weights` maps hour -> relative traffic (default flat 10-22).
+        """
+        rng = rng or np.random.default_rng(seed)
+        menu = menu or get_initial_menu()
+        end = pd.Timestamp(end_date or datetime.now()).normalize()
+        days_idx = pd.date_range(end=end, periods=days, freq='D')[::-1] # Urutan sama kayak versi loop: hari ini dulu
         
-        # Features & Target
-        features = ['DayOfWeek', 'DayOfMonth', 'Month', 'IsWeekend', 'Lag_1', 'Rolling_Mean']
-        X = daily_sales[features]
-        y = daily_sales['Total']
+        # 1. Jumlah order per (outlet, hari)
+        n_cells = outlets * days
+        day_of_cell = np.tile(np.arange(days), outlets)
+        base = rng.integers(20, 41, n_cells)
+        base = np.where(days_idx.dayofweek[day_of_cell] >= 5, (base * weekend_boost).astype(int), base)
+        base = np.where(np.isin(days_idx.day[day_of_cell], SYNTH_PAYDAYS), (base * payday_boost).astype(int), base)
+        n_orders = np.maximum(base + rng.integers(-5, 11, n_cells), 0)
         
-        # Split (Not strictly needed for demo, but good practice)
-        split = int(len(X) * 0.8)
-        X_train, X_test = X.iloc[:split], X.iloc[split:]
-        y_train, y_test = y.iloc[:split], y.iloc[split:]
-        
-        # Model
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
+        # 2. Semua order digambar sekaligus
+        total = int(n_orders.sum())
+        cell = np.repeat(np.arange(n_cells), n_orders)
+        item = rng.integers(0, len(menu), total)
+        qty = np.maximum(rng.poisson(1.5, total), 1)
+        if hour_weights:
+            hours = np.array(list(hour_weights.keys()))
+            p = np.array(list(hour_weights.values()), dtype=float)
+            hour = rng.choice(hours, total, p=p / p.sum())
+        else:
+            hour = rng.integers(10, 23, total)
+        minute = rng.integers(0, 60, total)
         
-        # Eval
-        score = model.score(X_test, y_test)
+        prices = np.array([m['Harga'] for m in menu], dtype=np.int64)
+        def cat(values, idx):
+            codes, uniques = pd.factorize(np.asarray(values))
+            return pd.Categorical.from_codes(codes[idx], categories=uniques)
+        return pd.DataFrame({
+            'Date': days_idx.values[day_of_cell[cell]] + (hour * 60 + minute).astype('timedelta64[m]'),
+            'Outlet': pd.Categorical.from_codes(cell // days, categories=[f"OUT-{i + 1:02d}" for i in range(outlets)]),
+            'ItemID': cat([m['ID'] for m in menu], item),
+            'ItemName': cat([m['Menu'] for m in menu], item),
+            'Category': cat([m['Kategori'] for m in menu], item),
+            'Price': prices[item],
+            'Qty': qty,
+            'Total': prices[item] * qty,
+            'Hour': hour,
+            'CustomerType': pd.Categorical.from_codes(rng.integers(0, 3, total), categories=['Member', 'Regular', 'New']),
+            'Payment': pd.Categorical.from_codes(rng.integers(0, 4, total), categories=['Cash', 'QRIS', 'Debit', 'Crypto'])
+        })
+
+    def stream_historical_data(self, path, days=365, outlets=1, chunk_days=30, seed=None, **kwargs):
+        """Writes synthetic history to CSV or Parquet (by extension) in chunks of `chunk_days`, returns rows written.
+
+        Memory stays flat regardless of size, so years x many outlets can be generated for load tests.
+        """
+        rng = np.random.default_rng(seed)
+        end = pd.Timestamp(kwargs.pop('end_date', None) or datetime.now()).normalize()
+        parquet = path.endswith('.parquet')
+        if parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Export Parquet butuh pyarrow: pip install pyarrow")
         
-        return model, daily_sales
+        writer, rows = None, 0
+        try:
+            # Chunk paling lama dulu biar file urut naik per tanggal
+            for start in range(days, 0, -chunk_days):
+                n = min(chunk_days, start)
+                chunk = self.generate_historical_data(days=n, outlets=outlets, end_date=end - timedelta(days=start - n), rng=rng, **kwargs)
+                chunk = chunk.sort_values('Date', kind='stable')
+                if parquet:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None: writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                else:
+                    chunk.to_csv(path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+                rows += len(chunk)
+        finally:
+            if writer is not None: writer.close()
+        return rows
+
+    def benchmark_generators(self, days=180, seed=42):
+        """Times the legacy row loop against the vectorized generator on the same horizon"""
+        t0 = time.perf_counter()
+        legacy = self.generate_historical_data_legacy(days)
+        t1 = time.perf_counter()
+        fast = self.generate_historical_data(days, seed=seed)
+        t2 = time.perf_counter()
+        return {
+            'days': days,
+            'legacy_rows': len(legacy), 'legacy_s': t1 - t0,
+            'vectorized_rows': len(fast), 'vectorized_s': t2 - t1,
+            'speedup': (t1 - t0) / max(t2 - t1, 1e-9)
+        }
 
-    def perform_customer_segmentation(self, df):
-        """Performs K-Means Clustering for RFM Analysis"""
-        # Create Dummy Customer IDs for the historical data
-        df['CustomerID'] = [f"CUST-{random.randint(1000, 5000)}" for _ in range(len(df))]
+    def build_daily_sales(self, df):
+        """Turns the ledger (or an already rolled-up daily Series) into daily totals with calendar, lag and rolling features"""
+        # Preprocessing (Date dipotong ke hari, hari tanpa transaksi = 0)
+        daily = df if isinstance(df, pd.Series) else df.groupby(df['Date'].dt.normalize())['Total'].sum()
+        daily = daily.asfreq('D', fill_value=0)
+        daily_sales = daily.rename_axis('Date').reset_index()
+        daily_sales = self.add_calendar_features(daily_sales)
         
-        # RFM Aggregation
-        snapshot_date = df['Date'].max() + timedelta(days=1)
-        rfm = df.groupby('CustomerID').agg({
-            'Date': lambda x: (snapshot_date - x.max()).days, # Recency
-            'ItemID': 'count', # Frequency
-            'Total': 'sum' # Monetary
-        }).rename(columns={'Date': 'Recency', 'ItemID': 'Frequency', 'Total': 'Monetary'})
+        # Lag & rolling cuma lihat hari SEBELUMNYA (kalau ikut hari ini = bocoran target)
+        prev = daily_sales['Total'].shift(1)
+        daily_sales['Lag_1'] = prev.fillna(0)
+        daily_sales['Rolling_Mean'] = prev.rolling(window=7, min_periods=1).mean().fillna(0)
+        return daily_sales
+
+    @staticmethod
+    def add_calendar_features(frame):
+        dates = frame['Date'].dt
+        frame['DayOfWeek'] = dates.dayofweek
+        frame['DayOfMonth'] = dates.day
+        frame['Month'] = dates.month
+        frame['IsWeekend'] = (frame['DayOfWeek'] >= 5).astype(int)
+        return frame
+
+    def _fit_forecaster(self, daily_sales):
+        model = RandomForestRegressor(n_estimators=100, random_state=42)
+        model.fit(daily_sales[FORECAST_FEATURES].values, daily_sales['Total'].values)
+        return model
+
+    def train_sales_forecast_model(self, df):
+        """Trains a Random Forest Regressor to predict future sales, returns `(model, metrics)`"""
+        daily_sales = self.build_daily_sales(df)
         
-        # Normalization
-        scaler = StandardScaler()
-        rfm_scaled = scaler.fit_transform(rfm)
+        # Eval dulu (walk-forward), baru model final dilatih pakai semua data
+        metrics = self.backtest_forecast(daily_sales)
+        model = self._fit_forecaster(daily_sales)
+        return model, metrics
+
+    def backtest_forecast(self, daily_sales, folds=4, horizon=7):
+        """Walk-forward backtest: refit on an expanding window, forecast the next block recursively"""
+        actual, predicted = [], []
+        n = len(daily_sales)
+        for k in range(folds, 0, -1):
+            cut = n - k * horizon
+            if cut < 14: continue # Minimal 2 minggu data buat training
+            train = daily_sales.iloc[:cut]
+            _, preds = self.forecast_recursive(self._fit_forecaster(train), train['Total'].values, daily_sales['Date'].iloc[cut], horizon)
+            actual.append(daily_sales['Total'].values[cut:cut + horizon])
+            predicted.append(preds)
         
-        # K-Means
-        kmeans = KMeans(n_clusters=3, random_state=42)
-        rfm['Cluster'] = kmeans.fit_predict(rfm_scaled)
+        if not actual:
+            return {'mae': float('nan'), 'r2': float('nan'), 'resid_lo': 0.0, 'resid_hi': 0.0, 'horizon': horizon, 'test_days': 0}
+        actual, predicted = np.concatenate(actual), np.concatenate(predicted)
+        resid = actual - predicted
+        return {
+            'mae': float(mean_absolute_error(actual, predicted)),
+            'r2': float(r2_score(actual, predicted)),
+            'resid_lo': float(np.percentile(resid, 10)), # Interval prediksi 80% dari error backtest
+            'resid_hi': float(np.percentile(resid, 90)),
+            'horizon': horizon,
+            'test_days': len(actual)
+        }
+
+    @staticmethod
+    def compile_forest(model):
+        """Packs every tree of a fitted forest into padded NumPy arrays for fast single-row predicts"""
+        trees = [e.tree_ for e in model.estimators_]
+        width = max(t.node_count for t in trees)
+        forest = {
+            'feature': np.full((len(trees), width), -2, dtype=np.intp),
+            'threshold': np.zeros((len(trees), width)),
+            'left': np.full((len(trees), width), -1, dtype=np.intp),
+            'right': np.full((len(trees), width), -1, dtype=np.intp),
+            'value': np.zeros((len(trees), width)),
+            'depth': max(t.max_depth for t in trees)
+        }
+        for i, t in enumerate(trees):
+            n = t.node_count
+            forest['feature'][i, :n] = t.feature
+            forest['threshold'][i, :n] = t.threshold
+            forest['left'][i, :n] = t.children_left
+            forest['right'][i, :n] = t.children_right
+            forest['value'][i, :n] = t.value[:, 0, 0]
+        return forest
+
+    @staticmethod
+    def predict_forest_row(forest, x):
+        # Semua pohon ditelusuri barengan, satu level per iterasi
+        rows = np.arange(forest['feature'].shape[0])
+        node = np.zeros(len(rows), dtype=np.intp)
+        x = x.astype(np.float32) # sklearn bandingin fitur dalam float32
+        for _ in range(forest['depth']):
+            feat = forest['feature'][rows, node]
+            leaf = feat < 0
+            if leaf.all(): break
+            go_left = x[np.where(leaf, 0, feat)] <= forest['threshold'][rows, node]
+            node = np.where(leaf, node, np.where(go_left, forest['left'][rows, node], forest['right'][rows, node]))
+        return forest['value'][rows, node].mean()
+
+    def forecast_recursive(self, model, history, start_date, horizon):
+        """Rolls the model forward day by day, feeding each prediction into the next day's lag/rolling features"""
+        dates = pd.date_range(start_date, periods=horizon, freq='D')
+        calendar = np.column_stack([dates.dayofweek, dates.day, dates.month, dates.dayofweek >= 5]).astype(float)
+        forest = self.compile_forest(model)
         
-        # Labeling
-        rfm['Segment'] = rfm['Cluster'].map({
-            0: 'Bronze (Casual)',
-            1: 'Silver (Loyal)',
-            2: 'Gold (Whales)' 
-        }) # Note: Mapping might need adjustment based on cluster centers, simplified here
+        window = np.zeros(7 + horizon)
+        recent = np.asarray(history, dtype=float)[-7:]
+        window[7 - len(recent):7] = recent
+        filled = len(recent)
+        preds = np.empty(horizon)
+        x = np.empty(len(FORECAST_FEATURES))
+        for i in range(horizon):
+            x[:4] = calendar[i]
+            x[4] = window[6 + i] # Lag_1 = hari sebelumnya (asli atau hasil prediksi)
+            x[5] = window[7 + i - min(filled, 7):7 + i].mean() if filled else 0.0
+            preds[i] = max(self.predict_forest_row(forest, x), 0.0)
+            window[7 + i] = preds[i]
+            filled += 1
+        return dates, preds
+
+    def forecast_sales(self, model, daily_sales, metrics, horizon=7):
+        """Returns the recursive forecast with an 80% interval widened by sqrt(h / backtest horizon)"""
+        dates, preds = self.forecast_recursive(model, daily_sales['Total'].values, daily_sales['Date'].max() + timedelta(days=1), horizon)
+        widen = np.sqrt(np.maximum(np.arange(1, horizon + 1) / metrics.get('horizon', 7), 1.0))
+        return pd.DataFrame({
+            'Date': dates,
+            'Predicted_Sales': preds,
+            'Lower': np.maximum(preds + metrics.get('resid_lo', 0.0) * widen, 0),
+            'Upper': preds + metrics.get('resid_hi', 0.0) * widen
+        })
+
+    def train_demand_model(self, hour_items):
+        """Hour x weekday x menu demand model (cafe.ipynb `train_smart_ai`), returns `(model, meta)`.
+
+        `hour_items` is the (Date, Hour, ItemName) rollup. Target = average portions per calendar day,
+        with zero cells filled in, so the grid reads directly as "porsi per jam".
+        """
+        frame = hour_items.reset_index()
+        dow = frame['Date'].dt.dayofweek.rename('DayOfWeek')
+        days_per_dow = frame['Date'].drop_duplicates().dt.dayofweek.value_counts() # Berapa hari Senin, Selasa, dst di history
+        qty = frame.groupby([dow, frame['Hour'], frame['ItemName']])['Qty'].sum()
+        hours = sorted(frame['Hour'].unique().tolist())
+        items = sorted(frame['ItemName'].unique().tolist())
+        full = pd.MultiIndex.from_product([sorted(days_per_dow.index), hours, items], names=['DayOfWeek', 'Hour', 'ItemName'])
+        grid = (qty.reindex(full, fill_value=0) / days_per_dow.reindex(full.get_level_values('DayOfWeek')).values).reset_index(name='Qty')
         
-        return rfm
+        menu_map = {name: i for i, name in enumerate(items)}
+        X = np.column_stack([grid['DayOfWeek'], grid['Hour'], grid['DayOfWeek'] >= 5, grid['ItemName'].map(menu_map)]).astype(np.float32)
+        model = RandomForestRegressor(n_estimators=100, min_samples_leaf=2, random_state=42, n_jobs=-1)
+        model.fit(X, grid['Qty'].values)
+        return model, {'menu_map': menu_map, 'hours': hours, 'cells': len(grid)}
+
+    def predict_demand_grid(self, model, menu_map, start_date, days=DEMAND_GRID_DAYS, hours=range(10, 23)):
+        """Predicts every (day x hour x menu) cell with ONE `model.predict` call.
+
+        Returns `(dates, qty)` where `qty` has shape (days, hours, items) in `menu_map` order.
+        """
+        dates = pd.date_range(pd.Timestamp(start_date).normalize(), periods=days, freq='D')
+        dow, hour, code = np.meshgrid(np.asarray(dates.dayofweek), np.asarray(hours), np.fromiter(menu_map.values(), dtype=int), indexing='ij')
+        X = np.column_stack([dow.ravel(), hour.ravel(), dow.ravel() >= 5, code.ravel()]).astype(np.float32)
+        return dates, np.maximum(model.predict(X), 0).reshape(dow.shape)
+
+    @staticmethod
+    def is_payday(dates):
+        day = pd.DatetimeIndex(dates).day
+        return (day >= MC_PAYDAY_DAYS[0]) | (day <= MC_PAYDAY_DAYS[1])
+
+    def seasonal_factors(self, daily):
+        """Weekday and payday multipliers estimated from daily totals (1.0 = an ordinary day)"""
+        overall = daily.mean()
+        if not overall: return pd.Series(1.0, index=range(7)), 1.0
+        weekday = (daily.groupby(daily.index.dayofweek).mean() / overall).reindex(range(7), fill_value=1.0)
+        adjusted = daily / weekday.values[daily.index.dayofweek]
+        payday = self.is_payday(daily.index)
+        payday_factor = adjusted[payday].mean() / adjusted[~payday].mean() if payday.any() and (~payday).any() and adjusted[~payday].mean() else 1.0
+        return weekday, float(payday_factor)
+
+    def simulate_cashflow(self, daily, start_date, days=MC_DAYS, paths=10_000, method='bootstrap', seasonal=True,
+                          fixed_cost=MC_FIXED_COST, variable_cost=MC_VARIABLE_COST, seed=None, chunk_paths=MC_CHUNK_PATHS):
+        """Monte Carlo revenue for the next `days`, drawn as (paths x days) matrices chunk by chunk.
+
+        `method='bootstrap'` resamples real (de-seasonalised) days from the ledger, `'normal'` draws
+        from a normal fitted to them; either way the weekday/payday factors are multiplied back in.
+        `fixed_cost` is per month and is scaled to the horizon before the coverage check.
+        Returns risk stats plus a histogram of monthly totals and a P5/P50/P95 fan of the running total.
+        """
+        daily = daily.asfreq('D', fill_value=0).astype(float)
+        dates = pd.date_range(pd.Timestamp(start_date).normalize(), periods=days, freq='D')
+        if seasonal:
+            weekday, payday_factor = self.seasonal_factors(daily)
+            past = weekday.values[daily.index.dayofweek] * np.where(self.is_payday(daily.index), payday_factor, 1.0)
+            future = weekday.values[dates.dayofweek] * np.where(self.is_payday(dates), payday_factor, 1.0)
+        else:
+            payday_factor, past, future = 1.0, np.ones(len(daily)), np.ones(days)
+        base = daily.values / np.where(past > 0, past, 1.0)
+        mu, sigma = base.mean(), base.std()
+
+        rng = np.random.default_rng(seed)
+        totals = np.empty(paths)
+        fan = None
+        for start in range(0, paths, chunk_paths):
+            n = min(chunk_paths, paths - start)
+            if method == 'bootstrap': draws = base[rng.integers(0, len(base), size=(n, days))]
+            else: draws = np.maximum(rng.normal(mu, sigma, size=(n, days)), 0)
+            draws *= future
+            totals[start:start + n] = draws.sum(axis=1)
+            # Fan chart cukup dari chunk pertama (<= chunk_paths path), bukan simpan semua matrix
+            if fan is None: fan = np.percentile(draws.cumsum(axis=1), [5, 50, 95], axis=0)
+
+        p5, p50, p95 = np.percentile(totals, [5, 50, 95])
+        margin = totals * (1 - variable_cost)
+        fixed_cost = fixed_cost * days / 30 # Biaya tetap bulanan -> sepanjang horizon
+        counts, edges = np.histogram(totals, bins=MC_HIST_BINS)
+        return {
+            'dates': dates, 'paths': paths, 'method': method, 'payday_factor': payday_factor,
+            'mean': float(totals.mean()), 'p5': float(p5), 'p50': float(p50), 'p95': float(p95),
+            'var95': float(totals.mean() - p5), # Omset yang bisa "hilang" dari ekspektasi di 95% kasus
+            'es95': float(totals[totals <= p5].mean()), # Rata-rata 5% skenario terburuk
+            'p_cover': float((margin >= fixed_cost).mean()),
+            'fixed_cost': fixed_cost,
+            'breakeven': fixed_cost / (1 - variable_cost) if variable_cost < 1 else float('inf'),
+            'hist': (counts, edges), 'fan': fan
+        }
+
+    def estimate_price_elasticity(self, item_prices):
+        """Per-item elasticity as the log-log slope of qty on price, from (Date, ItemName, Price) rollups.
+
+        Price there is the menu price (surge-priced sales count under their base price), so the fit
+        only sees deliberate menu price changes, not peak-hour surges.
+
+        All items are fitted at once from grouped sums; items whose price never moved (or with too
+        few observations) fall back to PRICE_PRIOR_ELASTICITY.
+        """
+        t = item_prices.reset_index()
+        t = t[(t['Qty'] > 0) & (t['Price'] > 0)]
+        x, y = np.log(t['Price'].to_numpy(dtype=float)), np.log(t['Qty'].to_numpy(dtype=float))
+        sums = pd.DataFrame({'n': 1, 'x': x, 'y': y, 'xx': x * x, 'xy': x * y}, index=t.index).groupby(t['ItemName']).sum()
+        mx, my = sums['x'] / sums['n'], sums['y'] / sums['n']
+        var = sums['xx'] / sums['n'] - mx * mx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (sums['xy'] / sums['n'] - mx * my) / var
+        fitted = (sums['n'] >= PRICE_MIN_OBS) & (var > 1e-4) & np.isfinite(slope)
+        elasticity = (-slope).where(fitted, PRICE_PRIOR_ELASTICITY).clip(*PRICE_ELASTICITY_BOUNDS)
+        return pd.DataFrame({'Elasticity': elasticity, 'Obs': sums['n'], 'Source': np.where(fitted, 'ledger', 'prior')})
+
+    def optimize_prices(self, prices, costs, base_qty, elasticity):
+        """Evaluates every candidate price of every item as one (items x candidates) broadcast.
+
+        Demand follows the notebook's linear rule: +1% price -> -elasticity% qty. Returns
+        `(best_price, candidates, profit)`; invalid candidate cells hold -inf profit.
+        """
+        p0 = np.asarray(prices, dtype=float)[:, None]
+        start = np.floor(p0 * PRICE_RANGE[0])
+        steps = int(np.ceil((p0 * PRICE_RANGE[1] - start).max() / PRICE_STEP)) if len(p0) else 0
+        candidates = start + PRICE_STEP * np.arange(steps)
+        demand = np.asarray(base_qty, dtype=float)[:, None] * np.maximum(0, 1 - np.asarray(elasticity, dtype=float)[:, None] * (candidates - p0) / p0)
+        profit = np.where(candidates < p0 * PRICE_RANGE[1], (candidates - np.asarray(costs, dtype=float)[:, None]) * demand, -np.inf)
+        return candidates[np.arange(len(p0)), profit.argmax(axis=1)] if steps else p0[:, 0], candidates, profit
+
+    def perform_customer_segmentation(self, df):
+        """RFM segmentation from the shared, incrementally updated customer table (df is not modified)"""
+        rfm_store = get_customer_rfm()
+        rfm_store.sync(df)
+        return rfm_store.segments()
+
+# --- MODEL REGISTRY (MODEL DISIMPAN KE DISK, TRAINING ULANG DI BACKGROUND) ---
+MODEL_DIR = 'models'
+MODEL_KEEP_VERSIONS = 3
+
+class ModelRegistry:
+    """Versioned on-disk store of fitted models, keyed by a fingerprint of their training data"""
+    def __init__(self, path=MODEL_DIR):
+        self.path = path
+        self.models = {}
+        self.training = set()
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(df):
+        daily = df if isinstance(df, pd.Series) else df.groupby(df['Date'].dt.normalize())['Total'].sum()
+        digest = hashlib.sha1(pd.util.hash_pandas_object(daily).values.tobytes()).hexdigest()[:12]
+        return {'rows': len(df), 'max_date': str(daily.index.max().date()), 'hash': digest}
+
+    def _files(self, name):
+        # Format file: <name>-v<versi>.pkl, diurutkan dari versi paling lama
+        files = [f for f in os.listdir(self.path) if f.startswith(name + '-v') and f.endswith('.pkl')]
+        return sorted(files, key=lambda f: int(f[len(name) + 2:-4]))
+
+    def load(self, name):
+        """Returns the newest package for `name` (memory first, then disk), or None"""
+        with self.lock:
+            if name not in self.models:
+                files = self._files(name)
+                if not files: return None
+                self.models[name] = joblib.load(os.path.join(self.path, files[-1]))
+            return self.models[name]
+
+    def save(self, name, model, fp, meta=None, schema=1):
+        current = self.load(name)
+        package = {
+            'model': model,
+            'fingerprint': fp,
+            'schema': schema,
+            'meta': meta or {},
+            'version': (current['version'] + 1) if current else 1,
+            'trained_at': datetime.now().isoformat(timespec='seconds')
+        }
+        fname = os.path.join(self.path, f"{name}-v{package['version']}.pkl")
+        joblib.dump(package, fname + '.tmp')
+        os.replace(fname + '.tmp', fname)
+        with self.lock:
+            self.models[name] = package
+            for old in self._files(name)[:-MODEL_KEEP_VERSIONS]:
+                os.remove(os.path.join(self.path, old))
+        return package
+
+    def needs_retrain(self, package, fp, schema=1):
+        # Retrain kalau ada hari baru, history berubah total (baris berkurang), atau cara training-nya berubah
+        old = package['fingerprint']
+        return fp['max_date'] > old['max_date'] or fp['rows'] < old['rows'] or package.get('schema', 1) != schema
+
+    def is_training(self, name):
+        return name in self.training
+
+    def get_or_train(self, name, df, train_fn, schema=1):
+        """Serves the last good model; retrains in a background thread when new days arrive.
+
+        `train_fn(df)` must return `(model, meta)`. Only the very first model is trained inline.
+        Bump `schema` whenever `train_fn` changes so stale packages on disk get replaced.
+        """
+        fp = self.fingerprint(df)
+        package = self.load(name)
+        if package is None:
+            model, meta = train_fn(df)
+            return self.save(name, model, fp, meta, schema)
+        if self.needs_retrain(package, fp, schema):
+            with self.lock:
+                if name in self.training: return package
+                self.training.add(name)
+            threading.Thread(target=self._retrain, args=(name, df, fp, train_fn, schema), daemon=True).start()
+        return package
+
+    def _retrain(self, name, df, fp, train_fn, schema):
+        try:
+            model, meta = train_fn(df)
+            self.save(name, model, fp, meta, schema)
+        except Exception:
+            pass # Gagal training: tetap pakai model lama
+        finally:
+            with self.lock: self.training.discard(name)
+
+@st.cache_resource
+def get_model_registry():
+    return ModelRegistry()
+
+class DemandGridCache:
+    """Predicted (day x hour x menu) demand grids, cached per model version and start date"""
+    def __init__(self, size=DEMAND_CACHE_SIZE):
+        self.grids = OrderedDict()
+        self.size = size
+        self.lock = threading.Lock()
+
+    def get(self, package, ds, start_date, days=DEMAND_GRID_DAYS):
+        key = (package['version'], pd.Timestamp(start_date).normalize(), days)
+        with self.lock:
+            if key in self.grids:
+                self.grids.move_to_end(key)
+                return self.grids[key]
+            meta = package['meta']
+            dates, qty = ds.predict_demand_grid(package['model'], meta['menu_map'], start_date, days, meta['hours'])
+            self.grids[key] = {'dates': dates, 'hours': meta['hours'], 'items': list(meta['menu_map']), 'qty': qty}
+            while len(self.grids) > self.size: self.grids.popitem(last=False)
+            return self.grids[key]
+
+@st.cache_resource
+def get_demand_grid_cache():
+    return DemandGridCache()
+
+class RiskSimulationCache:
+    """Monte Carlo results cached per (daily totals fingerprint, start date, parameters)"""
+    def __init__(self, size=MC_CACHE_SIZE):
+        self.results = OrderedDict()
+        self.size = size
+        self.lock = threading.Lock()
+
+    def get(self, ds, daily, start_date, **params):
+        key = (ModelRegistry.fingerprint(daily)['hash'], pd.Timestamp(start_date).normalize(), tuple(sorted(params.items())))
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        # Simulasi di luar lock: session lain tetap bisa baca hasil yang sudah ada
+        result = ds.simulate_cashflow(daily, start_date, seed=42, **params)
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.size: self.results.popitem(last=False)
+        return result
+
+@st.cache_resource
+def get_risk_cache():
+    return RiskSimulationCache()
+
+def load_menu_costs(menu, path=PRICE_COST_FILE):
+    """HPP per menu row from the cost sheet; unknown menus get the sheet's median HPP/price ratio"""
+    try:
+        sheet = pd.read_csv(path, usecols=['Menu', 'Harga', 'HPP'])
+        ratio = float((sheet['HPP'] / sheet['Harga']).median())
+        known = sheet.drop_duplicates('Menu').set_index('Menu')['HPP']
+    except (OSError, ValueError):
+        ratio, known = MC_VARIABLE_COST, pd.Series(dtype=float)
+    costs = menu['Menu'].map(known)
+    return costs.fillna(menu['Harga'] * ratio).to_numpy(dtype=float)
+
+class PriceOptimizer:
+    """Optimal price table for the whole menu, recomputed only when the rollups or the menu change"""
+    def __init__(self):
+        self.key = None
+        self.result = None
+        self.lock = threading.Lock()
+
+    def get(self, ds, rollups, menu):
+        key = (rollups.version, tuple(menu['ID']), tuple(menu['Harga']))
+        with self.lock:
+            if key == self.key: return self.result
+        elasticity = ds.estimate_price_elasticity(rollups.table('daily_item_prices'))
+        daily_items = rollups.table('daily_items')
+        dates = daily_items.index.get_level_values('Date')
+        recent = daily_items[dates > dates.max() - timedelta(days=PRICE_BASE_DAYS)] if len(daily_items) else daily_items
+        base_qty = recent['Qty'].groupby(level='ItemName').sum() / PRICE_BASE_DAYS
+
+        fit = elasticity.reindex(menu['Menu'])
+        e = fit['Elasticity'].fillna(PRICE_PRIOR_ELASTICITY).to_numpy()
+        q0 = base_qty.reindex(menu['Menu']).fillna(0).to_numpy()
+        prices, costs = menu['Harga'].to_numpy(dtype=float), load_menu_costs(menu)
+        best, candidates, profit = ds.optimize_prices(prices, costs, q0, e)
+        best = np.where(q0 > 0, best, prices) # Menu tanpa penjualan: gak ada dasar buat geser harga
+        table = pd.DataFrame({
+            'Menu': menu['Menu'].values, 'Harga': prices, 'HPP': costs, 'Elasticity': e.round(2),
+            'Source': fit['Source'].fillna('prior').values, 'QtyPerDay': q0.round(1), 'Optimal': best,
+            'Multiplier': best / prices, 'ProfitNow': (prices - costs) * q0,
+            'ProfitOptimal': np.where(q0 > 0, profit.max(axis=1), 0)
+        }, index=menu['ID'].values)
+        result = {'table': table, 'candidates': candidates, 'profit': profit}
+        with self.lock:
+            self.key, self.result = key, result
+        return result
+
+@st.cache_resource
+def get_price_optimizer():
+    return PriceOptimizer()
+
+class SurgeSchedule:
+    """Precomputed surge prices for every (menu, hour, kitchen backlog level); lookups are one array read"""
+    def __init__(self):
+        self.key = None
+        self.rows = {} # ID menu -> baris tabel harga
+        self.prices = np.zeros((0, 24, SURGE_BACKLOG_LEVELS), dtype=np.int64)
+        self.base = np.zeros(0, dtype=np.int64)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def backlog_level(open_orders):
+        return int(min(max(open_orders - SURGE_BACKLOG_FREE, 0) // SURGE_BACKLOG_STEP, SURGE_BACKLOG_LEVELS - 1))
+
+    def refresh(self, ds, rollups, menu):
+        """Rebuilds the price table when the rollups or menu prices changed; returns self"""
+        key = (rollups.version, tuple(menu['ID']), tuple(menu['Harga']))
+        with self.lock:
+            if key == self.key: return self
+        pricing = get_price_optimizer().get(ds, rollups, menu)['table']
+
+        # Intensitas jam: rata-rata qty per jam dibagi rata-rata jam buka menu itu (1.0 = jam biasa)
+        hourly = rollups.table('daily_hour_items')['Qty'].groupby(level=['ItemName', 'Hour']).sum().unstack(fill_value=0)
+        hourly = hourly.reindex(index=menu['Menu'], columns=range(24), fill_value=0).to_numpy(dtype=float)
+        open_hours = np.maximum((hourly > 0).sum(axis=1, keepdims=True), 1)
+        intensity = hourly / np.maximum(hourly.sum(axis=1, keepdims=True) / open_hours, 1e-9)
+        peak = intensity.max(axis=1, keepdims=True)
+        heat = np.clip((intensity - 1) / np.where(peak > 1, peak - 1, np.inf), 0, 1)
+
+        # Menu yang lebih sensitif harga dari prior dapat surge lebih kecil
+        damp = np.clip(PRICE_PRIOR_ELASTICITY / pricing['Elasticity'].to_numpy(), 0, 1)[:, None]
+        item_hour = pricing['Multiplier'].clip(lower=1.0).to_numpy()[:, None] * (1 + SURGE_PEAK_UPLIFT * heat * damp)
+        multiplier = np.minimum(item_hour[:, :, None] * (1 + SURGE_BACKLOG_UPLIFT * np.arange(SURGE_BACKLOG_LEVELS)), SURGE_CAP)
+
+        base = menu['Harga'].to_numpy(dtype=np.int64)
+        surged = np.ceil(base[:, None, None] * multiplier / SURGE_ROUND) * SURGE_ROUND
+        prices = np.where(multiplier > 1, surged, base[:, None, None]).astype(np.int64)
+        with self.lock:
+            self.rows = {item_id: i for i, item_id in enumerate(menu['ID'])}
+            self.prices, self.base, self.key = prices, base, key
+        return self
+
+    def price(self, item_id, base_price, hour, level):
+        row = self.rows.get(item_id)
+        return int(self.prices[row, hour, level]) if row is not None else int(base_price)
+
+    def multipliers(self, hour, level):
+        """Current multiplier per menu ID"""
+        with self.lock:
+            return pd.Series(self.prices[:, hour, level] / np.maximum(self.base, 1), index=list(self.rows))
+
+@st.cache_resource
+def get_surge_schedule():
+    return SurgeSchedule()
+
+# --- RFM PELANGGAN (UPDATE INKREMENTAL + SEGMEN DI-CACHE) ---
+RFM_REFIT_SECONDS = 6 * 3600 # Refit penuh cluster tiap 6 jam, di antaranya cuma partial update
+SEGMENT_LABELS = ['Bronze (Casual)', 'Silver (Loyal)', 'Gold (Whales)']
+
+def normalize_customer_key(raw):
+    """Canonical customer key from POS input: phone numbers keep digits only, member ids are upper-cased"""
+    key = str(raw or '').strip().upper()
+    # Nomor HP: isinya cuma angka + pemisah (spasi, -, +, titik, kurung) -> simpan digitnya saja
+    if re.fullmatch(r'[\d\s\-+().]*\d[\d\s\-+().]*', key): return re.sub(r'\D', '', key)
+    return key.replace(' ', '').replace('-', '')
+
+class CustomerRFM:
+    """RFM table kept up to date from the ledger tail, segmented by cached MiniBatchKMeans centers"""
+    def __init__(self, n_clusters=3, refit_every=RFM_REFIT_SECONDS):
+        self.n_clusters = n_clusters
+        self.refit_every = refit_every
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.table = pd.DataFrame({'LastPurchase': pd.Series(dtype='datetime64[ns]'),
+                                   'Frequency': pd.Series(dtype='int64'),
+                                   'Monetary': pd.Series(dtype='int64')})
+        self.cursor = LedgerCursor() # Baris ledger yang sudah diserap (+ kunci baris terakhirnya)
+        self.snapshot_date = None
+        self.scaler = None
+        self.kmeans = None
+        self.label_map = {}
+        self.fitted_at = 0.0
+
+    def sync(self, ledger):
+        """Absorbs ledger rows added since the last call; rebuilds when the ledger was replaced"""
+        with self.lock:
+            tail = self.cursor.tail(ledger)
+            if tail is None: # Ledger diganti (reload / import / ganti backend), bukan cuma nambah -> bangun ulang
+                self.reset()
+                tail = ledger
+            self.cursor.advance(ledger)
+            if tail.empty or 'CustomerID' not in tail.columns: return
+            self.snapshot_date = tail['Date'].max().normalize() + timedelta(days=1)
+            
+            keys = tail['CustomerID'].fillna('').astype(str)
+            tail = tail[keys != '']
+            if tail.empty: return
+            batch = tail.groupby(keys[keys != ''], observed=True).agg(
+                LastPurchase=('Date', 'max'), Frequency=('Total', 'size'), Monetary=('Total', 'sum'))
+            
+            # Gabung ke tabel lama: last = max, frequency & monetary = dijumlah
+            merged = self.table.reindex(self.table.index.union(batch.index))
+            new = batch.reindex(merged.index)
+            # Max per baris yang ngabaikan NaT (pelanggan yang gak ada di batch ini tetap pakai tanggal lamanya)
+            merged['LastPurchase'] = pd.concat([merged['LastPurchase'], new['LastPurchase']], axis=1).max(axis=1)
+            merged['Frequency'] = merged['Frequency'].fillna(0).astype('int64') + new['Frequency'].fillna(0).astype('int64')
+            merged['Monetary'] = merged['Monetary'].fillna(0).astype('int64') + new['Monetary'].fillna(0).astype('int64')
+            self.table = merged
+            
+            # Partial update: cuma pelanggan yang berubah yang nge-geser center cluster
+            if self.kmeans is not None:
+                self.kmeans.partial_fit(self.scaler.transform(self._features(batch.index)))
+
+    def _features(self, index=None):
+        t = self.table if index is None else self.table.loc[index]
+        recency = (self.snapshot_date - t['LastPurchase']).dt.days
+        return np.column_stack([recency, t['Frequency'], t['Monetary']]).astype(float)
+
+    def _refit(self):
+        X = self._features()
+        self.scaler = StandardScaler().fit(X)
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=42, n_init=3, batch_size=1024)
+        self.kmeans.fit(self.scaler.transform(X))
+        self.fitted_at = time.time()
+
+    def segments(self, force_refit=False):
+        """Returns the RFM frame with Cluster and Segment columns (refits only when the schedule says so)"""
+        with self.lock:
+            rfm = self.table.copy()
+            if len(rfm) < self.n_clusters: return None
+            if force_refit or self.kmeans is None or time.time() - self.fitted_at > self.refit_every:
+                self._refit()
+            X = self.scaler.transform(self._features())
+            rfm['Recency'] = (self.snapshot_date - rfm['LastPurchase']).dt.days
+            rfm['Cluster'] = self.kmeans.predict(X)
+            
+            # Label dari center: Monetary paling kecil = Bronze, paling gede = Gold
+            order = np.argsort(self.kmeans.cluster_centers_[:, 2])
+            labels = SEGMENT_LABELS if self.n_clusters == len(SEGMENT_LABELS) else [f"Segment {i + 1}" for i in range(self.n_clusters)]
+            rfm['Segment'] = rfm['Cluster'].map({c: labels[rank] for rank, c in enumerate(order)})
+            return rfm[['Recency', 'Frequency', 'Monetary', 'LastPurchase', 'Cluster', 'Segment']]
+
+@st.cache_resource
+def get_customer_rfm():
+    return CustomerRFM()
+
+# --- ROLLUP PENJUALAN (AGREGAT HARIAN / JAM / ITEM / KATEGORI) ---
+class SalesRollups:
+    """Per-day, per-hour, per-item and per-category totals, updated from the ledger tail"""
+    DIMENSIONS = {'daily': ['Date'], 'hourly': ['Hour'], 'items': ['ItemName'], 'categories': ['Category'],
+                  'daily_items': ['Date', 'ItemName'], 'daily_payments': ['Date', 'Payment'],
+                  'daily_hours': ['Date', 'Hour'], 'daily_categories': ['Date', 'Category'],
+                  'daily_hour_items': ['Date', 'Hour', 'ItemName'], 'daily_item_prices': ['Date', 'ItemName', 'Price']}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        columns = {'Total': pd.Series(dtype='int64'), 'Qty': pd.Series(dtype='int64'), 'Lines': pd.Series(dtype='int64')}
+        self.tables = {name: pd.DataFrame(columns, index=pd.MultiIndex.from_arrays([[]] * len(keys), names=keys) if len(keys) > 1 else pd.Index([], name=keys[0]))
+                       for name, keys in self.DIMENSIONS.items()}
+        self.cursor = LedgerCursor() # Baris ledger yang sudah diserap (+ kunci baris terakhirnya)
+        self.generation += 1
+
+    @property
+    def version(self):
+        """Changes whenever the rollups change (new rows absorbed or rebuilt from scratch)"""
+        return (self.generation, self.cursor.position)
+
+    def sync(self, ledger):
+        """Absorbs ledger rows added since the last call; rebuilds when the ledger was replaced"""
+        with self.lock:
+            tail = self.cursor.tail(ledger)
+            if tail is None: # Ledger diganti (reload / import / ganti backend), bukan cuma nambah -> bangun ulang
+                self.reset()
+                tail = ledger
+            self.cursor.advance(ledger)
+            if tail.empty: return
+            
+            # Key kategorikal -> teks biasa, biar index rollup gak jadi CategoricalIndex yang beda-beda kategorinya
+            columns = {'Date': tail['Date'].dt.normalize(), 'Hour': tail['Hour'], 'ItemName': tail['ItemName'].astype(str),
+                       'Category': tail['Category'].astype(str), 'Payment': tail['Payment'].astype(str),
+                       # Rollup harga buat fit elastisitas: harga menu, bukan harga surge (surge = jam ramai,
+                       # ikut di-fit malah bikin elastisitas mendekati nol). Baris lama tanpa BasePrice pakai Price
+                       'Price': tail['BasePrice'].where(tail['BasePrice'] > 0, tail['Price'])}
+            for name, keys in self.DIMENSIONS.items():
+                batch = tail.groupby([columns[k].rename(k) for k in keys], observed=True).agg(
+                    Total=('Total', 'sum'), Qty=('Qty', 'sum'), Lines=('Total', 'size'))
+                self.tables[name] = self.tables[name].add(batch, fill_value=0).astype('int64').sort_index()
+
+    def table(self, name):
+        with self.lock:
+            return self.tables[name]
+
+    def table_between(self, name, start, end):
+        """Rows of a date-keyed rollup with `start <= Date <= end`"""
+        table = self.table(name)
+        dates = table.index.get_level_values('Date')
+        return table[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+
+    def daily_totals(self):
+        """Daily revenue as a Series indexed by date (days without sales are simply absent)"""
+        return self.table('daily')['Total']
+
+    def total_revenue(self):
+        return int(self.table('daily')['Total'].sum())
+
+    def revenue_on(self, day):
+        daily = self.table('daily')['Total']
+        return int(daily.get(pd.Timestamp(day), 0))
+
+@st.cache_resource
+def get_sales_rollups():
+    return SalesRollups()
+
+# ==========================================
+# BULK I/O LEDGER (EXPORT / IMPORT / ARSIP HARIAN)
+# ==========================================
+LEDGER_ARCHIVE_DIR = 'ledger_archive'
+BULK_CHUNK_ROWS = 5000 # Baris per potong waktu baca/tulis file besar
+BULK_FORMATS = ['parquet', 'csv', 'xlsx']
+BULK_MIME = {'parquet': 'application/octet-stream', 'csv': 'text/csv',
+             'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+
+# Dialek kolom notebook lama (database_cafe.csv / Laporan_Keuangan_*.csv) <-> skema ledger
+LEGACY_RENAME_MAP = {'Tanggal': 'Date', 'Jam': 'Hour', 'Menu': 'ItemName', 'Kategori': 'Category', 'Harga': 'Price',
+                     'Qty': 'Qty', 'Omset': 'Total', 'Pelanggan': 'CustomerType'}
+LEGACY_COLUMNS = ['Tanggal', 'Jam', 'Hari', 'Kategori', 'Menu', 'Harga', 'HPP', 'Qty', 'Omset', 'Profit', 'Hari_Angka', 'Is_Weekend']
+
+def detect_dialect(columns):
+    """Returns 'legacy' for Tanggal/Jam/Omset files, 'ledger' for Date/Hour/Total (or sheet headers)"""
+    columns = set(columns)
+    if {'Tanggal', 'Omset'} <= columns: return 'legacy'
+    if {'Date', 'Total'} <= columns or {'date', 'total'} <= columns: return 'ledger'
+    raise ValueError(f"Kolom tidak dikenali: {sorted(columns)}")
+
+def to_ledger_schema(df):
+    """Maps a chunk in either dialect onto TX_COLUMNS with ledger dtypes (TX_SCHEMA)"""
+    if detect_dialect(df.columns) == 'legacy':
+        df = df.rename(columns=LEGACY_RENAME_MAP)
+        # Notebook nyimpen tanggal & jam terpisah -> gabung jadi satu timestamp
+        date = parse_datetimes(df['Date']).dt.normalize()
+        if 'Hour' in df.columns: date = date + pd.to_timedelta(parse_amounts(df['Hour'], 'int32'), unit='h')
+        df = df.assign(Date=date, ItemID=df.get('ItemID', df['ItemName']))
+    else:
+        df = df.rename(columns=TX_RENAME_MAP)
+    # Kolom yang gak ada di file diisi default sebelum dikonversi
+    defaults = {'Qty': 1, 'CustomerType': 'Walk-in', 'Payment': 'Unknown'}
+    df = df.assign(**{col: value for col, value in defaults.items() if col not in df.columns})
+    typed = normalize_transactions(df).dropna(subset=['Date'])
+    if 'Hour' not in df.columns: typed['Hour'] = typed['Date'].dt.hour.astype('int32')
+    if 'Price' not in df.columns: typed['Price'] = typed['Total'] // typed['Qty'].clip(lower=1)
+    return typed
+
+def to_legacy_schema(df):
+    """Ledger frame -> notebook dialect. HPP/Profit aren't tracked by the POS, so they stay empty"""
+    return pd.DataFrame({
+        'Tanggal': df['Date'].dt.strftime('%Y-%m-%d'), 'Jam': df['Hour'].astype(int), 'Hari': df['Date'].dt.day_name(),
+        'Kategori': df['Category'], 'Menu': df['ItemName'], 'Harga': df['Price'].astype(int), 'HPP': pd.NA,
+        'Qty': df['Qty'].astype(int), 'Omset': df['Total'].astype(int), 'Profit': pd.NA,
+        'Hari_Angka': df['Date'].dt.dayofweek, 'Is_Weekend': (df['Date'].dt.dayofweek >= 5).astype(int)
+    }, columns=LEGACY_COLUMNS)
+
+def require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Export Parquet butuh pyarrow: pip install pyarrow")
+    return pa, pq
+
+def iter_day_partitions(df):
+    """Yields (day, rows) in date order, one group per calendar day"""
+    for day, part in df.groupby(df['Date'].dt.normalize(), sort=True):
+        yield day, part
+
+def export_ledger(df, fmt, dialect='ledger', chunk_rows=BULK_CHUNK_ROWS):
+    """Serializes the ledger chunk by chunk to parquet/csv/xlsx bytes, sorted by date.
+
+    Parquet gets one row group per chunk, XLSX one sheet per month (Excel caps rows per sheet).
+    """
+    convert = to_legacy_schema if dialect == 'legacy' else (lambda part: part[TX_COLUMNS])
+    df = df.sort_values('Date', kind='stable')
+    out = io.BytesIO()
+    if fmt == 'parquet':
+        pa, pq = require_pyarrow()
+        writer = None
+        try:
+            for i in range(0, len(df), chunk_rows):
+                table = pa.Table.from_pandas(convert(df.iloc[i:i + chunk_rows]), preserve_index=False)
+                if writer is None: writer = pq.ParquetWriter(out, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None: writer.close()
+    elif fmt == 'csv':
+        for i in range(0, len(df), chunk_rows):
+            out.write(convert(df.iloc[i:i + chunk_rows]).to_csv(index=False, header=i == 0).encode('utf-8'))
+        if df.empty: out.write(convert(df).to_csv(index=False).encode('utf-8'))
+    elif fmt == 'xlsx':
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True) # Mode streaming: baris langsung ditulis, gak disimpan di memori
+        for month, part in df.groupby(df['Date'].dt.strftime('%Y-%m'), sort=True):
+            ws = wb.create_sheet(title=month)
+            for i in range(0, len(part), chunk_rows):
+                chunk = convert(part.iloc[i:i + chunk_rows]).astype(object)
+                if i == 0: ws.append(list(chunk.columns))
+                for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+                    ws.append(row)
+        if not wb.worksheets: wb.create_sheet(title='ledger').append(list(convert(df).columns))
+        wb.save(out)
+    else:
+        raise ValueError(f"Format tidak didukung: {fmt}")
+    return out.getvalue()
+
+def iter_import_chunks(source, fmt, chunk_rows=BULK_CHUNK_ROWS):
+    """Reads a parquet/csv/xlsx file (path or file-like) and yields ledger-schema chunks"""
+    if fmt == 'parquet':
+        _, pq = require_pyarrow()
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield to_ledger_schema(batch.to_pandas())
+    elif fmt == 'csv':
+        for chunk in pd.read_csv(source, chunksize=chunk_rows):
+            yield to_ledger_schema(chunk)
+    elif fmt == 'xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                rows = ws.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None: continue
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == chunk_rows:
+                        yield to_ledger_schema(pd.DataFrame(batch, columns=header))
+                        batch = []
+                if batch: yield to_ledger_schema(pd.DataFrame(batch, columns=header))
+        finally:
+            wb.close()
+    else:
+        raise ValueError(f"Format tidak didukung: {fmt}")
+
+class LedgerArchive:
+    """Append-only daily partition files (csv + parquet) mirrored from the ledger tail.
+
+    Replaces the notebook habit of rewriting one big CSV on every save: each sync only
+    appends the new rows to `csv/YYYY-MM-DD.csv`. Parquet is written once per day, as a single
+    `parquet/date=YYYY-MM-DD/part-00000.parquet`, when the date rolls over (the open day is CSV only).
+    """
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.cursor_path = os.path.join(root, '_cursor.json')
+        self.cursor = LedgerCursor()
+        self.open_day = None # Hari terakhir yang masih nambah baris, parquet-nya belum ditulis
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path, encoding='utf-8') as f: state = json.load(f)
+            self.cursor = LedgerCursor(state['cursor'], state.get('last_key'))
+            self.open_day = state.get('open_day')
+            # Kolom ledger berubah (mis. BasePrice ditambah) -> CSV lama beda header, arsip dibangun ulang
+            if state.get('columns') != TX_COLUMNS: self._reset()
+
+    def sync(self, ledger):
+        """Appends ledger rows added since the last call to their day partitions"""
+        with self.lock:
+            # Posisi di file cursor nunjuk ke frame cache di memori -> dicek pakai kunci baris terakhir
+            tail = self.cursor.tail(ledger, relocate=True)
+            if tail is None: # Baris yang sudah diarsip gak ada lagi di ledger -> arsip dibangun ulang
+                self._reset()
+                tail = ledger
+            if tail.empty: return 0
+            days = {self.open_day} if self.open_day else set()
+            for day, part in iter_day_partitions(tail):
+                name = f"{day:%Y-%m-%d}"
+                csv_path = os.path.join(self.root, 'csv', name + '.csv')
+                os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+                part[TX_COLUMNS].to_csv(csv_path, mode='a', header=not os.path.exists(csv_path), index=False)
+                days.add(name)
+            # Hari yang sudah lewat ditutup: satu file parquet per hari, bukan satu file per sync
+            self.open_day = max(days)
+            for name in sorted(days - {self.open_day}): self._write_parquet(name)
+            self.cursor.advance(ledger)
+            self._save_cursor()
+            return len(tail)
+
+    def partitions(self):
+        """Days with a CSV partition, oldest first"""
+        folder = os.path.join(self.root, 'csv')
+        if not os.path.isdir(folder): return []
+        return sorted(f[:-4] for f in os.listdir(folder) if f.endswith('.csv'))
+
+    def _write_parquet(self, name):
+        try:
+            pa, pq = require_pyarrow()
+        except ImportError:
+            return # Tanpa pyarrow arsip cuma CSV
+        part = to_ledger_schema(pd.read_csv(os.path.join(self.root, 'csv', name + '.csv'), dtype={'CustomerID': str}))
+        part = part.astype({'ItemID': str, 'ItemName': str, 'Category': str, 'CustomerType': str, 'Payment': str, 'CustomerID': str})
+        part_dir = os.path.join(self.root, 'parquet', f"date={name}")
+        os.makedirs(part_dir, exist_ok=True)
+        tmp = os.path.join(part_dir, 'part-00000.parquet.tmp')
+        pq.write_table(pa.Table.from_pandas(part[TX_COLUMNS], preserve_index=False), tmp)
+        os.replace(tmp, os.path.join(part_dir, 'part-00000.parquet'))
+
+    def _save_cursor(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.cursor_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'cursor': self.cursor.position, 'last_key': self.cursor.last_key, 'open_day': self.open_day,
+                       'columns': TX_COLUMNS}, f)
+        os.replace(tmp, self.cursor_path)
+
+    def _reset(self):
+        self.cursor = LedgerCursor()
+        self.open_day = None
+        self._save_cursor() # Cursor kosong ditulis dulu, biar file lama gak nunjuk ke partisi yang sudah dihapus
+        for sub in ['csv', 'parquet']:
+            shutil.rmtree(os.path.join(self.root, sub), ignore_errors=True)
+
+@st.cache_resource
+def get_ledger_archive(backend_name):
+    return LedgerArchive(os.path.join(LEDGER_ARCHIVE_DIR, backend_name))
 
 # ==========================================
 # 4. DATA GENERATION & SESSION MANAGEMENT
@@ -431,44 +2726,74 @@ def get_initial_menu():
         {'ID': 'S03', 'Menu': 'Mie Goreng .NET Framework', 'Harga': 25000, 'Kategori': 'Mainframe Meals', 'Icon': '☕', 'Stok': 123},
     ]
 
+# Resep menu bawaan (gram / ml / pcs per porsi), diturunkan dari menu_recipes di cafe.ipynb
+def get_initial_recipes():
+    recipes = {
+        'C01': {'Biji Kopi': 18, 'Susu UHT': 200, 'Gula Cair': 10},
+        'C02': {'Biji Kopi': 18, 'Air Mineral': 200},
+        'C03': {'Biji Kopi': 18, 'Choco Chip': 30, 'Susu UHT': 150},
+        'C04': {'Biji Kopi': 20, 'Air Mineral': 200},
+        'C05': {'Biji Kopi': 18},
+        'N01': {'Bubuk Matcha': 20, 'Susu UHT': 200, 'Gula Cair': 20},
+        'N02': {'Sirup Berry': 30, 'Susu UHT': 150, 'Es Batu': 100},
+        'N03': {'Teh Hitam': 1, 'Gula Cair': 15},
+        'F01': {'Roti Burger': 1, 'Daging Patty': 2, 'Keju Slice': 2, 'Selada': 1},
+        'F02': {'Pasta': 100, 'Saus Bolognese': 100, 'Daging Cincang': 50},
+        'F03': {'Daging Sapi': 250, 'Kentang Goreng': 100},
+        'S01': {'Kentang Goreng': 200, 'Saus Sambal': 20},
+        'S02': {'Tortilla': 100, 'Keju Slice': 2, 'Saus Sambal': 20},
+        'S03': {'Mie Telur': 150, 'Telur': 1, 'Sayur': 50},
+    }
+    return [{'MenuID': m, 'Ingredient': i, 'Qty': q} for m, items in recipes.items() for i, q in items.items()]
+
+def get_initial_ingredients():
+    stock = [('Biji Kopi', 'g', 5000, 1000), ('Susu UHT', 'ml', 20000, 4000), ('Gula Cair', 'ml', 3000, 500),
+             ('Air Mineral', 'ml', 20000, 4000), ('Choco Chip', 'g', 1500, 300), ('Bubuk Matcha', 'g', 1500, 300),
+             ('Sirup Berry', 'ml', 2000, 400), ('Es Batu', 'g', 20000, 5000), ('Teh Hitam', 'pcs', 200, 40),
+             ('Roti Burger', 'pcs', 60, 15), ('Daging Patty', 'pcs', 120, 30), ('Keju Slice', 'pcs', 300, 60),
+             ('Selada', 'pcs', 60, 15), ('Pasta', 'g', 5000, 1000), ('Saus Bolognese', 'g', 5000, 1000),
+             ('Daging Cincang', 'g', 3000, 600), ('Daging Sapi', 'g', 6000, 1500), ('Kentang Goreng', 'g', 30000, 6000),
+             ('Saus Sambal', 'g', 3000, 600), ('Tortilla', 'g', 10000, 2000), ('Mie Telur', 'g', 15000, 3000),
+             ('Telur', 'pcs', 120, 30), ('Sayur', 'g', 5000, 1000)]
+    return [{'Ingredient': n, 'Unit': u, 'OnHand': o, 'ReorderPoint': r} for n, u, o, r in stock]
+
 # ==========================================
 # 4. DATA GENERATION & SESSION MANAGEMENT (UPDATED FOR SQLITE)
 # ==========================================
 
-# Inisialisasi Database Manager
-db_manager = DatabaseManager()
-
 # A. DATABASE SEEDING (Hanya jalan sekali saat aplikasi pertama kali mendeteksi session baru)
 if 'db_initialized' not in st.session_state:
     with st.spinner("CONNECTING TO TITAN DATABASE & SYNCHRONIZING HISTORY..."):
         # 1. Siapkan data awal (jika DB benar-benar kosong)
         ds_core = DataScienceCore()
+        if db_manager.backend_name == "sqlite" and db_manager.load_menu().empty:
+            db_manager.save_menu(pd.DataFrame(get_initial_menu()))
+        st.session_state.db_initialized = True
         
 # B. LOAD DATA KE RAM (SESSION STATE)
 # Kita load dari SQLite ke Session State agar akses data super cepat (tidak query SQL terus-menerus)
 
-if 'menu_db' not in st.session_state:
-    st.session_state.menu_db = db_manager.load_menu()
+# Menu dibaca ulang cuma kalau ada event 'menu' (stok berubah dari terminal lain / inventory disimpan)
+refresh_on_event('menu', 'menu_db', db_manager.load_menu)
 
-if 'transactions' not in st.session_state:
-    # Load history transaksi dari file .db
-    st.session_state.transactions = db_manager.load_transactions()
-    
-    # Inisialisasi ulang DS Core untuk dipakai fitur prediksi nanti
-    if 'ds_core' not in st.session_state:
-        st.session_state.ds_core = DataScienceCore()
+# Ledger transaksi diambil dari cache bersama (murah, cuma narik baris baru kalau cache sudah basi)
+st.session_state.transactions = db_manager.load_transactions()
+# Rollup ikut nyerap baris baru saja -> KPI & chart baca tabel kecil, bukan scan ledger
+sales_rollups = get_sales_rollups()
+sales_rollups.sync(st.session_state.transactions)
+# Baris baru juga di-append ke arsip harian (bukan tulis ulang satu CSV besar)
+db_manager.archive_ledger(st.session_state.transactions)
+
+# Inisialisasi ulang DS Core untuk dipakai fitur prediksi nanti
+if 'ds_core' not in st.session_state:
+    st.session_state.ds_core = DataScienceCore()
 
 # C. STATE LAINNYA (Non-Persistent / Sementara)
 if 'cart' not in st.session_state: 
     st.session_state.cart = []
 
-# Load Kitchen Queue dari Database
-if 'kitchen_queue' not in st.session_state:
-    st.session_state.kitchen_queue = db_manager.get_kitchen_queue()
-
 # Load Status Meja dari Database
-if 'tables' not in st.session_state:
-    st.session_state.tables = db_manager.get_tables()
+refresh_on_event('tables', 'tables', db_manager.get_tables)
 
 if 'xp' not in st.session_state: 
     st.session_state.xp = 5000
@@ -490,55 +2815,339 @@ def format_rupiah(value):
     return f"Rp {value:,.0f}".replace(",", ".")
 
 # 2. MESIN PDF (Di luar format_rupiah, sejajar di kiri)
+REPORT_CHUNK_ROWS = 200 # Baris rollup yang ditulis per potong
+REPORT_CACHE_SIZE = 8 # Jumlah PDF (range x versi data) yang disimpan
+
+def pdf_text(value):
+    # Font bawaan FPDF cuma latin-1: karakter lain diganti '?' per sel, bukan encode ulang seluruh PDF
+    return str(value).encode('latin-1', 'replace').decode('latin-1')
+
 class PDFReport(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table_columns = None # Diisi selama nulis tabel -> header kolom diulang tiap halaman
+        self.set_auto_page_break(True, margin=20)
+
     def header(self):
         self.set_font('Arial', 'B', 15)
         self.cell(0, 10, 'FARIKHI OS - FINANCIAL REPORT', 0, 1, 'C')
         self.ln(10)
+        if self.table_columns: self.table_header()
     def footer(self):
         self.set_y(-15)
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
 
-# 3. FUNGSI GENERATE LINK (Di luar juga)
-def generate_pdf_download_link(df_tx):
+    def section(self, title):
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, pdf_text(title), 0, 1)
+
+    def table_header(self):
+        self.set_font('Arial', 'B', 10)
+        for label, width, align in self.table_columns:
+            self.cell(width, 8, label, 1, 0, align)
+        self.ln()
+        self.set_font('Arial', size=10)
+
+    def table(self, columns, chunks):
+        """Writes rows chunk by chunk; page breaks repeat the column header"""
+        self.table_columns = columns
+        self.table_header()
+        for chunk in chunks:
+            for row in chunk:
+                for (_, width, align), value in zip(columns, row):
+                    self.cell(width, 7, pdf_text(value), 1, 0, align)
+                self.ln()
+        self.table_columns = None
+        self.ln(5)
+
+    def to_bytes(self):
+        out = self.output(dest='S')
+        return out.encode('latin-1') if isinstance(out, str) else bytes(out) # fpdf 1.x -> str, fpdf2 -> bytearray
+
+def iter_chunks(frame, size=REPORT_CHUNK_ROWS):
+    for i in range(0, len(frame), size):
+        yield frame.iloc[i:i + size].itertuples(index=False, name=None)
+
+def build_sales_report(start, end, daily, items, payments):
+    """Renders the period report (summary, payment mix, item breakdown, daily totals) to PDF bytes"""
     pdf = PDFReport()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
     
-    total = df_tx['Total'].sum()
-    pdf.cell(200, 10, txt=f"Total Revenue: {format_rupiah(total)}", ln=1)
-    pdf.cell(200, 10, txt=f"Total Transactions: {len(df_tx)}", ln=1)
-    pdf.ln(10)
+    total = int(daily['Total'].sum())
+    n_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    pdf.cell(0, 8, txt=f"Periode: {start:%d-%m-%Y} s/d {end:%d-%m-%Y} ({n_days} hari)", ln=1)
+    pdf.cell(0, 8, txt=f"Total Revenue: {format_rupiah(total)}", ln=1)
+    pdf.cell(0, 8, txt=f"Total Transactions: {int(daily['Lines'].sum()):,} | Items Sold: {int(daily['Qty'].sum()):,}", ln=1)
+    pdf.cell(0, 8, txt=f"Rata-rata per Hari: {format_rupiah(total / n_days)}", ln=1)
+    pdf.ln(5)
     
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(40, 10, "Date", 1); pdf.cell(60, 10, "Item", 1); pdf.cell(40, 10, "Total", 1); pdf.ln()
+    # Payment mix & item breakdown: dijumlah dari rollup (Date, X) -> per X
+    pay = payments.groupby(level='Payment')[['Total', 'Lines']].sum().sort_values('Total', ascending=False)
+    pay['Share'] = (pay['Total'] / max(total, 1) * 100).map('{:.1f}%'.format)
+    pay['Total'] = pay['Total'].map(format_rupiah)
+    pdf.section("PAYMENT MIX")
+    pdf.table([("Payment", 50, 'L'), ("Transactions", 40, 'R'), ("Total", 50, 'R'), ("Share", 30, 'R')],
+              iter_chunks(pay.reset_index()[['Payment', 'Lines', 'Total', 'Share']]))
     
-    pdf.set_font("Arial", size=10)
-    # Ambil 20 transaksi terakhir
-    for i, row in df_tx.tail(20).iterrows():
-        # Pastikan format tanggal string
-        tgl = row['Date'].strftime("%Y-%m-%d") if hasattr(row['Date'], 'strftime') else str(row['Date'])
-        pdf.cell(40, 10, tgl, 1)
-        pdf.cell(60, 10, str(row['ItemName']), 1)
-        pdf.cell(40, 10, str(int(row['Total'])), 1)
-        pdf.ln()
-        
-    return pdf.output(dest='S').encode('latin-1')
+    item = items.groupby(level='ItemName')[['Qty', 'Total']].sum().sort_values('Total', ascending=False)
+    item['Total'] = item['Total'].map(format_rupiah)
+    pdf.section("ITEM BREAKDOWN")
+    pdf.table([("Item", 90, 'L'), ("Qty", 30, 'R'), ("Total", 50, 'R')], iter_chunks(item.reset_index()[['ItemName', 'Qty', 'Total']]))
+    
+    days = daily.reset_index()
+    days['Date'] = days['Date'].dt.strftime("%Y-%m-%d")
+    days['Total'] = days['Total'].map(format_rupiah)
+    pdf.section("DAILY TOTALS")
+    pdf.table([("Date", 40, 'L'), ("Transactions", 40, 'R'), ("Qty", 30, 'R'), ("Total", 50, 'R')],
+              iter_chunks(days[['Date', 'Lines', 'Qty', 'Total']]))
+    return pdf.to_bytes()
+
+class ReportEngine:
+    """Builds PDF reports on a worker thread, cached by (date range, rollup version)"""
+    def __init__(self, cache_size=REPORT_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-report")
+        self.jobs = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+    def request(self, rollups, start, end):
+        """Returns a Future with the PDF bytes; the same range + data version reuses the job"""
+        key = (start, end, rollups.version)
+        with self.lock:
+            if key in self.jobs:
+                self.jobs.move_to_end(key)
+                return self.jobs[key]
+            # Snapshot rollup range sekarang (kecil), worker gak nyentuh state bersama
+            job = self.executor.submit(build_sales_report, start, end, rollups.table_between('daily', start, end),
+                                       rollups.table_between('daily_items', start, end), rollups.table_between('daily_payments', start, end))
+            self.jobs[key] = job
+            while len(self.jobs) > self.cache_size: self.jobs.popitem(last=False)
+            return job
+
+@st.cache_resource
+def get_report_engine():
+    return ReportEngine()
 
 def add_to_kitchen(cart_items, table_no="POS"):
-    order_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     order = {
-        'id': order_id,
+        'id': db_manager.new_kitchen_order_id(),
         'table': table_no,
         'items': cart_items,
         'time': datetime.now().strftime("%H:%M"),
         'status': 'Pending'
     }
-    # 1. Simpan ke DB
-    db_manager.add_kitchen_order(order)
-    # 2. Update Session State (Visual)
-    st.session_state.kitchen_queue.append(order)
+    # Simpan ke antrian bersama (langsung kelihatan di semua layar dapur)
+    return db_manager.add_kitchen_order(order)
+
+# 3. WARM-UP SETELAH LOGIN (TUGAS BENERAN, JALAN BARENGAN)
+def timed_task(fn):
+    t0 = time.perf_counter()
+    try:
+        ok, detail = True, fn()
+    except Exception as e:
+        ok, detail = False, str(e) # Warm-up gagal gak bikin login gagal; layar terkait coba lagi sendiri
+    return ok, time.perf_counter() - t0, detail
+
+def run_warmup(tasks, on_done=None):
+    """Runs `(label, fn[, after])` warm-up tasks concurrently; returns one report row per task in finish order.
+
+    A task with `after` (labels of earlier tasks) starts only once those have finished.
+    Worker threads get this session's script context, so cached resources and secrets work inside them.
+    """
+    ctx = get_script_run_ctx()
+    report = []
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup",
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as pool:
+        by_label = {}
+        for label, fn, *after in tasks:
+            # Satu thread per task, jadi nunggu dependensi di dalam worker gak bikin deadlock
+            deps = [by_label[dep] for dep in (after[0] if after else ())]
+            by_label[label] = pool.submit(lambda fn=fn, deps=deps: (wait(deps), timed_task(fn))[1])
+        futures = {future: label for label, future in by_label.items()}
+        for future in as_completed(futures):
+            ok, seconds, detail = future.result()
+            report.append({'Task': futures[future], 'Status': '✅' if ok else '⚠️', 'Seconds': round(seconds, 3), 'Detail': str(detail)})
+            if on_done: on_done(report)
+    return report
+
+# ==========================================
+# AI CHAT S.A.R.A (GEMINI / STUB OFFLINE)
+# ==========================================
+CHAT_STUB_MODEL = 'local-stub'
+CHAT_MAX_TOOL_ROUNDS = 4 # Putaran function call maksimal per pertanyaan
+CHAT_DEFAULT_DAYS = 7 # Periode default kalau user gak nyebut tanggal
+CHAT_MAX_ROWS = 62 # Baris hasil tool maksimal yang dikirim balik ke model
+
+# Deklarasi function yang boleh dipanggil S.A.R.A (dijawab dari rollup, bukan data mentah di prompt)
+CHAT_TOOL_SPECS = [
+    {'name': 'top_items', 'description': 'Best-selling menu items in a date range, by revenue or quantity.',
+     'parameters': {'type': 'object', 'properties': {
+         'start_date': {'type': 'string', 'description': 'YYYY-MM-DD, default 6 days before end_date'},
+         'end_date': {'type': 'string', 'description': 'YYYY-MM-DD, default today'},
+         'limit': {'type': 'integer', 'description': 'Number of items, default 5'},
+         'by': {'type': 'string', 'enum': ['revenue', 'qty']}}}},
+    {'name': 'revenue_by', 'description': 'Revenue and transaction count grouped by day, hour of day, category or payment method in a date range.',
+     'parameters': {'type': 'object', 'properties': {
+         'dimension': {'type': 'string', 'enum': ['day', 'hour', 'category', 'payment']},
+         'start_date': {'type': 'string', 'description': 'YYYY-MM-DD'},
+         'end_date': {'type': 'string', 'description': 'YYYY-MM-DD'}}, 'required': ['dimension']}},
+    {'name': 'low_stock', 'description': 'Menu items whose stock is below a threshold.',
+     'parameters': {'type': 'object', 'properties': {'threshold': {'type': 'integer', 'description': 'Default 20'}}}},
+    {'name': 'forecast_revenue', 'description': 'Predicted daily revenue for the next days with an 80% interval.',
+     'parameters': {'type': 'object', 'properties': {'days': {'type': 'integer', 'description': '1-90, default 7'}}}},
+]
+
+class AnalyticsTools:
+    """Structured queries behind CHAT_TOOL_SPECS, answered from the rollups, menu and forecast model"""
+    REVENUE_TABLES = {'day': 'daily', 'hour': 'daily_hours', 'category': 'daily_categories', 'payment': 'daily_payments'}
+    REVENUE_KEYS = {'hour': 'Hour', 'category': 'Category', 'payment': 'Payment'}
+
+    def __init__(self, rollups, menu_df, today, ds=None):
+        self.rollups = rollups
+        self.menu = menu_df
+        self.today = pd.Timestamp(today)
+        self.ds = ds
+
+    def _period(self, start_date=None, end_date=None):
+        end = pd.Timestamp(end_date) if end_date else self.today
+        start = pd.Timestamp(start_date) if start_date else end - timedelta(days=CHAT_DEFAULT_DAYS - 1)
+        start, end = min(start, end), max(start, end)
+        return start, end, [f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}"]
+
+    def top_items(self, start_date=None, end_date=None, limit=5, by='revenue'):
+        start, end, period = self._period(start_date, end_date)
+        items = self.rollups.table_between('daily_items', start, end).groupby(level='ItemName')[['Total', 'Qty']].sum()
+        items = items.sort_values('Qty' if by == 'qty' else 'Total', ascending=False).head(max(1, min(int(limit), CHAT_MAX_ROWS)))
+        return {'period': period, 'items': [{'item': str(k), 'revenue': int(r['Total']), 'qty': int(r['Qty'])} for k, r in items.iterrows()]}
+
+    def revenue_by(self, dimension='day', start_date=None, end_date=None):
+        if dimension not in self.REVENUE_TABLES: return {'error': f"dimension harus salah satu dari {list(self.REVENUE_TABLES)}"}
+        start, end, period = self._period(start_date, end_date)
+        table = self.rollups.table_between(self.REVENUE_TABLES[dimension], start, end)
+        if dimension != 'day': table = table.groupby(level=self.REVENUE_KEYS[dimension])[['Total', 'Lines']].sum()
+        rows = [{dimension: f"{k:%Y-%m-%d}" if dimension == 'day' else (int(k) if dimension == 'hour' else str(k)),
+                 'revenue': int(r['Total']), 'transactions': int(r['Lines'])} for k, r in table.head(CHAT_MAX_ROWS).iterrows()]
+        return {'period': period, 'total_revenue': int(table['Total'].sum()), 'rows': rows}
+
+    def low_stock(self, threshold=20):
+        low = self.menu[self.menu['Stok'] < int(threshold)].sort_values('Stok').head(CHAT_MAX_ROWS)
+        return {'threshold': int(threshold), 'items': [{'item': r['Menu'], 'stock': int(r['Stok'])} for _, r in low.iterrows()]}
+
+    def forecast_revenue(self, days=7):
+        if self.ds is None: return {'error': 'forecaster tidak tersedia'}
+        days = max(1, min(int(days), 90))
+        daily_totals = self.rollups.daily_totals()
+        # Model yang sama dengan tab forecast (registry: gak training ulang per pertanyaan)
+        package = get_model_registry().get_or_train('sales_forecast', daily_totals, self.ds.train_sales_forecast_model, schema=FORECAST_SCHEMA)
+        future = self.ds.forecast_sales(package['model'], self.ds.build_daily_sales(daily_totals), package['meta'], days)
+        return {'model_version': package['version'], 'days': [
+            {'date': f"{r.Date:%Y-%m-%d}", 'predicted': int(r.Predicted_Sales), 'lower': int(r.Lower), 'upper': int(r.Upper)}
+            for r in future.itertuples()]}
+
+    def call(self, name, args):
+        """Runs one tool call; bad names/arguments come back as {'error': ...} for the model to read"""
+        if name not in {spec['name'] for spec in CHAT_TOOL_SPECS}: return {'error': f"function tidak dikenal: {name}"}
+        try:
+            return getattr(self, name)(**args)
+        except Exception as e:
+            return {'error': str(e)}
+
+def discover_gemini_model(api_key):
+    """Configures the Gemini SDK and returns the first model that supports generateContent"""
+    genai.configure(api_key=api_key)
+    # Kita cari model yang support 'generateContent' (supaya gak Error 404 lagi)
+    for m in genai.list_models():
+        if 'generateContent' in m.supported_generation_methods:
+            return m.name # Ambil yang pertama ketemu (biasanya gemini-pro atau gemini-1.5-flash)
+    raise Exception("Tidak ada model AI yang aktif di akun ini.")
+
+class GeminiChat:
+    """Gemini model resolved once (cached in the resource registry), answers streamed chunk by chunk.
+
+    Function calls in the stream are run against `tools` and sent back, until the model answers in text.
+    """
+    def __init__(self, api_key):
+        self.model_name = discover_gemini_model(api_key)
+        self.model = genai.GenerativeModel(self.model_name, tools=[{'function_declarations': CHAT_TOOL_SPECS}])
+
+    def ping(self):
+        # Model yang dipakai masih ada & API key masih diterima
+        return genai.get_model(self.model_name).name
+
+    def stream(self, context, query, tools):
+        contents = [{'role': 'user', 'parts': [context, query]}]
+        for _ in range(CHAT_MAX_TOOL_ROUNDS):
+            calls = []
+            for chunk in self.model.generate_content(contents, stream=True):
+                for part in chunk.parts:
+                    if part.function_call.name: calls.append(part.function_call)
+                    elif part.text: yield part.text
+            if not calls: return
+            contents.append({'role': 'model', 'parts': [genai.protos.Part(function_call=fc) for fc in calls]})
+            contents.append({'role': 'user', 'parts': [
+                genai.protos.Part(function_response=genai.protos.FunctionResponse(name=fc.name, response=tools.call(fc.name, dict(fc.args))))
+                for fc in calls]})
+        yield "⚠️ Terlalu banyak query data untuk satu pertanyaan, coba dipersempit."
+
+class StubChat:
+    """Offline stand-in with the same `stream` interface: keyword routing to the same tools, no network"""
+    model_name = CHAT_STUB_MODEL
+    ROUTES = [(['terlaris', 'best seller', 'top'], 'top_items', {}), (['stok', 'stock'], 'low_stock', {}),
+              (['prediksi', 'forecast', 'ramalan'], 'forecast_revenue', {}), (['jam', 'hour'], 'revenue_by', {'dimension': 'hour'}),
+              (['kategori', 'category'], 'revenue_by', {'dimension': 'category'}), (['bayar', 'payment'], 'revenue_by', {'dimension': 'payment'}),
+              (['omzet', 'revenue', 'penjualan'], 'revenue_by', {'dimension': 'day'})]
+
+    def stream(self, context, query, tools):
+        q = query.lower()
+        for keywords, name, args in self.ROUTES:
+            if any(k in q for k in keywords):
+                yield f"(offline) `{name}`\n\n"
+                yield f"```json\n{json.dumps(tools.call(name, args), indent=1)}\n```"
+                return
+        yield "Mode offline: coba tanya 'menu terlaris', 'omzet per jam', 'stok menipis' atau 'prediksi omzet'."
+
+def get_chat_backend(api_key=None):
+    """Gemini when a key is configured ([chat] backend = "stub" forces the offline stub)"""
+    if not api_key or dict(st.secrets.get("chat", {})).get("backend") == "stub":
+        return StubChat()
+    return get_resource_registry().get('gemini', lambda: GeminiChat(api_key), max_age=GEMINI_MAX_AGE, check=lambda chat: chat.ping())
+
+class ChatContextCache:
+    """Short system prompt (date, data range, headline revenue), rebuilt only when the ledger version or day changes"""
+    def __init__(self):
+        self.key = None
+        self.text = None
+        self.lock = threading.Lock()
+
+    def get(self, rollups, today):
+        key = (rollups.version, today)
+        with self.lock:
+            if key != self.key:
+                daily = rollups.table('daily')
+                data_range = f"{daily.index.min():%Y-%m-%d} s/d {daily.index.max():%Y-%m-%d}" if not daily.empty else "belum ada"
+                self.text = f"""
+                Kamu adalah S.A.R.A, asisten AI untuk 'Farikhi OS'.
+                Hari ini {today:%Y-%m-%d} ({today:%A}). Data penjualan: {data_range}.
+                [KEUANGAN] Total Omzet: Rp {rollups.total_revenue():,.0f} | Hari ini: Rp {rollups.revenue_on(today):,.0f}
+                Untuk pertanyaan soal penjualan, item terlaris, jam ramai, kategori, stok atau prediksi:
+                panggil function yang tersedia (tanggal format YYYY-MM-DD), jangan menebak angka.
+                """
+                self.key = key
+            return self.text
+
+@st.cache_resource
+def get_chat_context_cache():
+    return ChatContextCache()
+
+def stream_chat_reply(api_key, context, query, tools):
+    """Yields reply chunks; connection/model errors end the stream with a message instead of raising"""
+    try:
+        yield from get_chat_backend(api_key).stream(context, query, tools)
+    except Exception as e:
+        get_resource_registry().invalidate('gemini') # Konfigurasi & deteksi ulang di pertanyaan berikutnya
+        yield f"⚠️ Maaf, ada gangguan sinyal ke otak AI: {e}"
 
 # ==========================================
 # 6. LOGIN SYSTEM (SECURE AUTHENTICATION v2.0)
@@ -589,13 +3198,36 @@ if not check_password():
 # Jika kode sampai sini, berarti Login Berhasil
 if not st.session_state.get('logged_in'):
     st.session_state.logged_in = True
-    # Efek Loading Keren
-    progress_text = "DECRYPTING DATA STREAMS..."
-    my_bar = st.progress(0, text=progress_text)
-    for percent_complete in range(100):
-        time.sleep(0.005)
-        my_bar.progress(percent_complete + 1, text=f"LOADING MODULES: {percent_complete}%")
-    st.rerun()
+    # Progress bar = tugas warm-up beneran (bukan sleep), yang gak saling tergantung jalan barengan
+    ds_warm = st.session_state.ds_core
+    chat_key = st.secrets.get("GEMINI_API_KEY")
+    def warm_ledger():
+        ledger = db_manager.load_transactions(force=True)
+        sales_rollups.sync(ledger)
+        get_customer_rfm().sync(ledger)
+        return f"{len(ledger):,} baris"
+    def warm_forecast():
+        daily = sales_rollups.daily_totals()
+        if len(daily) < 14: return "data belum cukup"
+        return f"v{get_model_registry().get_or_train('sales_forecast', daily, ds_warm.train_sales_forecast_model, schema=FORECAST_SCHEMA)['version']}"
+    def warm_segments():
+        segments = get_customer_rfm().segments()
+        return "data belum cukup" if segments is None else f"{len(segments):,} pelanggan"
+    # Ledger nunggu order pending ke-flush; forecast & segmen nunggu rollup/RFM selesai di-sync
+    warmup_tasks = [
+        ("STORAGE & PENDING ORDERS", lambda: "tersinkron" if db_manager.flush_pending() else f"{db_manager.pending_count()} order pending"),
+        ("LEDGER & ROLLUPS", warm_ledger, ["STORAGE & PENDING ORDERS"]),
+        ("KITCHEN & TABLES", lambda: f"{len(db_manager.get_kitchen_queue())} order aktif, {len(db_manager.get_tables())} meja"),
+        ("FORECAST MODEL", warm_forecast, ["LEDGER & ROLLUPS"]),
+        ("CUSTOMER SEGMENTS", warm_segments, ["LEDGER & ROLLUPS"]),
+        ("AI CHAT MODEL", lambda: get_chat_backend(chat_key).model_name),
+    ]
+    loading = st.empty()
+    my_bar = loading.progress(0, text="DECRYPTING DATA STREAMS...")
+    st.session_state.warmup_report = run_warmup(warmup_tasks, lambda report: my_bar.progress(
+        len(report) / len(warmup_tasks), text=f"LOADING MODULES: {report[-1]['Task']} {report[-1]['Status']}"))
+    loading.empty()
+    st.session_state.transactions = db_manager.load_transactions() # Ekor ledger yang baru ditarik warm-up
 
 # ==========================================
 # 7. MAIN INTERFACE (SIDEBAR & HEADER)
@@ -610,73 +3242,99 @@ with st.sidebar:
     
     # [FITUR BARU] SURGE PRICING
     st.markdown("### ⚡ DYNAMIC PRICING")
-    surge_active = st.toggle("Aktifkan Surge Pricing (+20%)", value=False)
+    surge_active = st.toggle("Aktifkan Surge Pricing (jam ramai + antrian dapur)", value=False)
     
+    # Harga per menu x jam x level antrian sudah dihitung di muka; di sini tinggal baca tabel
+    surge_hour = datetime.now().hour
+    surge_level = 0
     price_multiplier = 1.0
     if surge_active:
-        price_multiplier = 1.2
-        st.warning("⚠️ HARGA NAIK 20%")
+        surge_schedule = get_surge_schedule().refresh(st.session_state.ds_core, sales_rollups, st.session_state.menu_db)
+        surge_level = surge_schedule.backlog_level(len(db_manager.get_kitchen_queue()))
+        surge = surge_schedule.multipliers(surge_hour, surge_level)
+        weights = st.session_state.menu_db['Harga'].reindex(surge.index).fillna(0)
+        price_multiplier = float((surge * weights).sum() / weights.sum()) if weights.sum() else 1.0
+        st.warning(f"⚠️ HARGA NAIK RATA-RATA {(price_multiplier - 1) * 100:.0f}% ({int((surge > 1).sum())} MENU) | JAM {surge_hour:02d} | ANTRIAN LEVEL {surge_level}")
+
+    def unit_price(item_id, base_price):
+        """Price charged right now for one portion (menu price when surge is off)"""
+        return surge_schedule.price(item_id, base_price, surge_hour, surge_level) if surge_active else int(base_price)
     
     # [FITUR LAMA] KPI METRICS
     st.markdown("### 📊 LIVE METRICS")
     
-    # 1. Load Data Transaksi Terbaru
-    # Kita panggil dari database manager biar datanya fresh dari Google Sheet
-    df_tx = db_manager.load_transactions()
-    
-    # 2. Inisialisasi Variabel (Nilai Awal 0)
-    total_revenue = 0
-    today_revenue = 0
-
-    # 3. Logika Perhitungan (Anti-Crash)
-    if not df_tx.empty:
-        # Pastikan kolom Date berformat tanggal
-        if 'Date' in df_tx.columns:
-            df_tx['Date'] = pd.to_datetime(df_tx['Date'], errors='coerce')
-        
-        # Hitung Total Revenue
-        if 'Total' in df_tx.columns:
-            total_revenue = df_tx['Total'].sum()
-            
-        # Hitung Revenue Hari Ini
-        if 'Date' in df_tx.columns and 'Total' in df_tx.columns:
-            try:
-                # Ambil tanggal hari ini
-                now = datetime.now().date()
-                # Filter data yang tanggalnya == hari ini
-                today_data = df_tx[df_tx['Date'].dt.date == now]
-                today_revenue = today_data['Total'].sum()
-            except:
-                today_revenue = 0
-
-    # 4. Tampilkan Metric (Sekarang namanya sudah SAMA: total_revenue)
-    # Kita pakai format f-string biar tidak perlu fungsi format_rupiah eksternal
-    st.metric("TOTAL OMZET", f"Rp {total_revenue:,.0f}")
-    st.metric("OMZET HARI INI", f"Rp {today_revenue:,.0f}")
+    @st.fragment(run_every=LIVE_REFRESH_SECONDS)
+    def live_metrics():
+        # 1. Checkout dari terminal lain -> event 'transactions' -> serap ekor ledger ke rollup
+        sales_rollups.sync(refresh_on_event('transactions', 'transactions', db_manager.load_transactions))
+        # Ambil dari rollup harian (ratusan baris, bukan seluruh ledger)
+        total_revenue = sales_rollups.total_revenue()
+        today_revenue = sales_rollups.revenue_on(datetime.now().date())
+
+        # 2. Tampilkan Metric (Sekarang namanya sudah SAMA: total_revenue)
+        # Kita pakai format f-string biar tidak perlu fungsi format_rupiah eksternal
+        st.metric("TOTAL OMZET", f"Rp {total_revenue:,.0f}")
+        st.metric("OMZET HARI INI", f"Rp {today_revenue:,.0f}")
+    live_metrics()
     
-    # Tombol Refresh Manual (Berguna kalau habis update di Excel)
-    if st.button("🔄 Refresh Data"):
+    # Order yang belum berhasil dikirim ke Google Sheets
+    pending_orders = db_manager.pending_count()
+    if pending_orders:
+        st.warning(f"⏳ {pending_orders} order menunggu sinkronisasi")
+        if st.button("📤 Kirim Ulang"):
+            db_manager.flush_pending()
+            st.rerun()
+
+    # Fragment live cuma nangkep baris baru & event dari app ini. Edit manual di Sheets/Excel
+    # (menu diubah, baris ledger ditimpa) gak kelihatan -> tombol ini baca ulang semuanya
+    if st.button("🔄 Reload Penuh", help="Baca ulang menu & seluruh ledger setelah data diedit di luar app"):
+        db_manager.invalidate_transactions(full=True)
+        db_manager.publish('menu') # Session lain ikut baca ulang menu
         st.rerun()
 
     # [FITUR BARU 2] DOWNLOAD PDF
     st.markdown("### 📄 LAPORAN")
-    if st.button("🖨️ Download Laporan PDF"):
-        try:
-            # Panggil fungsi dari utils.py (Pastikan utils.py sudah diupdate)
-            pdf_bytes = generate_pdf_download_link(st.session_state.transactions)
-            b64 = base64.b64encode(pdf_bytes).decode()
-            href = f'<a href="data:application/octet-stream;base64,{b64}" download="Laporan_Farikhi_OS.pdf" style="background:#00E5FF; color:black; padding:5px 10px; border-radius:5px; text-decoration:none; font-weight:bold; display:block; text-align:center;">📥 KLIK UNTUK DOWNLOAD</a>'
-            st.markdown(href, unsafe_allow_html=True)
-        except Exception as e:
-            st.error(f"Gagal generate PDF: {e}")
+    
+    @st.fragment(run_every=LIVE_REFRESH_SECONDS)
+    def report_panel():
+        daily = sales_rollups.table('daily')
+        if daily.empty:
+            st.caption("Belum ada transaksi.")
+            return
+        first_day, last_day = daily.index.min().date(), daily.index.max().date()
+        period = st.date_input("PERIODE", value=(max(first_day, last_day - timedelta(days=29)), last_day),
+                               min_value=first_day, max_value=last_day, key="report_period")
+        if len(period) != 2: return # User baru milih tanggal awal
+        
+        if st.button("🖨️ Siapkan Laporan PDF"):
+            st.session_state.report_job = (tuple(period), get_report_engine().request(sales_rollups, *period))
+        # Job disimpan bareng periodenya; periode diganti -> PDF lama gak ditawarkan lagi
+        job_period, job = st.session_state.get('report_job', (None, None))
+        if job is None: return
+        if job_period != tuple(period):
+            del st.session_state.report_job
+            return
+        if not job.done():
+            st.caption("⏳ Menyusun PDF di background...")
+        elif job.exception():
+            st.error(f"Gagal generate PDF: {job.exception()}")
+        else:
+            st.download_button("📥 KLIK UNTUK DOWNLOAD", data=job.result(), file_name=f"Laporan_Farikhi_OS_{period[0]:%Y%m%d}-{period[1]:%Y%m%d}.pdf",
+                               mime="application/pdf", use_container_width=True)
+    report_panel()
 
     # SYSTEM STATUS
     st.markdown("### 🛠️ SYSTEM STATUS")
+    # Angka beneran (bukan bar random): ukuran ledger di memori + hasil warm-up
     cols = st.columns(2)
-    cols[0].markdown("**CPU**")
-    cols[0].progress(random.randint(40, 80))
-    cols[1].markdown("**RAM**")
-    cols[1].progress(random.randint(60, 90))
+    cols[0].metric("LEDGER", f"{len(st.session_state.transactions):,} baris")
+    cols[1].metric("PENDING", db_manager.pending_count())
+    with st.expander("🚦 READINESS"):
+        warmup_report = st.session_state.get('warmup_report', [])
+        st.caption(f"Warm-up login: {max([r['Seconds'] for r in warmup_report], default=0):.2f}s (paralel)")
+        st.dataframe(pd.DataFrame(warmup_report), hide_index=True, use_container_width=True)
+    with st.expander("🔌 SHARED CONNECTIONS"):
+        st.dataframe(pd.DataFrame(get_resource_registry().status()), hide_index=True, use_container_width=True)
     
     st.markdown("---")
     if st.button("🛑 EMERGENCY SHUTDOWN"):
@@ -693,7 +3351,7 @@ with st.sidebar:
 # --- HEADER MARQUEE (DENGAN STATUS SURGE) ---
 # Warna teks berubah jadi PINK jika Surge Pricing aktif
 header_color = "#FF00CC" if surge_active else "#00E5FF"
-status_text = "⚡ SYSTEM ALERT: SURGE PRICING ACTIVE (+20%)" if surge_active else "🟢 SYSTEM OPTIMAL /// ML MODELS RETRAINED"
+status_text = f"⚡ SYSTEM ALERT: SURGE PRICING ACTIVE (+{(price_multiplier - 1) * 100:.0f}%)" if surge_active else "🟢 SYSTEM OPTIMAL /// ML MODELS RETRAINED"
 
 st.markdown(f"""
 <div style="background:black; border-bottom:1px solid {header_color}; color:{header_color}; font-family:'Share Tech Mono'; padding:5px; white-space:nowrap; overflow:hidden;">
@@ -720,12 +3378,10 @@ tabs = st.tabs([
 with tabs[5]:
     st.markdown("### 💬 S.A.R.A INTELLIGENCE (POWERED BY GEMINI)")
     
-    # 1. Konfigurasi API
-    try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-    except:
-        st.error("API Key belum disetting! Masukkan GEMINI_API_KEY di secrets.")
-        st.stop()
+    # 1. Konfigurasi API (model Gemini dideteksi sekali di resource registry)
+    gemini_api_key = st.secrets.get("GEMINI_API_KEY")
+    if not gemini_api_key:
+        st.warning("GEMINI_API_KEY belum disetting di secrets -> S.A.R.A jalan pakai stub offline.")
 
     col_chat, col_info = st.columns([3, 1])
     
@@ -745,47 +3401,14 @@ with tabs[5]:
             st.session_state.chat_history.append({"role":"user", "content":user_query})
             st.chat_message("user").write(user_query)
             
-            with st.spinner("S.A.R.A is connecting to brain..."):
-                try:
-                    # --- FITUR AUTO-DETECT MODEL (Supaya gak Error 404 lagi) ---
-                    # Kita cari model yang support 'generateContent'
-                    active_model_name = None
-                    for m in genai.list_models():
-                        if 'generateContent' in m.supported_generation_methods:
-                            active_model_name = m.name
-                            break # Ambil yang pertama ketemu (biasanya gemini-pro atau gemini-1.5-flash)
-                    
-                    if not active_model_name:
-                        raise Exception("Tidak ada model AI yang aktif di akun ini.")
-                    
-                    # -----------------------------------------------------------
-
-                    # Siapkan Data
-                    menu_text = st.session_state.menu_db[['Menu', 'Harga', 'Stok']].to_string(index=False)
-                    df_tx = st.session_state.transactions
-                    total_rev = df_tx['Total'].sum() if not df_tx.empty else 0
-                    today_rev = df_tx[df_tx['Date'].dt.date == CURRENT_DATE.date()]['Total'].sum() if not df_tx.empty else 0
-                    
-                    # System Prompt
-                    system_prompt = f"""
-                    Kamu adalah S.A.R.A, asisten AI untuk 'Farikhi OS'.
-                    Gunakan data ini untuk menjawab user:
-                    [KEUANGAN] Total Omzet: Rp {total_rev:,.0f} | Hari ini: Rp {today_rev:,.0f}
-                    [MENU]
-                    {menu_text}
-                    """
-
-                    # Generate Jawaban
-                    model = genai.GenerativeModel(active_model_name)
-                    response = model.generate_content([system_prompt, user_query])
-                    ai_reply = response.text
-                    
-                except Exception as e:
-                    ai_reply = f"⚠️ Maaf, ada gangguan sinyal ke otak AI: {e}"
-
-            # Tampilkan Jawaban
+            # Prompt pendek (disusun ulang cuma kalau ledger berubah); angka detail diambil lewat function call
+            # "Hari ini" = tanggal beneran, sama kayak sidebar (bukan tanggal demo yang di-hardcode)
+            chat_today = datetime.now().date()
+            system_prompt = get_chat_context_cache().get(sales_rollups, chat_today)
+            tools = AnalyticsTools(sales_rollups, st.session_state.menu_db, chat_today, st.session_state.ds_core)
+            # Jawaban ditampilkan sambil jalan (streaming), bukan nunggu selesai
+            ai_reply = st.chat_message("assistant").write_stream(stream_chat_reply(gemini_api_key, system_prompt, user_query, tools))
             st.session_state.chat_history.append({"role":"assistant", "content":ai_reply})
-            st.chat_message("assistant").write(ai_reply)
 # ==========================================
 # TAB 7: PUBLIC WEBSITE (NEW)
 # ==========================================
@@ -800,12 +3423,21 @@ with tabs[6]:
     
     # Showcase Menu
     cols = st.columns(4)
-    for i, r in st.session_state.menu_db.head(4).iterrows():
+    for i, (_, r) in enumerate(st.session_state.menu_db.head(4).iterrows()):
         cols[i].markdown(f"<div style='background:#111; padding:10px; border-radius:10px; text-align:center;'><h2>{r['Icon']}</h2><b>{r['Menu']}</b><br>{format_rupiah(r['Harga'])}</div>", unsafe_allow_html=True)
 # ==========================================
 # MODULE 1: POS TERMINAL
 # ==========================================
 with tabs[0]:
+    # Konfirmasi checkout dari run sebelumnya
+    if checkout_notice := st.session_state.pop('checkout_notice', None):
+        pushed, message = checkout_notice
+        if pushed:
+            st.toast(message, icon="✅")
+            st.balloons()
+        else: # Order cuma masuk buffer lokal -> jangan dirayakan kayak transaksi sukses
+            st.toast(message, icon="⚠️")
+            st.warning(message)
     col_pos_left, col_pos_right = st.columns([2, 1])
     
     with col_pos_left:
@@ -822,13 +3454,14 @@ with tabs[0]:
         
         grid = st.columns(3)
         for i, (idx, row) in enumerate(df_display.iterrows()):
+            price_now = unit_price(row['ID'], row['Harga'])
             with grid[i % 3]:
                 with st.container():
                     st.markdown(f"""
                     <div style="background:#111; border:1px solid #333; border-radius:5px; padding:10px; text-align:center; margin-bottom:10px;">
                         <div style="font-size:30px;">{row['Icon']}</div>
                         <div style="font-weight:bold; height:40px; display:flex; align-items:center; justify-content:center;">{row['Menu']}</div>
-                        <div style="color:#00E5FF;">{int(row['Harga']/1000)}K</div>
+                        <div style="color:{'#FF00CC' if price_now > row['Harga'] else '#00E5FF'};">{'⚡' if price_now > row['Harga'] else ''}{price_now/1000:g}K</div>
                         <div style="font-size:10px; color:{'red' if row['Stok']<10 else 'green'}">STOCK: {row['Stok']}</div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -846,12 +3479,14 @@ with tabs[0]:
         else:
             cart_df = pd.DataFrame(st.session_state.cart)
             cart_grouped = cart_df.groupby(['ID', 'Menu', 'Harga']).size().reset_index(name='Qty')
+            # Harga jual dari tabel surge yang sama dengan grid -> subtotal & transaksi tersimpan ikut harga ini
+            cart_grouped['Harga'] = [unit_price(i, p) for i, p in zip(cart_grouped['ID'], cart_grouped['Harga'])]
             
             for index, row in cart_grouped.iterrows():
                 c1, c2, c3 = st.columns([3,1,1])
                 c1.write(f"{row['Menu']}")
                 c2.write(f"x{row['Qty']}")
-                c3.write(f"{int(row['Harga']*row['Qty']/1000)}K")
+                c3.write(f"{row['Harga']*row['Qty']/1000:g}K")
             
             st.divider()
             total = (cart_grouped['Harga'] * cart_grouped['Qty']).sum()
@@ -868,72 +3503,61 @@ with tabs[0]:
             
             # Checkout Options
             pay_method = st.radio("PAYMENT", ["CASH", "QRIS", "DEBIT"], horizontal=True)
+            # Key widget ganti tiap order biar input pelanggan kosong lagi setelah checkout
+            customer_id = normalize_customer_key(st.text_input("CUSTOMER ID / NO. HP (OPSIONAL)", key=f"pos_customer_{st.session_state.get('order_seq', 0)}"))
             table_select = st.selectbox("TABLE NO", ["TAKEAWAY"] + [f"T{t['id']}" for t in st.session_state.tables])
             
             if st.button("CONFIRM PAYMENT", type="primary", use_container_width=True):
                 # 1. Update Inventory & Save Transaction to DB
+                order_tx = []
+                stock_updates = {}
                 for _, item in cart_grouped.iterrows():
-                    # Update di Session State (Visual)
-                    idx = st.session_state.menu_db.index[st.session_state.menu_db['ID'] == item['ID']].tolist()[0]
-                    current_stock = st.session_state.menu_db.at[idx, 'Stok'] - item['Qty']
-                    st.session_state.menu_db.at[idx, 'Stok'] = current_stock
-                    
-                    # Update di SQLite (Persistent)
-                    db_manager.update_stock(item['ID'], int(current_stock))
-                    
-                    # Prepare Data Transaksi
-                    new_tx = {
-                        'Date': datetime.now(),
-                        'ItemID': item['ID'],
-                        'ItemName': item['Menu'],
-                        'Category': 'Unknown', 
-                        'Price': item['Harga'],
-                        'Qty': item['Qty'],
-                        'Total': item['Harga'] * item['Qty'],
-                        'Hour': datetime.now().hour,
-                        'CustomerType': 'Walk-in',
-                        'Payment': pay_method
-                    }
+                    # Update di Session State (Visual) - menu_db di-index pakai ID
+                    current_stock = st.session_state.menu_db.at[item['ID'], 'Stok'] - item['Qty']
+                    st.session_state.menu_db.at[item['ID'], 'Stok'] = current_stock
                     
-                    # Simpan ke SQLite
-                    db_manager.save_transaction(new_tx)
+                    # Stok dikumpulin dulu, dikirim sekali di akhir
+                    stock_updates[item['ID']] = int(current_stock)
                     
-                    # Tambahkan ke Session State (agar grafik langsung update tanpa reload DB)
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, pd.DataFrame([new_tx])], ignore_index=True)
-
-                # ... (Logika kirim ke Kitchen & Table Status biarkan sama) ...
-                    
-                    # 2. Add to Transactions
-                    new_tx = {
+                    # Prepare Data Transaksi (satu baris per item yang terjual)
+                    order_tx.append({
                         'Date': datetime.now(),
                         'ItemID': item['ID'],
                         'ItemName': item['Menu'],
-                        'Category': 'Unknown', # Simplify for demo
+                        'Category': st.session_state.menu_db.at[item['ID'], 'Kategori'],
                         'Price': item['Harga'],
                         'Qty': item['Qty'],
                         'Total': item['Harga'] * item['Qty'],
                         'Hour': datetime.now().hour,
-                        'CustomerType': 'Walk-in',
-                        'Payment': pay_method
-                    }
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, pd.DataFrame([new_tx])], ignore_index=True)
+                        'CustomerType': 'Member' if customer_id else 'Walk-in',
+                        'Payment': pay_method,
+                        'CustomerID': customer_id,
+                        'BasePrice': int(st.session_state.menu_db.at[item['ID'], 'Harga'])
+                    })
+
+                # Commit satu order sekaligus (gagal = masuk buffer lokal, dikirim ulang nanti)
+                pushed = db_manager.checkout(order_tx, stock_updates)
+                if pushed:
+                    # Baris order sudah di buffer ledger -> grafik & RFM langsung update tanpa reload DB
+                    st.session_state.transactions = db_manager.load_transactions()
+                    sales_rollups.sync(st.session_state.transactions)
+                    if customer_id: get_customer_rfm().sync(st.session_state.transactions)
 
                 # 3. Send to Kitchen
-                items_for_kitchen = cart_grouped[['Menu', 'Qty']].to_dict('records')
-                add_to_kitchen(items_for_kitchen, table_select)
+                cart_grouped['Station'] = [kitchen_station(st.session_state.menu_db.at[i, 'Kategori']) for i in cart_grouped['ID']]
+                items_for_kitchen = cart_grouped[['Menu', 'Qty', 'Station']].to_dict('records')
+                kitchen_order = add_to_kitchen(items_for_kitchen, table_select)
                 
-                # 4. Update Table Status
+                # 4. Update Table Status (order nempel ke meja -> dipakai buat hitung turnover)
                 if table_select != "TAKEAWAY":
-                    t_id = int(table_select[1:])
-                    # Update DB
-                    db_manager.update_table_status(t_id, 'Occupied')
-                    # Update Visual
-                    st.session_state.tables[t_id-1]['status'] = 'Occupied'
+                    db_manager.seat_table(int(table_select[1:]), kitchen_order['id'])
                 
                 st.session_state.cart = []
-                st.balloons()
-                st.success("TRANSACTION COMPLETE")
-                time.sleep(1)
+                st.session_state.order_seq = st.session_state.get('order_seq', 0) + 1
+                # Konfirmasi muncul di run berikutnya (toast), gak pakai nunggu sleep dulu
+                order_total = format_rupiah(sum(tx['Total'] for tx in order_tx))
+                st.session_state.checkout_notice = (pushed, f"TRANSACTION COMPLETE | {order_total}" if pushed else
+                    f"ORDER {order_total} DIANTRIKAN: Google Sheets tidak merespon. Transaksi aman di buffer lokal & akan dikirim ulang otomatis.")
                 st.rerun()
 
         st.markdown('</div>', unsafe_allow_html=True)
@@ -941,15 +3565,27 @@ with tabs[0]:
 # ==========================================
 # MODULE 2: KITCHEN DISPLAY SYSTEM (KDS)
 # ==========================================
-with tabs[1]:
-    st.markdown("## 🍳 KITCHEN QUEUE MANAGEMENT")
+def serve_kitchen_order(order_id):
+    if db_manager.advance_kitchen_order(order_id) == 'Completed':
+        st.toast(f"Order {order_id} Served!", icon="🍽️")
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def kitchen_board():
+    # Antrian dibaca dari memori bersama; order baru / status baru langsung muncul di semua layar dapur.
+    # Tiket dari proses server lain ketahuan lewat file penanda 'kitchen' -> antrian dibaca ulang (lihat _kitchen)
+    # Throughput dapur: antrian per station + lama tiket (dibuat -> siap saji)
+    kitchen_stats = db_manager.kitchen_metrics()
+    if not kitchen_stats.empty:
+        st.dataframe(kitchen_stats, hide_index=True, use_container_width=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ['P50 (min)', 'P90 (min)', 'P95 (min)']})
     
-    if not st.session_state.kitchen_queue:
+    kitchen_queue = db_manager.get_kitchen_queue()
+    if not kitchen_queue:
         st.info("NO ACTIVE ORDERS. KITCHEN IS IDLE.")
     else:
         # Display orders in a grid
         k_cols = st.columns(4)
-        for i, order in enumerate(st.session_state.kitchen_queue):
+        for i, order in enumerate(kitchen_queue):
             with k_cols[i % 4]:
                 bg_color = "#331100" if order['status'] == 'Pending' else "#003300"
                 border_color = "#FF0000" if order['status'] == 'Pending' else "#00FF00"
@@ -958,7 +3594,7 @@ with tabs[1]:
                     st.markdown(f"""
                     <div style="background:{bg_color}; border:2px solid {border_color}; padding:10px; border-radius:5px; margin-bottom:10px;">
                         <h4 style="margin:0;">TABLE: {order['table']}</h4>
-                        <p style="font-size:12px; color:#aaa;">ID: {order['id']} | {order['time']}</p>
+                        <p style="font-size:12px; color:#aaa;">ID: {order['id']} | {order['time']} | {' / '.join(order.get('stations', []))}</p>
                         <hr style="border-color:#555;">
                         <ul style="padding-left:20px; margin:0;">
                             {"".join([f"<li>{x['Menu']} (x{x['Qty']})</li>" for x in order['items']])}
@@ -966,50 +3602,73 @@ with tabs[1]:
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    # Callback jalan sebelum fragment digambar ulang -> gak perlu st.rerun()
                     if order['status'] == 'Pending':
-                        if st.button("START COOKING", key=f"cook_{order['id']}"):
-                            # Update DB
-                            db_manager.update_kitchen_status(order['id'], 'Cooking')
-                            # Update Visual
-                            order['status'] = 'Cooking'
-                            st.rerun()
+                        # Pending -> Cooking (timestamp mulai masak dicatat)
+                        st.button("START COOKING", key=f"cook_{order['id']}", on_click=db_manager.advance_kitchen_order, args=(order['id'],))
                             
                     elif order['status'] == 'Cooking':
-                        if st.button("READY TO SERVE", key=f"serve_{order['id']}"):
-                            # Update DB (Hapus/Complete)
-                            db_manager.update_kitchen_status(order['id'], 'Completed')
-                            # Update Visual
-                            st.session_state.kitchen_queue.pop(i)
-                            st.toast(f"Order {order['id']} Served!", icon="🍽️")
-                            st.rerun()
+                        # Cooking -> Completed (keluar dari antrian, masuk statistik)
+                        st.button("READY TO SERVE", key=f"serve_{order['id']}", on_click=serve_kitchen_order, args=(order['id'],))
+
+with tabs[1]:
+    st.markdown("## 🍳 KITCHEN QUEUE MANAGEMENT")
+    
+    kitchen_board()
 
 # ==========================================
 # MODULE 3: TABLE MANAGEMENT
 # ==========================================
-with tabs[2]:
-    st.markdown("## 🪑 FLOOR PLAN MANAGER")
-    
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def floor_plan():
+    # Status meja dibaca ulang cuma kalau ada event 'tables'
+    tables = refresh_on_event('tables', 'tables', db_manager.get_tables)
     t_cols = st.columns(4)
-    for i, table in enumerate(st.session_state.tables):
+    for i, table in enumerate(tables):
         with t_cols[i % 4]:
             status_color = "#00FF00" if table['status'] == 'Empty' else "#FF0000"
             status_icon = "🟢" if table['status'] == 'Empty' else "🔴"
+            # Lama duduk & jumlah order yang nempel ke meja ini
+            seated = ""
+            if table['status'] == 'Occupied' and table.get('occupied_at'):
+                minutes = int((datetime.now() - datetime.fromisoformat(table['occupied_at'])).total_seconds() // 60)
+                seated = f"<p style='font-size:12px; color:#aaa;'>{minutes} MIN | {len(table.get('orders', []))} ORDER</p>"
             
             st.markdown(f"""
             <div class="titan-card" style="text-align:center; border-left-color:{status_color};">
                 <h3>TABLE {table['id']}</h3>
                 <div style="font-size:40px;">🪑</div>
                 <p style="color:{status_color}; font-weight:bold;">{status_icon} {table['status']}</p>
+                {seated}
             </div>
             """, unsafe_allow_html=True)
             
             if table['status'] == 'Occupied':
-                if st.button(f"CLEAR TABLE {table['id']}", key=f"clr_{table['id']}"):
-                    # Update DB
-                    db_manager.update_table_status(table['id'], 'Empty')
-                    # Update Visual
-                    table['status'] = 'Empty'
-                    st.rerun()
+                # Update DB (event 'tables' -> semua layar denah ikut update)
+                st.button(f"CLEAR TABLE {table['id']}", key=f"clr_{table['id']}",
+                          on_click=db_manager.clear_table, args=(table['id'],))
+
+with tabs[2]:
+    st.markdown("## 🪑 FLOOR PLAN MANAGER")
+    
+    floor_plan()
+    
+    # --- TURNOVER: DAPUR ATAU FLOOR YANG JADI BOTTLENECK? ---
+    with st.expander("📊 TABLE TURNOVER & UTILIZATION"):
+        turns = db_manager.table_turnover()
+        if turns.empty:
+            st.info("Belum ada meja yang selesai dipakai.")
+        else:
+            tc1, tc2, tc3, tc4 = st.columns(4)
+            tc1.metric("TABLE TURNS", len(turns))
+            tc2.metric("TURN TIME P50", f"{turns['Turn (min)'].median():.0f} min")
+            tc3.metric("WAIT FOOD P50", f"{turns['Wait Food (min)'].median():.0f} min" if turns['Wait Food (min)'].notna().any() else "-")
+            tc4.metric("DINING P50", f"{turns['Dining (min)'].median():.0f} min" if turns['Dining (min)'].notna().any() else "-")
+            st.caption("Wait Food = duduk -> order terakhir selesai di dapur. Kalau porsinya gede, bottleneck di dapur; kalau Dining yang gede, di floor.")
+        utilization = db_manager.table_utilization()
+        fig_util = px.bar(utilization, x='Hour', y='Utilization', template="plotly_dark", title="SEAT UTILIZATION BY HOUR")
+        fig_util.update_layout(paper_bgcolor='rgba(0,0,0,0)', yaxis_tickformat='.0%')
+        st.plotly_chart(fig_util, use_container_width=True)
 
 # ==========================================
 # MODULE 4: DATA SCIENCE HQ (THE BIG ONE)
@@ -1018,56 +3677,79 @@ with tabs[3]:
     st.markdown("## 🤖 ARTIFICIAL INTELLIGENCE CORE")
     st.caption("POWERED BY SCIKIT-LEARN & PLOTLY")
     
+    # --- GENERATOR DATA SINTETIS (BUAT LOAD TEST DASHBOARD) ---
+    with st.expander("🧪 SYNTHETIC DATA GENERATOR (LOAD TEST)"):
+        g1, g2, g3 = st.columns(3)
+        gen_days = g1.number_input("DAYS", 30, 3650, 365, step=30)
+        gen_outlets = g2.number_input("OUTLETS", 1, 1000, 1)
+        gen_fmt = g3.selectbox("FORMAT", ["parquet", "csv"])
+        b1, b2 = st.columns(2)
+        if b1.button("⏱️ BENCHMARK VS LOOP LAMA"):
+            bench = st.session_state.ds_core.benchmark_generators(days=int(gen_days))
+            st.write(f"Loop lama: {bench['legacy_rows']:,} baris dalam {bench['legacy_s']:.3f}s | "
+                     f"Vectorized: {bench['vectorized_rows']:,} baris dalam {bench['vectorized_s']:.3f}s | "
+                     f"**{bench['speedup']:.0f}x lebih cepat**")
+        if b2.button("💾 GENERATE FILE"):
+            out_path = f"synthetic_{int(gen_outlets)}x{int(gen_days)}d.{gen_fmt}"
+            with st.spinner(f"Streaming ke {out_path}..."):
+                try:
+                    n_rows = st.session_state.ds_core.stream_historical_data(out_path, days=int(gen_days), outlets=int(gen_outlets), seed=42)
+                    st.success(f"{n_rows:,} baris ditulis ke {out_path}")
+                except ImportError as e:
+                    st.error(str(e))
+
     # Check if we have enough data
     df = st.session_state.transactions
     if len(df) < 50:
         st.warning("INSUFFICIENT DATA FOR ML MODELS. GENERATING MORE...")
     else:
         # --- SUB TAB FOR ML ---
-        ml_tabs = st.tabs(["🔮 SALES FORECASTING", "👥 CUSTOMER CLUSTERING", "📈 TREND ANALYSIS"])
+        ml_tabs = st.tabs(["🔮 SALES FORECASTING", "👥 CUSTOMER CLUSTERING", "📈 TREND ANALYSIS", "🔥 DEMAND HEATMAP", "🎲 MONTE CARLO RISK", "💰 PRICE OPTIMIZER"])
         
         # 1. SALES FORECASTING
         with ml_tabs[0]:
             st.markdown('<div class="titan-card">', unsafe_allow_html=True)
             st.subheader("REVENUE PREDICTION (RANDOM FOREST)")
             
-            # Train Model
-            model, daily_data = st.session_state.ds_core.train_sales_forecast_model(df)
+            # Ambil model dari registry (training ulang di background kalau ada hari baru)
+            ds = st.session_state.ds_core
+            registry = get_model_registry()
+            daily_totals = sales_rollups.daily_totals()
+            forecast_pkg = registry.get_or_train('sales_forecast', daily_totals, ds.train_sales_forecast_model, schema=FORECAST_SCHEMA)
+            model, metrics = forecast_pkg['model'], forecast_pkg['meta']
+            daily_data = ds.build_daily_sales(daily_totals)
+            st.caption(f"MODEL v{forecast_pkg['version']} | TRAINED {forecast_pkg['trained_at']} | DATA s/d {forecast_pkg['fingerprint']['max_date']}"
+                       + (" | ⏳ RETRAINING..." if registry.is_training('sales_forecast') else ""))
             
-            # Predict Next 7 Days
-            last_date = daily_data['Date'].max()
-            future_dates = [last_date + timedelta(days=x) for x in range(1, 8)]
-            future_df = pd.DataFrame({'Date': future_dates})
-            future_df['DayOfWeek'] = future_df['Date'].dt.dayofweek
-            future_df['DayOfMonth'] = future_df['Date'].dt.day
-            future_df['Month'] = future_df['Date'].dt.month
-            future_df['IsWeekend'] = future_df['DayOfWeek'].apply(lambda x: 1 if x >= 5 else 0)
-            
-            # Note: For lag/rolling features in real production, we'd append and shift. 
-            # For this simplified demo, we use the mean of the last 7 days as a proxy for rolling features
-            recent_avg = daily_data['Total'].tail(7).mean()
-            future_df['Lag_1'] = recent_avg
-            future_df['Rolling_Mean'] = recent_avg
-            
-            features = ['DayOfWeek', 'DayOfMonth', 'Month', 'IsWeekend', 'Lag_1', 'Rolling_Mean']
-            predictions = model.predict(future_df[features])
-            future_df['Predicted_Sales'] = predictions
+            # Predict N hari ke depan (rekursif: prediksi hari ini jadi Lag_1 hari besok)
+            horizon = st.select_slider("FORECAST HORIZON (DAYS)", options=[7, 14, 30, 60, 90], value=7)
+            future_df = ds.forecast_sales(model, daily_data, metrics, horizon)
             
             # Visualization
             fig = go.Figure()
             # Historical
             fig.add_trace(go.Scatter(x=daily_data['Date'], y=daily_data['Total'], mode='lines', name='Historical', line=dict(color='#00E5FF')))
+            # Interval 80%
+            fig.add_trace(go.Scatter(x=future_df['Date'], y=future_df['Upper'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=future_df['Date'], y=future_df['Lower'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(255,0,204,0.15)', name='80% Interval'))
             # Forecast
             fig.add_trace(go.Scatter(x=future_df['Date'], y=future_df['Predicted_Sales'], mode='lines+markers', name='Forecast', line=dict(color='#FF00CC', dash='dash')))
             
             fig.update_layout(title="Sales Trajectory & AI Forecast", template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
             st.plotly_chart(fig, use_container_width=True)
             
-            c1, c2, c3 = st.columns(3)
+            c1, c2, c3, c4 = st.columns(4)
             predicted_total = future_df['Predicted_Sales'].sum()
-            c1.metric("PREDICTED REVENUE (7 DAYS)", format_rupiah(predicted_total))
-            c2.metric("MODEL ACCURACY (R2)", "89.4%")
-            c3.metric("GROWTH TREND", "POSITIVE ↗")
+            c1.metric(f"PREDICTED REVENUE ({horizon} DAYS)", format_rupiah(predicted_total),
+                      help=f"80% interval: {format_rupiah(future_df['Lower'].sum())} - {format_rupiah(future_df['Upper'].sum())}")
+            c2.metric("BACKTEST MAE / DAY", format_rupiah(metrics['mae']) if metrics.get('test_days') else "N/A")
+            c3.metric("BACKTEST R2", f"{metrics['r2']*100:.1f}%" if metrics.get('test_days') else "N/A",
+                      help=f"Walk-forward, {metrics.get('test_days', 0)} hari uji, prediksi rekursif {metrics.get('horizon', 7)} hari")
+            
+            # Trend: rata-rata prediksi vs rata-rata periode yang sama sebelumnya
+            recent_avg = daily_data['Total'].tail(horizon).mean()
+            growth = (future_df['Predicted_Sales'].mean() / recent_avg - 1) if recent_avg else 0
+            c4.metric("GROWTH TREND", f"{growth*100:+.1f}%", "POSITIVE ↗" if growth >= 0 else "NEGATIVE ↘")
             st.markdown('</div>', unsafe_allow_html=True)
 
         # 2. CUSTOMER CLUSTERING
@@ -1076,19 +3758,21 @@ with tabs[3]:
             st.subheader("RFM SEGMENTATION (K-MEANS CLUSTERING)")
             
             rfm_data = st.session_state.ds_core.perform_customer_segmentation(df)
-            
-            # Scatter Plot
-            fig_cluster = px.scatter(
-                rfm_data, x='Recency', y='Monetary', color='Segment', size='Frequency',
-                color_discrete_map={'Bronze (Casual)': 'gray', 'Silver (Loyal)': 'cyan', 'Gold (Whales)': 'gold'},
-                title="Customer Segments (Recency vs Monetary)",
-                template="plotly_dark"
-            )
-            fig_cluster.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-            st.plotly_chart(fig_cluster, use_container_width=True)
-            
-            # Data Grid
-            st.dataframe(rfm_data.sort_values('Monetary', ascending=False).head(10), use_container_width=True)
+            if rfm_data is None:
+                st.info("BELUM CUKUP DATA PELANGGAN. Isi CUSTOMER ID / NO. HP di POS supaya transaksi tercatat per pelanggan.")
+            else:
+                # Scatter Plot
+                fig_cluster = px.scatter(
+                    rfm_data, x='Recency', y='Monetary', color='Segment', size='Frequency',
+                    color_discrete_map={'Bronze (Casual)': 'gray', 'Silver (Loyal)': 'cyan', 'Gold (Whales)': 'gold'},
+                    title="Customer Segments (Recency vs Monetary)",
+                    template="plotly_dark"
+                )
+                fig_cluster.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig_cluster, use_container_width=True)
+                
+                # Data Grid
+                st.dataframe(rfm_data.sort_values('Monetary', ascending=False).head(10), use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
             
         # 3. TREND ANALYSIS
@@ -1096,10 +3780,123 @@ with tabs[3]:
             st.markdown('<div class="titan-card">', unsafe_allow_html=True)
             st.subheader("HOURLY HEATMAP")
             
-            hourly_sales = df.groupby('Hour')['Total'].sum().reset_index()
+            hourly_sales = sales_rollups.table('hourly').reset_index()
             fig_bar = px.bar(hourly_sales, x='Hour', y='Total', color='Total', color_continuous_scale='Viridis', template="plotly_dark")
             fig_bar.update_layout(paper_bgcolor='rgba(0,0,0,0)')
             st.plotly_chart(fig_bar, use_container_width=True)
+            
+            # Kontribusi kategori & menu terlaris (dari rollup juga)
+            r1, r2 = st.columns(2)
+            category_sales = sales_rollups.table('categories').reset_index()
+            r1.plotly_chart(px.pie(category_sales, names='Category', values='Total', hole=0.5, template="plotly_dark"), use_container_width=True)
+            top_items = sales_rollups.table('items').nlargest(10, 'Qty').reset_index()
+            r2.plotly_chart(px.bar(top_items, x='Qty', y='ItemName', orientation='h', template="plotly_dark"), use_container_width=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        # 4. DEMAND HEATMAP (STAFFING & PREP MINGGU DEPAN)
+        with ml_tabs[3]:
+            st.markdown('<div class="titan-card">', unsafe_allow_html=True)
+            st.subheader("DEMAND GRID: HARI x JAM x MENU (RANDOM FOREST)")
+            
+            # Fingerprint dari total harian (murah); model-nya dilatih dari rollup jam x menu
+            demand_pkg = registry.get_or_train('demand_grid', daily_totals,
+                                               lambda _: ds.train_demand_model(sales_rollups.table('daily_hour_items')), schema=DEMAND_SCHEMA)
+            grid = get_demand_grid_cache().get(demand_pkg, ds, daily_data['Date'].max() + timedelta(days=1))
+            st.caption(f"MODEL v{demand_pkg['version']} | {grid['qty'].size:,} sel diprediksi dalam 1 panggilan predict"
+                       + (" | ⏳ RETRAINING..." if registry.is_training('demand_grid') else ""))
+            
+            demand_item = st.selectbox("MENU", ["SEMUA MENU"] + grid['items'], key="demand_item")
+            qty = grid['qty'].sum(axis=2) if demand_item == "SEMUA MENU" else grid['qty'][:, :, grid['items'].index(demand_item)]
+            day_labels = [f"{d:%a %d-%m}" for d in grid['dates']]
+            fig_demand = px.imshow(qty, x=[f"{h:02d}:00" for h in grid['hours']], y=day_labels, color_continuous_scale='Magma',
+                                   text_auto='.0f', aspect='auto', template="plotly_dark", labels=dict(color="Porsi"))
+            fig_demand.update_layout(paper_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_demand, use_container_width=True)
+            
+            # Jam puncak per hari -> dasar jadwal shift; total porsi per menu per hari -> daftar prep
+            peak = qty.argmax(axis=1)
+            st.caption("JAM PUNCAK: " + " | ".join(f"{d} {grid['hours'][p]:02d}:00" for d, p in zip(day_labels, peak)))
+            prep = pd.DataFrame(grid['qty'].sum(axis=1).T.round(1), index=grid['items'], columns=day_labels)
+            st.dataframe(prep.loc[prep.sum(axis=1).sort_values(ascending=False).index], use_container_width=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        # 5. MONTE CARLO RISK (CASHFLOW BULAN DEPAN)
+        with ml_tabs[4]:
+            st.markdown('<div class="titan-card">', unsafe_allow_html=True)
+            st.subheader("MONTE CARLO: RISIKO CASHFLOW (MULTIVERSE)")
+            
+            m1, m2, m3 = st.columns(3)
+            mc_paths = m1.select_slider("JUMLAH SKENARIO", options=MC_PATH_OPTIONS, value=10_000, format_func=lambda n: f"{n:,}")
+            mc_days = m2.select_slider("HORIZON (HARI)", options=[30, 60, 90], value=MC_DAYS)
+            mc_method = m3.radio("SAMPLING", ['bootstrap', 'normal'], horizontal=True,
+                                 format_func=lambda m: "Bootstrap hari asli" if m == 'bootstrap' else "Distribusi normal")
+            m4, m5, m6 = st.columns(3)
+            mc_fixed = m4.number_input("BIAYA TETAP / BULAN (RP)", 0, 10_000_000_000, MC_FIXED_COST, step=1_000_000)
+            mc_variable = m5.slider("HPP (% OMSET)", 0, 90, int(MC_VARIABLE_COST * 100)) / 100
+            mc_seasonal = m6.checkbox("POLA HARIAN & GAJIAN", value=True)
+            
+            with st.spinner(f"Simulasi {mc_paths:,} skenario..."):
+                risk = get_risk_cache().get(ds, daily_totals, daily_data['Date'].max() + timedelta(days=1), days=mc_days, paths=mc_paths,
+                                            method=mc_method, seasonal=mc_seasonal, fixed_cost=mc_fixed, variable_cost=mc_variable)
+            
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("RATA-RATA OMSET", format_rupiah(risk['mean']))
+            k2.metric("SKENARIO TERBURUK (P5)", format_rupiah(risk['p5']), help=f"Rata-rata 5% terburuk: {format_rupiah(risk['es95'])}")
+            k3.metric("VaR 95%", format_rupiah(risk['var95']), help="Selisih ekspektasi vs P5")
+            k4.metric("PELUANG TUTUP BIAYA TETAP", f"{risk['p_cover']*100:.1f}%", help=f"Biaya tetap {mc_days} hari: {format_rupiah(risk['fixed_cost'])} | Break-even omset: {format_rupiah(risk['breakeven'])}")
+            
+            # Histogram sudah di-bin di engine (1 juta titik gak dikirim ke browser)
+            counts, edges = risk['hist']
+            fig_mc = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, marker_color='#9D4EDD', name='Skenario'))
+            for value, color, label in [(risk['p5'], '#FF3131', 'P5'), (risk['mean'], '#00E5FF', 'Mean'), (risk['p95'], '#39FF14', 'P95'), (risk['breakeven'], '#FFD700', 'Break-even')]:
+                fig_mc.add_vline(x=value, line_dash='dot', line_color=color, annotation_text=label)
+            fig_mc.update_layout(title=f"Distribusi Omset {mc_days} Hari ({risk['paths']:,} skenario)", template="plotly_dark",
+                                 paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', bargap=0)
+            st.plotly_chart(fig_mc, use_container_width=True)
+            
+            # Kipas omset kumulatif (P5 / P50 / P95)
+            fig_fan = go.Figure()
+            fig_fan.add_trace(go.Scatter(x=risk['dates'], y=risk['fan'][2], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig_fan.add_trace(go.Scatter(x=risk['dates'], y=risk['fan'][0], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(157,78,221,0.25)', name='P5 - P95'))
+            fig_fan.add_trace(go.Scatter(x=risk['dates'], y=risk['fan'][1], mode='lines', name='Median', line=dict(color='#FF00CC')))
+            fig_fan.update_layout(title="Omset Kumulatif", template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_fan, use_container_width=True)
+            
+            if mc_seasonal: st.caption(f"Faktor gajian (tgl {MC_PAYDAY_DAYS[0]}-{MC_PAYDAY_DAYS[1]}): x{risk['payday_factor']:.2f}")
+            if risk['p_cover'] > 0.9: st.success("KESIMPULAN: Bisnis sangat aman (low risk).")
+            elif risk['p_cover'] > 0.7: st.info("KESIMPULAN: Cukup aman, tapi hati-hati pengeluaran.")
+            else: st.error("KESIMPULAN: BAHAYA! Risiko rugi tinggi, perbaiki strategi marketing.")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        # 6. PRICE OPTIMIZER (ELASTISITAS PER MENU)
+        with ml_tabs[5]:
+            st.markdown('<div class="titan-card">', unsafe_allow_html=True)
+            st.subheader("PRICE OPTIMIZER: HARGA PALING CUAN PER MENU")
+            
+            t0 = time.perf_counter()
+            pricing = get_price_optimizer().get(ds, sales_rollups, st.session_state.menu_db)
+            price_table = pricing['table']
+            st.caption(f"{pricing['profit'].size:,} kombinasi (menu x harga) dievaluasi | {(time.perf_counter() - t0) * 1000:.1f} ms | "
+                       f"elastisitas dari ledger: {int((price_table['Source'] == 'ledger').sum())} menu, sisanya prior {PRICE_PRIOR_ELASTICITY}")
+            
+            p1, p2 = st.columns(2)
+            p1.metric("PROFIT / HARI (HARGA SEKARANG)", format_rupiah(price_table['ProfitNow'].sum()))
+            p2.metric("PROFIT / HARI (HARGA OPTIMAL)", format_rupiah(price_table['ProfitOptimal'].sum()),
+                      delta=format_rupiah(price_table['ProfitOptimal'].sum() - price_table['ProfitNow'].sum()))
+            
+            # Kurva profit satu menu = satu baris dari matrix broadcast (tanpa hitung ulang)
+            price_item = st.selectbox("KURVA PROFIT", price_table['Menu'].tolist(), key="price_item")
+            row = price_table['Menu'].tolist().index(price_item)
+            valid = np.isfinite(pricing['profit'][row])
+            fig_price = px.line(x=pricing['candidates'][row][valid], y=pricing['profit'][row][valid], template="plotly_dark",
+                                labels={'x': 'Harga Jual (Rp)', 'y': 'Estimasi Profit / Hari (Rp)'})
+            fig_price.add_vline(x=price_table['Harga'].iloc[row], line_dash='dot', line_color='#00E5FF', annotation_text='Sekarang')
+            fig_price.add_vline(x=price_table['Optimal'].iloc[row], line_dash='dash', line_color='#FF3131', annotation_text='Optimal')
+            fig_price.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_price, use_container_width=True)
+            
+            st.dataframe(price_table.assign(Change=(price_table['Multiplier'] - 1) * 100).round({'Change': 1, 'Multiplier': 3}),
+                         use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
 # ==========================================
@@ -1107,34 +3904,99 @@ with tabs[3]:
 # ==========================================
 with tabs[4]:
     st.markdown("## 📦 WAREHOUSE CONTROL")
-    edited_df = st.data_editor(st.session_state.menu_db, use_container_width=True, num_rows="dynamic")
+    edited_df = st.data_editor(st.session_state.menu_db.reset_index(drop=True), use_container_width=True, num_rows="dynamic")
     
     if st.button("SAVE CHANGES"):
-        # Update Session State
-        st.session_state.menu_db = edited_df
-        
-        # Update SQLite (Looping update agar aman)
-        conn = db_manager.get_connection()
-        c = conn.cursor()
-        # Hapus data lama dan insert baru (cara paling simpel untuk data editor)
-        c.execute("DELETE FROM menu") 
-        for index, row in edited_df.iterrows():
-            c.execute("INSERT INTO menu VALUES (?, ?, ?, ?, ?, ?)", 
-                    (row['ID'], row['Menu'], row['Harga'], row['Kategori'], row['Icon'], row['Stok']))
-        conn.commit()
-        conn.close()
-        
-        st.success("DATABASE PERMANEN TELAH DI-UPDATE")
+        # Update Database (backend yang aktif: Google Sheets / SQLite)
+        try:
+            # Hapus data lama dan tulis ulang (cara paling simpel untuk data editor)
+            db_manager.save_menu(edited_df)
+            # Update Session State (index ID ikut dibangun ulang)
+            st.session_state.menu_db = db_manager.load_menu()
+            st.success("DATABASE PERMANEN TELAH DI-UPDATE")
+        except Exception as e:
+            st.error(f"Gagal simpan menu: {e}")
+
+    # Bahan baku: level on-hand dipotong lewat matrix resep tiap checkout
+    st.markdown("### 🧂 BAHAN BAKU (RESEP / BOM)")
+    ingredient_levels = db_manager.ingredient_levels()
+    low_stock = ingredient_levels[ingredient_levels['Status'] != 'OK']
+    if not low_stock.empty:
+        st.warning("⚠️ PERLU REORDER: " + ", ".join(f"{r.Ingredient} ({r.OnHand:,.0f} {r.Unit})" for r in low_stock.itertuples()))
+    edited_ingredients = st.data_editor(ingredient_levels, use_container_width=True, num_rows="dynamic", disabled=['Status'], key="ingredient_editor")
+    with st.expander("📜 RESEP PER MENU (QTY BAHAN PER PORSI)"):
+        edited_recipes = st.data_editor(db_manager.recipes(), use_container_width=True, num_rows="dynamic", key="recipe_editor")
+    if st.button("SAVE BAHAN & RESEP"):
+        try:
+            # Cuma sel yang diubah yang menimpa level; sisanya ikut level terkini (sudah kepotong checkout)
+            db_manager.save_ingredients(edited_ingredients, edited_recipes, base=ingredient_levels)
+            st.success("STOK BAHAN & RESEP TERSIMPAN")
+        except Exception as e:
+            st.error(f"Gagal simpan bahan: {e}")
+
+    # Proyeksi pemakaian: grid demand 7 hari ke depan x matrix resep (satu perkalian)
+    demand_pkg = get_model_registry().load('demand_grid')
+    if demand_pkg is None:
+        st.caption("Proyeksi pemakaian bahan muncul setelah model DEMAND HEATMAP dilatih (tab Data Science).")
+    else:
+        demand_grid = get_demand_grid_cache().get(demand_pkg, st.session_state.ds_core, datetime.now())
+        outlook = db_manager.project_ingredients(demand_grid, st.session_state.menu_db)
+        st.caption(f"PROYEKSI {len(demand_grid['dates'])} HARI KE DEPAN (DEMAND MODEL v{demand_pkg['version']})")
+        st.dataframe(outlook.sort_values(['StockoutOn', 'ReorderOn']), use_container_width=True,
+                     column_config={'ReorderOn': st.column_config.DateColumn(format="DD-MM-YYYY"),
+                                    'StockoutOn': st.column_config.DateColumn(format="DD-MM-YYYY")})
+
+    with st.expander("🗄️ BULK EXPORT / IMPORT LEDGER"):
+        ledger = st.session_state.transactions
+        st.caption(f"Arsip harian: {len(get_ledger_archive(db_manager.backend_name).partitions())} partisi di `{LEDGER_ARCHIVE_DIR}/`")
+
+        # A. EXPORT: range tanggal -> file (dipotong per hari / per bulan)
+        if not ledger.empty:
+            e1, e2, e3 = st.columns(3)
+            exp_period = e1.date_input("PERIODE EXPORT", value=(ledger['Date'].min().date(), ledger['Date'].max().date()), key="bulk_export_period")
+            exp_fmt = e2.selectbox("FORMAT", BULK_FORMATS, key="bulk_export_fmt")
+            exp_dialect = e3.selectbox("SKEMA KOLOM", ['ledger', 'legacy'], key="bulk_export_dialect",
+                                       format_func=lambda d: "Date/Hour/Total" if d == 'ledger' else "Tanggal/Jam/Omset/Profit")
+            if len(exp_period) == 2 and st.button("📦 Siapkan File Export"):
+                mask = (ledger['Date'] >= pd.Timestamp(exp_period[0])) & (ledger['Date'] < pd.Timestamp(exp_period[1]) + timedelta(days=1))
+                try:
+                    with st.spinner("Menulis file per potong..."):
+                        st.session_state.bulk_export = (export_ledger(ledger[mask], exp_fmt, exp_dialect), exp_fmt)
+                except ImportError as e:
+                    st.error(str(e))
+            if 'bulk_export' in st.session_state:
+                data, fmt = st.session_state.bulk_export
+                st.download_button(f"📥 DOWNLOAD .{fmt.upper()}", data=data, file_name=f"ledger_export.{fmt}", mime=BULK_MIME[fmt])
+
+        # B. IMPORT: file dibaca per chunk, tiap chunk = satu append ke backend
+        upload = st.file_uploader("IMPORT TRANSAKSI", type=BULK_FORMATS, key="bulk_import_file")
+        if upload is not None and st.button("📤 Import ke Ledger"):
+            try:
+                with st.spinner("Import per chunk..."):
+                    n_rows = db_manager.import_transactions(iter_import_chunks(upload, upload.name.rsplit('.', 1)[-1].lower()))
+                st.session_state.transactions = db_manager.load_transactions()
+                st.success(f"{n_rows:,} baris masuk ke ledger")
+            except (ImportError, ValueError) as e:
+                st.error(str(e))
+            except Exception as e:
+                st.error(f"Import berhenti di tengah jalan: {e}")
 
 with tabs[5]:
     st.markdown("## 👥 CUSTOMER RELATIONSHIP")
     st.info("Module linked to Clustering Engine. Showing top High Value Customers.")
-    # Show dummy high value list
-    st.table(pd.DataFrame({
-        'Name': ['Fauzan', 'Admin', 'User_001', 'User_002'],
-        'Status': ['VIP', 'Admin', 'Member', 'Member'],
-        'Lifetime Value': ['Rp 15.000.000', 'Rp 0', 'Rp 500.000', 'Rp 300.000']
-    }))
+    # Top pelanggan dari tabel RFM (sudah di-sync di tab Data Science / checkout)
+    rfm_store = get_customer_rfm()
+    rfm_store.sync(st.session_state.transactions)
+    top_customers = rfm_store.table.sort_values('Monetary', ascending=False).head(10)
+    if top_customers.empty:
+        st.caption("Belum ada transaksi dengan Customer ID.")
+    else:
+        st.table(pd.DataFrame({
+            'Customer': top_customers.index,
+            'Orders': top_customers['Frequency'].values,
+            'Last Visit': top_customers['LastPurchase'].dt.strftime('%d-%m-%Y').values,
+            'Lifetime Value': [format_rupiah(v) for v in top_customers['Monetary']]
+        }))
 
 # ... (codingan module 5 dan lain-lain di atas) ...
 
@@ -1154,6 +4016,9 @@ with st.sidebar:
     # Checkbox rahasia buat buka data
     if st.checkbox("Show Raw Database"):
         conn = db_manager.get_connection()
+        if conn is None:
+            st.info("Inspector SQL cuma tersedia di backend SQLite. Set `[storage] backend = \"sqlite\"` di Secrets.")
+            st.stop()
         
         st.write("📂 **TABEL MENU (LIVE DB):**")
         try: